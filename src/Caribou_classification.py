@@ -73,7 +73,10 @@ def bacteria_classification(opt):
         taxa = lst_taxas,
         batch_size = opt['batch_size'],
         training_epochs = opt['training_epochs'],
-        scaling = scaling
+        scaling = scaling,
+        hierarchical = opt['hierarchical'],
+        clf_linear = opt['linear_model'],
+        uncertainty_band = tuple(opt['uncertainty_band'])
     )
     
 # Execution of bacteria taxonomic classification on metagenome + save results
@@ -87,8 +90,7 @@ def bacteria_classification(opt):
     predictions = clf.predict(metagenome_ds)
     t_clf = time() - t_s
 
-    Xy_file = os.path.join(outdirs['results_dir'], f"extracted_bacteria_{opt['metagenome_name']}_{opt['model_type']}.npz")
-    save_Xy_data(predictions, Xy_file)
+    print(f'Predictions saved to {predictions.path}')
 
     print(f"""
           Caribou finished training the {opt['model_type']} model in {t_fit} seconds.
@@ -108,9 +110,12 @@ if __name__ == "__main__":
     # Optional datasets
     parser.add_argument('-v','--validation', default=None, type=Path, help='PATH to a npz file containing the k-mers profile for the validation dataset')
     # Parameters
-    parser.add_argument('-model','--model_type', default='sgd', choices=['sgd','mnb','lstm_attention','cnn','widecnn'], help='The type of model to train')
+    parser.add_argument('-model','--model_type', default='sgd', choices=['sgd','mnb','lstm_attention','cnn','widecnn','embed_lstm_attention'], help='The type of model to train')
     parser.add_argument('-tx','--taxa', default=None, help='The taxonomic level to use for the classification, defaults to species. Can be one level or a list of levels separated by commas.')
     parser.add_argument('-bs','--batch_size', default=32, type=int, help='Size of the batch size to use, defaults to 32')
+    parser.add_argument('-hc','--hierarchical', action='store_true', help='Optional. Train one sgd / mnb classifier per label of the previous taxonomic level instead of one model over all labels of a level')
+    parser.add_argument('-lm','--linear_model', default=None, choices=[None,'sgd','mnb'], help='Optional. Linear model classifying all sequences before the neural network model, only the uncertain sequences are classified by the neural network')
+    parser.add_argument('-ub','--uncertainty_band', default=[0.3, 0.9], nargs=2, type=float, help='Optional. Lower and upper bounds of the linear model probability for which sequences are classified by the neural network, defaults to 0.3 0.9')
     parser.add_argument('-e','--training_epochs', default=100, type=int, help='The number of training iterations for the neural networks models if one ise chosen, defaults to 100')
     parser.add_argument('-o','--outdir', required=True, type=Path, help='PATH to a directory on file where outputs will be saved')
     parser.add_argument('-wd','--workdir', default='/tmp/spill', type=Path, help='Optional. Path to a working directory where Ray Tune will output and spill tuning data')
@@ -13,16 +13,18 @@ from pathlib import Path
 
 from ray.data.preprocessors import Chain
 from data.reduction.nmf_decomposition import TensorNMFDecomposition
+from data.preprocessors_store import PreprocessorsStore
 from models.preprocessors.tfidf_transformer import TensorTfIdfTransformer
 from data.reduction.dictionnary_decomposition import TensorDictionnaryDecomposition
 from data.reduction.truncated_svd_decomposition import TensorTruncatedSVDDecomposition
+from data.reduction.sparse_random_projection import TensorSparseRandomProjection
 
 __author__ = "Nicolas de Montigny"
 
 __all__ = ['dimensions_decomposition']
 
 """
-This script computes dimensions decomposition via TruncatedSVD and saves a reduced version of the dataset.
+This script computes dimensions decomposition via TruncatedSVD, NMF, Dictionnary Learning or Sparse Random Projection and saves a reduced version of the dataset.
 """
 
 # Initialisation / validation of parameters from CLI
@@ -55,7 +57,6 @@ def dimensions_decomposition(opt):
             ds = read_parquet_files(data['profile'])
 
             scaler_file = os.path.join(outdirs['models_dir'], 'TF-IDF_diag.npz')
-            reductor_file = os.path.join(outdirs['models_dir'], 'TruncatedSVD_components.npz')
 
             # Compute the decomposition
             preprocessor = Chain(
@@ -63,11 +64,7 @@ def dimensions_decomposition(opt):
                     features = kmers,
                     file = scaler_file
                 ),
-                TensorTruncatedSVDDecomposition(
-                    features = kmers,
-                    nb_components = opt['nb_components'],
-                    file = reductor_file
-                )
+                decomposition_preprocessor(opt['method'], kmers, opt['nb_components'], outdirs['models_dir'])
             )
             t_s = time()
             ds = preprocessor.fit_transform(ds)
@@ -80,6 +77,15 @@ def dimensions_decomposition(opt):
 
             # Save decomposed data
             save_Xy_data(data, data_file)
+            # Save fitted chain for applying the decomposition to other datasets
+            store = PreprocessorsStore(os.path.join(outdirs['models_dir'], 'preprocessors'))
+            store.save(
+                'decomposition',
+                list(preprocessor.preprocessors),
+                kmers,
+                data['kmers'],
+                params = {'method' : opt['method'], 'nb_components' : opt['nb_components']}
+            )
 
             print(f"Caribou finished decomposing the features in {t_decomposition} seconds.")
         else:
@@ -87,6 +93,35 @@ def dimensions_decomposition(opt):
     else:
         print("Caribou did not decompose the features because the file already exists")
 
+# Decomposition preprocessor for the chosen method
+def decomposition_preprocessor(method, kmers, nb_components, models_dir):
+    if method == 'svd':
+        return TensorTruncatedSVDDecomposition(
+            features = kmers,
+            nb_components = nb_components,
+            file = os.path.join(models_dir, 'TruncatedSVD_components.npz')
+        )
+    elif method == 'nmf':
+        return TensorNMFDecomposition(
+            features = kmers,
+            nb_components = nb_components,
+            file = os.path.join(models_dir, 'NMF_components.npz')
+        )
+    elif method == 'dict':
+        return TensorDictionnaryDecomposition(
+            features = kmers,
+            nb_components = nb_components,
+            file = os.path.join(models_dir, 'Dictionnary_components.npz')
+        )
+    elif method == 'srp':
+        # No fitting pass required, only the seed and shape define the projection
+        return TensorSparseRandomProjection(
+            features = kmers,
+            nb_components = nb_components
+        )
+    else:
+        raise ValueError(f'Invalid decomposition method {method} !')
+
 # Argument parsing from CLI
 ################################################################################
 
@@ -97,6 +132,7 @@ if __name__ == "__main__":
     parser.add_argument('-l','--kmers_list', default=None, type=Path, help='PATH to a file containing a list of k-mers that will be reduced')
     # Parameters
     parser.add_argument('-n','--nb_components', default=1000, type=int, help='Number of components to decompose data into')
+    parser.add_argument('-m','--method', default='svd', choices=['svd','nmf','dict','srp'], help='Decomposition method : TruncatedSVD (svd), NMF (nmf), Dictionnary Learning (dict) or Sparse Random Projection without fitting (srp), defaults to svd')
     parser.add_argument('-o','--outdir', required=True, type=Path, help='PATH to a directory on file where outputs will be saved')
     parser.add_argument('-wd','--workdir', default='/tmp/spill', type=Path, help='Optional. Path to a working directory where tuning data will be spilled')
     args = parser.parse_args()
@@ -110,6 +146,7 @@ opt = {
     'dataset':'/home/nicdemon/results/data/Xy_genome_cucurbita_data_K10.npz',
     'kmers_list':'/home/nicdemon/results/data/kmers_list_reduced.txt',
     'nb_components':10000,
+    'method':'svd',
     'outdir':'/home/nicdemon/results/',
     'workdir':'/home/nicdemon/ray/',
 }
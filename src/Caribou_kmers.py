@@ -111,7 +111,8 @@ def kmers_dataset(opt):
             opt['dataset_name'],
             None,
             k = opt['k_length'],
-            kmers_list = kmers_list
+            kmers_list = kmers_list,
+            deduplicate = opt['deduplicate']
             )
             t_end = time()
             t_kmers = t_end - t_start
@@ -141,6 +142,7 @@ if __name__ == "__main__":
     # Parameters
     parser.add_argument('-k','--k_length', required=True, type=int, help='Length of k-mers to extract')
     parser.add_argument('-l','--kmers_list', default=None, type=Path, help='PATH to a file containing a list of k-mers to be extracted if the dataset is not a training database')
+    parser.add_argument('-dd','--deduplicate', action='store_true', help='Optional. Extract identical sequences of a dataset to analyse only once, keeping the ids and number of reads they represent')
     parser.add_argument('-o','--outdir', required=True, type=Path, help='PATH to a directory on file where outputs will be saved')
     parser.add_argument('-wd','--workdir', default='/tmp/spill', type=Path, help='Optional. Path to a working directory where tuning data will be spilled')
     args = parser.parse_args()
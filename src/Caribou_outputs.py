@@ -6,6 +6,7 @@ from utils import *
 from pathlib import Path
 from os.path import dirname
 from outputs.out import Outputs
+from models.predictions_sink import PredictionsSink
 
 __author__ = 'Nicolas de Montigny'
 
@@ -15,7 +16,10 @@ __all__ = ['out_2_user']
 ################################################################################
 def out_2_user(opt):
     data_bacteria = verify_load_data(opt['data_bacteria'])
-    classified_data = verify_load_classified(opt['classified_data'])
+    verify_data_path(opt['classified_data'])
+    predictions = PredictionsSink(opt['classified_data'])
+    if len(predictions.taxas()) == 0:
+        raise ValueError(f"No predictions found in {opt['classified_data']} ! Exiting")
     out_dir = dirname(opt['classified_data'])
 
     outs = Outputs(data_bacteria,
@@ -24,11 +28,11 @@ def out_2_user(opt):
         opt['model_type'],
         opt['dataset_name'],
         opt['host_name'],
-        classified_data
+        predictions
     )
 
     if opt['mpa']:
-        outs.abundances()
+        outs.mpa_style()
     if opt['kronagram']:
         outs.kronagram()
     if opt['report']:
@@ -43,8 +47,8 @@ def out_2_user(opt):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='This script produces outputs from the results of classified data by Caribou.')
     parser.add_argument('-db','--data_bacteria', required=True, type=Path, help='PATH to a npz file containing the data corresponding to the k-mers profile for the bacteria database')
-    parser.add_argument('-cd','--classified_data', required=True, type=Path, help='PATH to a npz file containing the data classified by Caribou')
-    parser.add_argument('-model','--model_type', required=True, choices=['sgd','mnb','lstm_attention','cnn','widecnn'], help='The type of model used for classification')
+    parser.add_argument('-cd','--classified_data', required=True, type=Path, help='PATH to the predictions folder written by Caribou classification or extraction (data_classified_*)')
+    parser.add_argument('-model','--model_type', required=True, choices=['sgd','mnb','lstm_attention','cnn','widecnn','embed_lstm_attention'], help='The type of model used for classification')
     parser.add_argument('-dt','--dataset_name', required=True, help='Name of the classified dataset used to name files')
     parser.add_argument('-dh','--host_name', default=None, help='Name of the host database used to name files')
     parser.add_argument('-m','--mpa', action='store_true', help='Should the mpa-style output be generated?')
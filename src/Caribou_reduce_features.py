@@ -13,6 +13,7 @@ from pathlib import Path
 
 
 from data.reduction.low_var_selection import TensorLowVarSelection
+from data.preprocessors_store import PreprocessorsStore
 from models.preprocessors.tfidf_transformer import TensorTfIdfTransformer
 from data.reduction.chi_features_selection import TensorChiFeaturesSelection
 from data.reduction.occurence_exclusion import TensorPercentOccurenceExclusion
@@ -68,13 +69,14 @@ def features_reduction(opt):
         train_ds = read_parquet_files(data['profile'])
         # Time the computation of transformations
         t_start = time()
+        input_kmers = kmers
         # Features scaling
         train_ds = tfidf_transform(train_ds, kmers)
         # Brute force features exclusion
-        train_ds, export_ds, kmers = occurence_exclusion(train_ds, export_ds, kmers)
-        train_ds, export_ds, kmers = low_var_selection(train_ds, export_ds, kmers)
+        train_ds, export_ds, kmers, occurence = occurence_exclusion(train_ds, export_ds, kmers)
+        train_ds, export_ds, kmers, low_var = low_var_selection(train_ds, export_ds, kmers)
         # Statistical features selection
-        train_ds, export_ds, kmers = features_selection(train_ds, export_ds, kmers, opt['taxa'])
+        train_ds, export_ds, kmers, chi = features_selection(train_ds, export_ds, kmers, opt['taxa'])
         # Time the computation of transformations
         t_end = time()
         t_reduction = t_end - t_start
@@ -87,6 +89,15 @@ def features_reduction(opt):
             handle.writelines("%s\n" % item for item in data['kmers'])
         # Save reduced data
         save_Xy_data(data, data_file)
+        # Save fitted selectors for applying the reduction to other datasets
+        store = PreprocessorsStore(os.path.join(outdirs['models_dir'], 'preprocessors'))
+        store.save(
+            'features_reduction',
+            [occurence, low_var, chi],
+            input_kmers,
+            kmers,
+            params = {'taxa' : opt['taxa']}
+        )
 
         print(f"Caribou finished reducing k-mers features of {opt['dataset_name']} in {t_reduction} seconds.")
     else:
@@ -111,7 +122,7 @@ def occurence_exclusion(train_ds, export_ds, kmers):
     export_ds = preprocessor.transform(export_ds)
     kmers = preprocessor.stats_['cols_keep']
 
-    return train_ds, export_ds, kmers
+    return train_ds, export_ds, kmers, preprocessor
 
 # Exclusion of columns with less than 5% variance
 def low_var_selection(train_ds, export_ds, kmers):
@@ -124,7 +135,7 @@ def low_var_selection(train_ds, export_ds, kmers):
     export_ds = preprocessor.transform(export_ds)
     kmers = preprocessor.stats_['cols_keep']
 
-    return train_ds, export_ds, kmers
+    return train_ds, export_ds, kmers, preprocessor
 
 # Chi2 evaluation of dependance between features and classes
 # Select 25% of features with highest Chi2 values
@@ -139,7 +150,7 @@ def features_selection(train_ds, export_ds, kmers, taxa):
     export_ds = preprocessor.transform(export_ds)
     kmers = preprocessor.stats_['cols_keep']
     
-    return train_ds, export_ds, kmers
+    return train_ds, export_ds, kmers, preprocessor
 
 # Argument parsing from CLI
 ################################################################################
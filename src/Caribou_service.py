@@ -0,0 +1,104 @@
+#!/usr/bin python3
+
+import os
+import argparse
+
+from utils import *
+from time import time
+from pathlib import Path
+from models.classification import ClassificationMethods
+from models.classification_service import ClassificationService, serve
+
+__author__ = "Nicolas de Montigny"
+
+__all__ = ['classification_service']
+
+"""
+This script serves already trained models as a long-lived local classification service.
+Models, scalers and K-mers vocabulary are loaded once so each sample classification only pays for the predictions.
+"""
+
+# Initialisation / validation of parameters from CLI
+################################################################################
+def classification_service(opt):
+
+    # Validate classifiers
+    if opt['binary_classifier'] is not None:
+        verify_binary_classifier(opt['binary_classifier'])
+    if opt['model_type'] is not None:
+        verify_multiclass_classifier(opt['model_type'])
+    verify_positive_int(opt['max_batch_size'], 'micro-batch size')
+
+    outdirs = define_create_outdirs(opt['outdir'])
+
+# Data loading
+################################################################################
+
+    # Only the database metadata is needed, no Ray cluster is started
+    db_data = verify_load_data(opt['data_bacteria'])
+
+    if opt['taxa'] is not None:
+        lst_taxas = verify_taxas(opt['taxa'], db_data['taxas'])
+    else:
+        lst_taxas = db_data['taxas'].copy()
+
+    if opt['binary_classifier'] is None and 'domain' in lst_taxas:
+        lst_taxas.remove('domain')
+
+# Loading of the trained models
+################################################################################
+
+    t_s = time()
+    clf = ClassificationMethods(
+        db_data = db_data,
+        outdirs = outdirs,
+        db_name = opt['database_name'],
+        clf_binary = opt['binary_classifier'],
+        clf_multiclass = opt['model_type'],
+        taxa = lst_taxas,
+        top_k = opt['top_k']
+    )
+    service = ClassificationService(
+        clf,
+        db_data['kmers'],
+        max_batch_size = opt['max_batch_size'],
+        max_wait = opt['max_wait'] / 1000
+    )
+    t_load = time() - t_s
+
+    print(f"Caribou loaded the models of {service.taxas} in {t_load} seconds.")
+
+# Serving until interrupted
+################################################################################
+
+    serve(
+        service,
+        host = opt['host'],
+        port = opt['port'],
+        socket_file = opt['socket']
+    )
+
+# Argument parsing from CLI
+################################################################################
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='This script serves trained models to classify sequences or K-mers profiles sent over localhost HTTP or a Unix socket.')
+    # Database
+    parser.add_argument('-db','--data_bacteria', required=True, type=Path, help='PATH to a npz file containing the data corresponding to the k-mers profile for the bacteria database')
+    parser.add_argument('-dt','--database_name', required=True, help='Name of the bacteria database used to name files')
+    # Models
+    parser.add_argument('-bin','--binary_classifier', default=None, choices=[None,'onesvm','linearsvm','attention','lstm','deeplstm','embed_attention'], help='Optional. The type of binary model trained for bacteria extraction')
+    parser.add_argument('-model','--model_type', default='sgd', choices=['sgd','mnb','lstm_attention','cnn','widecnn','embed_lstm_attention'], help='The type of multiclass model trained')
+    parser.add_argument('-tx','--taxa', default=None, help='The taxonomic levels to classify, defaults to all levels of the database. Can be one level or a list of levels separated by commas.')
+    parser.add_argument('-k','--top_k', default=3, type=int, help='Number of most probable labels returned with each classification, defaults to 3')
+    parser.add_argument('-o','--outdir', required=True, type=Path, help='PATH to the output directory where the models were trained')
+    # Service
+    parser.add_argument('-ht','--host', default='127.0.0.1', help='Optional. Address on which the service listens, defaults to localhost')
+    parser.add_argument('-p','--port', default=8765, type=int, help='Optional. Port on which the service listens, defaults to 8765')
+    parser.add_argument('-s','--socket', default=None, type=Path, help='Optional. PATH to a Unix socket to listen on instead of a port')
+    parser.add_argument('-mb','--max_batch_size', default=4096, type=int, help='Optional. Maximum number of reads predicted together, defaults to 4096')
+    parser.add_argument('-mw','--max_wait', default=10, type=float, help='Optional. Maximum time in milliseconds a request waits to be grouped with others, defaults to 10')
+    args = parser.parse_args()
+
+    opt = vars(args)
+
+    classification_service(opt)
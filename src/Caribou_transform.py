@@ -0,0 +1,81 @@
+#!/usr/bin python3
+
+import os.path
+import argparse
+
+from utils import *
+from time import time
+from pathlib import Path
+from data.preprocessors_store import PreprocessorsStore
+
+__author__ = "Nicolas de Montigny"
+
+__all__ = ['transform_only']
+
+"""
+This script applies a stored chain of fitted preprocessors (features reduction or decomposition) to a K-mers profile dataset in one streaming pass.
+The chain is only applied if the dataset was extracted with the same K-mers vocabulary as the one the chain was fitted on.
+"""
+
+# Initialisation / validation of parameters from CLI
+################################################################################
+def transform_only(opt):
+
+    # Verify existence of files and load data
+    data = verify_load_data(opt['dataset'])
+    verify_data_path(opt['store'])
+
+    # Initialize cluster
+    init_ray_cluster(opt['workdir'])
+
+# Transformation
+################################################################################
+
+    # Define new file
+    path, ext = os.path.splitext(opt['dataset'])
+    data_file = f"{path}_{opt['chain']}{ext}"
+
+    if not os.path.exists(data_file):
+        store = PreprocessorsStore(opt['store'])
+        ds = read_parquet_files(data['profile'])
+
+        t_s = time()
+        # Refuses to transform if the vocabulary does not match the one used for fitting
+        ds, kmers, manifest = store.transform(
+            opt['chain'],
+            ds,
+            data['kmers'],
+            version = opt['version']
+        )
+
+        # Save transformed dataset
+        data['profile'] = f"{data['profile']}_{opt['chain']}"
+        data['kmers'] = kmers
+        ds.write_parquet(data['profile'])
+        t_transform = time() - t_s
+
+        # Save transformed data
+        save_Xy_data(data, data_file)
+
+        print(f"Caribou finished applying {opt['chain']} (version {manifest['version']}) to {opt['dataset_name']} in {t_transform} seconds.")
+    else:
+        print(f"Caribou did not apply {opt['chain']} because the file already exists")
+
+# Argument parsing from CLI
+################################################################################
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='This script applies a stored chain of fitted preprocessors to a K-mers profile dataset.')
+    # Dataset
+    parser.add_argument('-db','--dataset', required=True, type=Path, help='PATH to a npz file containing the data corresponding to the k-mers profile to transform')
+    parser.add_argument('-dt','--dataset_name', default='dataset', help='Name of the dataset used to name files')
+    # Store
+    parser.add_argument('-s','--store', required=True, type=Path, help='PATH to the folder of fitted preprocessors, usually outdir/models/preprocessors')
+    parser.add_argument('-c','--chain', default='features_reduction', choices=['features_reduction','decomposition'], help='Name of the stored chain to apply, defaults to features_reduction')
+    parser.add_argument('-v','--version', default=None, type=int, help='Optional. Version of the stored chain to apply, defaults to the latest one fitted on the dataset vocabulary')
+    parser.add_argument('-wd','--workdir', default='/tmp/spill', type=Path, help='Optional. Path to a working directory where tuning data will be spilled')
+    args = parser.parse_args()
+
+    opt = vars(args)
+
+    transform_only(opt)
@@ -3,13 +3,14 @@ import os
 
 from utils import load_Xy_data, save_Xy_data
 from data.kmers import KmersCollection
+from data.labels_catalog import build_labels_catalog
 
 __author__ = 'Nicolas de Montigny'
 
 __all__ = ['build_load_save_data', 'build_Xy_data', 'build_X_data']
 
 
-def build_load_save_data(file, hostfile, prefix, dataset, host, kmers_list = None, k = 20):
+def build_load_save_data(file, hostfile, prefix, dataset, host, kmers_list = None, k = 20, deduplicate = False):
     # Test for which dataset to build k-mers and return it
     # Database + Host
     if isinstance(file, tuple) and isinstance(hostfile, tuple) and kmers_list is None:
@@ -24,7 +25,7 @@ def build_load_save_data(file, hostfile, prefix, dataset, host, kmers_list = Non
         return build_kmers_db(hostfile, host, prefix, k, kmers_list)
     # Dataset only
     elif not isinstance(file, tuple) and kmers_list is not None:
-        return build_kmers_dataset(file, dataset, prefix, k, kmers_list)
+        return build_kmers_dataset(file, dataset, prefix, k, kmers_list, deduplicate)
     else:
         raise ValueError('Invalid parameters combinaison for k-mers profile building')
 
@@ -33,9 +34,14 @@ def build_kmers_db(file, dataset, prefix, k, kmers_list = None):
     # Generate the names of files
     Xy_file = os.path.join(prefix, f'Xy_genome_{dataset}_data_K{k}')
     data_file = os.path.join(prefix, f'Xy_genome_{dataset}_data_K{k}.npz')
+    catalog_file = os.path.join(prefix, f'Xy_genome_{dataset}_data_K{k}_labels_catalog.npz')
     # Load db file if already exists
     if os.path.isfile(data_file):
         data = load_Xy_data(data_file)
+        # Databases built before the labels catalog
+        if 'labels_catalog' not in data.keys():
+            data['labels_catalog'] = build_labels_catalog(data['csv'], catalog_file)
+            save_Xy_data(data, data_file)
     else:
         # Build kmers collections with known classes and taxas
         collection = KmersCollection(
@@ -56,11 +62,12 @@ def build_kmers_db(file, dataset, prefix, k, kmers_list = None):
                 'taxas': collection.taxas,  # Known taxas for classification
                 'fasta': file[0],  # Fasta file -> simulate reads if cv
                 'csv': file[1], # CSV file -> simulate reads if cv
+                'labels_catalog': build_labels_catalog(file[1], catalog_file), # Labels codes, counts & weights
         }
         save_Xy_data(data, data_file)
     return data
        
-def build_kmers_dataset(file, dataset, prefix, k, kmers_list):
+def build_kmers_dataset(file, dataset, prefix, k, kmers_list, deduplicate = False):
     print(f'{dataset} {k}-mers profile')
     # Generate the names of files
     Xy_file = os.path.join(prefix, f'Xy_genome_{dataset}_data_K{k}')
@@ -75,14 +82,17 @@ def build_kmers_dataset(file, dataset, prefix, k, kmers_list):
             Xy_file,
             k,
             cls_file = None,
-            kmers_list = kmers_list
+            kmers_list = kmers_list,
+            deduplicate = deduplicate
         )
         collection.compute_kmers()
         # Data in a dictionnary
         data = {
             'profile' : collection.Xy_file,
+            # Representative ids if deduplicated, reads ids are in the members column of the profiles
             'ids' : collection.ids,
-            'kmers' : collection.kmers_list
+            'kmers' : collection.kmers_list,
+            'deduplicated' : collection.deduplicate
         }
         save_Xy_data(data, data_file)
     return data
\ No newline at end of file
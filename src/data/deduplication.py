@@ -0,0 +1,135 @@
+import os
+import uuid
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['deduplicate', 'MEMBERS_COLUMN_NAME', 'MULTIPLICITY_COLUMN_NAME']
+
+"""
+Deduplication of identical sequences or K-mers profiles before prediction.
+Rows are hashed on one column and only the (hash, id, block) projection is grouped by hash, one representative row is kept per group with :
+    members : ids of all the rows of the group, used to fan the predictions back out to each read
+    multiplicity : number of reads represented, used directly as the weight of the row in abundances
+The representatives are grouped by the block they come from and written in one parquet file per block :
+    tmp_dir/{block}.parquet
+Each block of the hashed dataset then only reads its own file to filter its rows, so the sequences / profiles never go through a shuffle
+and neither the driver nor the workers hold the ids of the whole dataset.
+Deduplicating an already deduplicated dataset merges the members and sums the multiplicities.
+"""
+
+HASH_COLUMN_NAME = '__hash__'
+BLOCK_COLUMN_NAME = '__block__'
+MEMBERS_COLUMN_NAME = 'members'
+MULTIPLICITY_COLUMN_NAME = 'multiplicity'
+
+def deduplicate(ds, column, tmp_dir):
+    """
+    Keep one representative row per unique value of a column (sequences or K-mers profiles)
+    The representative of a group is the row with the smallest id so the result is deterministic
+    The returned dataset is materialized and tmp_dir, which must be reachable by all the nodes, is removed
+    """
+    shutil.rmtree(tmp_dir, ignore_errors = True)
+    os.makedirs(tmp_dir)
+
+    # Hashed once, read by the grouping and by the filtering
+    ds = ds.map_batches(
+        _hash_batch,
+        batch_format = 'numpy',
+        batch_size = None,
+        fn_kwargs = {'column' : column}
+    ).materialize()
+
+    # Only the ids and hashes are shuffled
+    projection = [col for col in [HASH_COLUMN_NAME, BLOCK_COLUMN_NAME, 'id', MEMBERS_COLUMN_NAME, MULTIPLICITY_COLUMN_NAME] if col in ds.schema().names]
+    groups = ds.select_columns(projection).groupby(HASH_COLUMN_NAME).map_groups(_merge_group, batch_format = 'pandas')
+    groups.groupby(BLOCK_COLUMN_NAME).map_groups(
+        _write_representatives,
+        batch_format = 'pandas',
+        fn_kwargs = {'tmp_dir' : tmp_dir}
+    ).materialize()
+
+    ds = ds.map_batches(
+        _filter_representatives,
+        batch_format = 'pandas',
+        batch_size = None,
+        fn_kwargs = {'tmp_dir' : tmp_dir}
+    ).materialize()
+    shutil.rmtree(tmp_dir, ignore_errors = True)
+
+    return ds
+
+def _hash_batch(batch, column):
+    values = batch[column]
+    if values.dtype.kind in ['U', 'S'] or (values.dtype == object and len(values) > 0 and isinstance(values[0], str)):
+        digests = [hashlib.blake2b(str(value).encode(), digest_size = 16).hexdigest() for value in values]
+    else:
+        values = _unwrap_ndarray_object_type_if_needed(values)
+        values = np.ascontiguousarray(values).reshape(len(values), -1)
+        digests = [hashlib.blake2b(row.tobytes(), digest_size = 16).hexdigest() for row in values]
+    batch[HASH_COLUMN_NAME] = np.array(digests, dtype = object)
+    # Identifies the block of the rows so each block only reads its own representatives
+    batch[BLOCK_COLUMN_NAME] = np.full(len(digests), uuid.uuid4().hex, dtype = object)
+    return batch
+
+def _merge_group(group):
+    group = group.sort_values('id')
+    if MEMBERS_COLUMN_NAME in group.columns:
+        members = [member for lst in group[MEMBERS_COLUMN_NAME] for member in lst]
+    else:
+        members = [str(id) for id in group['id']]
+    if MULTIPLICITY_COLUMN_NAME in group.columns:
+        multiplicity = int(group[MULTIPLICITY_COLUMN_NAME].sum())
+    else:
+        multiplicity = len(group)
+
+    return pd.DataFrame({
+        'id' : [group['id'].iloc[0]],
+        BLOCK_COLUMN_NAME : [group[BLOCK_COLUMN_NAME].iloc[0]],
+        MEMBERS_COLUMN_NAME : [members],
+        MULTIPLICITY_COLUMN_NAME : [np.int64(multiplicity)]
+    })
+
+def _write_representatives(group, tmp_dir):
+    """
+    Write the representatives of one block of the hashed dataset in its parquet file
+    """
+    block = group[BLOCK_COLUMN_NAME].iloc[0]
+    table = pa.table({
+        'id' : pa.array([str(id) for id in group['id']], type = pa.string()),
+        MEMBERS_COLUMN_NAME : pa.array([[str(member) for member in lst] for lst in group[MEMBERS_COLUMN_NAME]], type = pa.list_(pa.string())),
+        MULTIPLICITY_COLUMN_NAME : pa.array(group[MULTIPLICITY_COLUMN_NAME].to_numpy(dtype = np.int64), type = pa.int64()),
+    })
+    file = os.path.join(tmp_dir, f'{block}.parquet')
+    pq.write_table(table, f'{file}.tmp')
+    os.replace(f'{file}.tmp', file)
+    return pd.DataFrame({BLOCK_COLUMN_NAME : [block], 'nb_rows' : [len(group)]})
+
+def _filter_representatives(batch, tmp_dir):
+    """
+    Keep only the representative rows of a block with their members and multiplicity
+    """
+    representatives = []
+    for block in pd.unique(batch[BLOCK_COLUMN_NAME]):
+        file = os.path.join(tmp_dir, f'{block}.parquet')
+        # Blocks without file only hold duplicates of rows from other blocks
+        if os.path.isfile(file):
+            representatives.append(pq.read_table(file).to_pandas())
+    batch = batch.drop(columns = [col for col in [HASH_COLUMN_NAME, BLOCK_COLUMN_NAME, MEMBERS_COLUMN_NAME, MULTIPLICITY_COLUMN_NAME] if col in batch.columns])
+    if len(representatives) == 0:
+        return batch.iloc[0:0].assign(**{MEMBERS_COLUMN_NAME : [], MULTIPLICITY_COLUMN_NAME : np.array([], dtype = np.int64)})
+    representatives = pd.concat(representatives, ignore_index = True).set_index('id')
+
+    batch = batch[batch['id'].astype(str).isin(representatives.index)]
+    groups = representatives.loc[batch['id'].astype(str)]
+    batch[MEMBERS_COLUMN_NAME] = pd.Series([list(members) for members in groups[MEMBERS_COLUMN_NAME]], index = batch.index, dtype = object)
+    batch[MULTIPLICITY_COLUMN_NAME] = groups[MULTIPLICITY_COLUMN_NAME].to_numpy(dtype = np.int64)
+    return batch
@@ -1,21 +1,118 @@
 from typing import List
 
+import numpy as np
+import pandas as pd
+
 from data.extraction.kmers_vectorizer import KmersVectorizer
 
-class GivenKmersVectorizer(KmersVectorizer):
+TENSOR_COLUMN_NAME = '__value__'
+
+# 2-bit nucleotides encoding, any other character marks an invalid window
+NUCLEOTIDES_CODES = np.full(256, -1, dtype = np.int8)
+for code, nucleotide in enumerate('ACGT'):
+    NUCLEOTIDES_CODES[ord(nucleotide)] = code
 
+# Maximum K length for 2-bit encoding in an unsigned 64 bits integer
+MAX_K_CODES = 32
+
+# Multipliers for hashing the codes in the Bloom prefilter
+BLOOM_HASHES = (np.uint64(0x9E3779B97F4A7C15), np.uint64(0xC2B2AE3D27D4EB4F))
+
+class GivenKmersVectorizer(KmersVectorizer):
+    """
+    Restricted extraction of a given K-mers vocabulary (ex: the K-mers kept after features reduction)
+    The vocabulary is compiled once into a sorted array of 2-bit codes (K <= 32) or a dictionnary (K > 32)
+    Windows of each sequence are encoded and looked up against the compiled vocabulary so only the given columns are ever allocated
+    An optional Bloom prefilter skips the windows that cannot match before the lookup
+    """
     _is_fittable = False
 
     def __init__(
         self,
         k,
         column: str,
-        tokens: List[str]
+        tokens: List[str],
+        bloom_filter: bool = False
     ):
         super().__init__(
             k,
             column
         )
+        self.k = k
         self.stats_ = {
             f"tokens({self.column})": tokens
-        }
\ No newline at end of file
+        }
+        self._nb_tokens = len(tokens)
+        self._bloom = None
+        self._bloom_shift = None
+        self._compile_vocabulary(tokens, bloom_filter)
+
+    def _compile_vocabulary(self, tokens, bloom_filter):
+        if self.k <= MAX_K_CODES:
+            codes = [_encode_kmer(token) for token in tokens]
+            # K-mers with other characters than ACGT can never match a valid window
+            columns = np.array([i for i, code in enumerate(codes) if code is not None], dtype = np.int64)
+            codes = np.array([code for code in codes if code is not None], dtype = np.uint64)
+            order = np.argsort(codes)
+            self._codes = codes[order]
+            self._columns = columns[order]
+            if bloom_filter:
+                nb_bits = max(64, 1 << int(np.ceil(np.log2(8 * max(self._nb_tokens, 1)))))
+                self._bloom_shift = np.uint64(64 - int(np.log2(nb_bits)))
+                self._bloom = np.zeros(nb_bits, dtype = bool)
+                for multiplier in BLOOM_HASHES:
+                    self._bloom[(self._codes * multiplier) >> self._bloom_shift] = True
+        else:
+            self._lookup = {token : i for i, token in enumerate(tokens)}
+
+    def _transform_pandas(self, df: pd.DataFrame):
+        tensors = np.zeros((len(df), self._nb_tokens), dtype = np.int64)
+        for row, seq in enumerate(df[self.column]):
+            if self.k <= MAX_K_CODES:
+                columns = self._match_codes(seq)
+            else:
+                columns = self._match_lookup(seq)
+            if len(columns) > 0:
+                tensors[row] = np.bincount(columns, minlength = self._nb_tokens)
+        df.loc[:,TENSOR_COLUMN_NAME] = pd.Series(list(tensors), index = df.index)
+        df = df.drop(columns = [self.column])
+        return df
+
+    def _match_codes(self, seq):
+        """
+        Columns of the windows of a sequence found in the compiled vocabulary
+        Windows are the same as the ones from the tokenization function (range(0, len(s)-k))
+        """
+        nb_windows = len(seq) - self.k
+        if nb_windows <= 0:
+            return np.empty(0, dtype = np.int64)
+        nucl = NUCLEOTIDES_CODES[np.frombuffer(seq.encode(), dtype = np.uint8)]
+        invalid = np.concatenate(([0], np.cumsum(nucl < 0)))
+        valid = (invalid[self.k:self.k + nb_windows] - invalid[0:nb_windows]) == 0
+        nucl = np.where(nucl < 0, 0, nucl).astype(np.uint64)
+        # Rolling 2-bit encoding of all windows
+        windows = np.zeros(nb_windows, dtype = np.uint64)
+        for j in range(self.k):
+            windows = (windows << np.uint64(2)) | nucl[j:j + nb_windows]
+        windows = windows[valid]
+        # Cheap rejection of windows that cannot be in the vocabulary
+        if self._bloom is not None:
+            for multiplier in BLOOM_HASHES:
+                windows = windows[self._bloom[(windows * multiplier) >> self._bloom_shift]]
+        pos = np.searchsorted(self._codes, windows)
+        pos[pos == len(self._codes)] = 0
+        found = self._codes[pos] == windows if len(self._codes) > 0 else np.zeros(len(windows), dtype = bool)
+        return self._columns[pos[found]]
+
+    def _match_lookup(self, seq):
+        columns = [self._lookup.get(seq[start:start + self.k]) for start in range(0, len(seq) - self.k, 1)]
+        return np.array([col for col in columns if col is not None], dtype = np.int64)
+
+def _encode_kmer(kmer):
+    code = 0
+    for nucleotide in kmer:
+        nucl = NUCLEOTIDES_CODES[ord(nucleotide)] if ord(nucleotide) < 256 else -1
+        if nucl < 0:
+            return None
+        code = (code << 2) | int(nucl)
+    return code
@@ -11,6 +11,9 @@ from glob import glob
 from shutil import rmtree
 from os.path import splitext
 
+# Deduplication
+from data.deduplication import deduplicate
+
 # Kmers extraction
 from data.extraction.seen_kmers_vectorizer import SeenKmersVectorizer
 from data.extraction.given_kmers_vectorizer import GivenKmersVectorizer
@@ -59,6 +62,7 @@ class KmersCollection():
 
     ids : list
         A list of all sequences ids
+        Only the ids of the representative sequences if the sequences were deduplicated, the ids of the reads they represent are in their members
 
     taxas : list of strings
         A list containing the taxas contained in the dataset if they were present
@@ -77,6 +81,10 @@ class KmersCollection():
     kmers_list : list of strings
         List of given K-mers if one was passed in parameters
         List of K-mers extracted if none was passed in parameters
+
+    deduplicate : boolean
+        If True, identical sequences are extracted once and their profile keeps the ids of all the reads (members) and their number (multiplicity)
+        Only applied to sequences without known classes
     """
     def __init__(
         self,
@@ -85,10 +93,12 @@ class KmersCollection():
         k,
         cls_file = None,
         kmers_list = None,
+        deduplicate = False,
     ):
         ## Public attributes
         # Parameters
         self.k = k
+        self.deduplicate = deduplicate
         self.Xy_file = Xy_file
         self.fasta = fasta_file
         self.csv = cls_file
@@ -136,6 +146,7 @@ class KmersCollection():
         self._verif_mem_vs_disk()
         self._parse_fasta()
         self._make_ray_ds()
+        self._deduplicate_sequences()
         self._kmers_tokenization()
         self._write_dataset()
 
@@ -321,6 +332,17 @@ class KmersCollection():
             self._files_list = glob(os.path.join(self._tmp_dir, '*.parquet'))
             self.df = ray.data.read_parquet_bulk(self._files_list, parallelism = len(files_lst))
 
+    def _deduplicate_sequences(self):
+        # Sequences with classes are kept to preserve their labels
+        if self.deduplicate and self._labels is None:
+            print('_deduplicate_sequences')
+            self.df = deduplicate(self.df, 'sequence', os.path.join(self._tmp_dir, 'deduplication'))
+            # Ids of the profiles written
+            self.ids = [
+                id for batch in self.df.select_columns(['id']).iter_batches(batch_format = 'numpy', batch_size = None)
+                for id in batch['id']
+            ]
+
     def _kmers_tokenization(self):
         print('_kmers_tokenization')
         if self.method == 'seen':
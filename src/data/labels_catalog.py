@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import load_Xy_data, save_Xy_data
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['build_labels_catalog', 'load_labels_catalog']
+
+"""
+Catalog of the taxonomic labels of a database built once from the classes csv file(s).
+For each taxonomic rank it holds the label -> code mapping, the counts and the balanced class weights of each label.
+It is saved alongside the K-mers profile so encoders and class weights can be loaded without scanning the profile data.
+"""
+
+def build_labels_catalog(csv, file):
+    """
+    Build the labels catalog from a classes csv file or a tuple of csv files (database + host) and save it to file
+    Returns the path to the saved catalog
+    """
+    if isinstance(csv, tuple):
+        cls = pd.concat([pd.read_csv(csv[0]), pd.read_csv(csv[1])], axis = 0, join = 'inner', ignore_index = True)
+    else:
+        cls = pd.read_csv(csv)
+    # Same labels as the ones used for training
+    if 'domain' in cls.columns:
+        cls.loc[cls['domain'].str.lower() == 'archaea', 'domain'] = 'Bacteria'
+
+    catalog = {}
+    for taxa in cls.columns:
+        if taxa == 'id':
+            continue
+        # Sorted labels to be concordant with the order of Ray's encoders
+        counts = cls[taxa].value_counts(dropna = True).sort_index()
+        labels = list(counts.index)
+        # Balanced weights as in sklearn.utils.class_weight.compute_class_weight
+        weights = counts.sum() / (len(counts) * counts.to_numpy(dtype = np.float64))
+        catalog[taxa] = {
+            'labels' : labels,
+            'codes' : {label : code for code, label in enumerate(labels)},
+            'counts' : dict(zip(labels, counts.to_numpy(dtype = np.int64))),
+            'weights' : dict(zip(labels, weights)),
+        }
+
+    save_Xy_data(catalog, file)
+
+    return file
+
+def load_labels_catalog(file, taxa = None):
+    """
+    Load the labels catalog from file, optionally only for one taxonomic rank
+    Returns None if there is no catalog or no entry for the rank
+    """
+    if file is None or not os.path.isfile(file):
+        return None
+    catalog = load_Xy_data(file)
+    if taxa is not None:
+        return catalog.get(taxa)
+    return catalog
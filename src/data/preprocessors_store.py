@@ -0,0 +1,171 @@
+import os
+import json
+import cloudpickle
+
+from glob import glob
+from time import time
+from typing import Dict, List
+from utils import kmers_fingerprint
+
+from ray.data.preprocessors import Chain
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['PreprocessorsStore']
+
+"""
+Versioned store of fitted preprocessors chains reusable across datasets.
+Each artifact is keyed by the fingerprint of the input K-mers vocabulary and the parameters used for fitting.
+Artifacts are saved in the following arborescence :
+    store_dir/name/key/v{version}/
+        chain.pkl : the fitted preprocessors in order of application
+        kmers_list.txt : the features output by the chain
+        manifest.json : fingerprints, parameters and steps of the chain
+"""
+
+STORE_FORMAT_VERSION = 1
+CHAIN_FILE = 'chain.pkl'
+KMERS_FILE = 'kmers_list.txt'
+MANIFEST_FILE = 'manifest.json'
+
+class PreprocessorsStore():
+    """
+    ----------
+    Attributes
+    ----------
+
+    store_dir : string
+        Path to a folder where the fitted preprocessors are saved
+
+    ----------
+    Methods
+    ----------
+
+    save : save a list of fitted preprocessors as a new version of an artifact
+        name : string
+            Name of the chain (ex: features_reduction, decomposition)
+        preprocessors : list of fitted ray.data.Preprocessor
+        input_kmers : list of the features the chain was fitted on
+        output_kmers : list of the features output by the chain
+        params : dictionnary of the parameters used for fitting
+
+    load : load the latest (or a given) version of an artifact for a K-mers vocabulary
+        Raises a ValueError if the artifact exists but was fitted on another vocabulary
+
+    transform : apply a stored chain to a dataset in one streaming pass
+    """
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        os.makedirs(self.store_dir, mode = 0o700, exist_ok = True)
+
+    # Public methods
+    #########################################################################################################
+
+    def save(
+        self,
+        name: str,
+        preprocessors: List,
+        input_kmers: List[str],
+        output_kmers: List[str],
+        params: Dict = None,
+    ):
+        """
+        Save the fitted preprocessors as a new version of the artifact and return its directory
+        """
+        if params is None:
+            params = {}
+        fingerprint = kmers_fingerprint(input_kmers)
+        key = _artifact_key(fingerprint, params)
+        key_dir = os.path.join(self.store_dir, name, key)
+        version = len(self._versions(key_dir)) + 1
+        artifact_dir = os.path.join(key_dir, f'v{version}')
+        os.makedirs(artifact_dir, mode = 0o700)
+
+        with open(os.path.join(artifact_dir, CHAIN_FILE), 'wb') as handle:
+            cloudpickle.dump(preprocessors, handle)
+        with open(os.path.join(artifact_dir, KMERS_FILE), 'w') as handle:
+            handle.writelines("%s\n" % item for item in output_kmers)
+
+        manifest = {
+            'format' : STORE_FORMAT_VERSION,
+            'name' : name,
+            'key' : key,
+            'version' : version,
+            'created' : time(),
+            'input_fingerprint' : fingerprint,
+            'output_fingerprint' : kmers_fingerprint(output_kmers),
+            'nb_input_features' : len(input_kmers),
+            'nb_output_features' : len(output_kmers),
+            'params' : params,
+            'steps' : [repr(preprocessor) for preprocessor in preprocessors],
+        }
+        # Manifest written last marks the artifact as complete
+        with open(os.path.join(artifact_dir, MANIFEST_FILE), 'w') as handle:
+            json.dump(manifest, handle, indent = 4, default = str)
+
+        return artifact_dir
+
+    def load(self, name: str, kmers: List[str], params: Dict = None, version: int = None):
+        """
+        Load the fitted chain, its output features and manifest for the given K-mers vocabulary
+        If params is None, the most recent artifact fitted on this vocabulary is used
+        """
+        fingerprint = kmers_fingerprint(kmers)
+        manifests = self._manifests(name)
+        if len(manifests) == 0:
+            raise ValueError(f'No fitted preprocessors named {name} found in store {self.store_dir}')
+
+        candidates = [mnf for mnf in manifests if mnf['input_fingerprint'] == fingerprint]
+        if len(candidates) == 0:
+            raise ValueError(
+                f'Preprocessors {name} were fitted on a different K-mers vocabulary than the one of the dataset ! ' +
+                f'Dataset has {len(kmers)} features while stored artifacts expect {sorted(set(mnf["nb_input_features"] for mnf in manifests))}')
+        if params is not None:
+            key = _artifact_key(fingerprint, params)
+            candidates = [mnf for mnf in candidates if mnf['key'] == key]
+        if version is not None:
+            candidates = [mnf for mnf in candidates if mnf['version'] == version]
+        if len(candidates) == 0:
+            raise ValueError(f'No fitted preprocessors {name} found for the given parameters / version')
+
+        manifest = max(candidates, key = lambda mnf: mnf['created'])
+        artifact_dir = os.path.join(self.store_dir, name, manifest['key'], f"v{manifest['version']}")
+
+        with open(os.path.join(artifact_dir, CHAIN_FILE), 'rb') as handle:
+            preprocessors = cloudpickle.load(handle)
+        with open(os.path.join(artifact_dir, KMERS_FILE), 'r') as handle:
+            output_kmers = [kmer.rstrip() for kmer in handle.readlines()]
+
+        return preprocessors, output_kmers, manifest
+
+    def transform(self, name: str, ds, kmers: List[str], params: Dict = None, version: int = None):
+        """
+        Apply the stored chain to a dataset
+        Transformations are lazy and executed in a single streaming pass when the dataset is consumed
+        """
+        preprocessors, output_kmers, manifest = self.load(name, kmers, params, version)
+        ds = Chain(*preprocessors).transform(ds)
+
+        return ds, output_kmers, manifest
+
+    # Private methods
+    #########################################################################################################
+
+    def _versions(self, key_dir):
+        return glob(os.path.join(key_dir, 'v*', ''))
+
+    def _manifests(self, name):
+        manifests = []
+        for file in glob(os.path.join(self.store_dir, name, '*', 'v*', MANIFEST_FILE)):
+            with open(file, 'r') as handle:
+                manifest = json.load(handle)
+            if manifest.get('format') == STORE_FORMAT_VERSION:
+                manifests.append(manifest)
+        return manifests
+
+def _artifact_key(fingerprint, params):
+    """
+    Key of an artifact from the input vocabulary fingerprint and the fitting parameters
+    """
+    params = json.dumps(params, sort_keys = True, default = str)
+    return kmers_fingerprint([fingerprint, params])[:16]
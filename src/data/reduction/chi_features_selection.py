@@ -34,7 +34,6 @@ class TensorChiFeaturesSelection(Preprocessor):
         def stats(batch):
             X = batch[TENSOR_COLUMN_NAME]
             X = _unwrap_ndarray_object_type_if_needed(X)
-            X = pd.DataFrame(X, columns = self.features)
             y = batch[self.taxa].ravel()
             return {'chi' : [chi2(X, y)[0]]}
 
@@ -53,26 +52,25 @@ class TensorChiFeaturesSelection(Preprocessor):
         # Determine the threshold from distribution of chi values
         self.threshold = np.nanquantile(mean_chi, self.threshold)
         
-        # Keep features with values higher than the threshold
-        cols_keep = [self.features[i] for i, chi in enumerate(mean_chi) if chi > self.threshold]
+        # Keep positions of features with values higher than the threshold
+        cols_keep = np.flatnonzero(mean_chi > self.threshold)
         
+        # Features names are resolved once from the kept positions
         if 0 < len(cols_keep) :
-            self.stats_ = {'cols_keep' : cols_keep}
+            self.stats_ = {'cols_keep' : [self.features[i] for i in cols_keep], 'cols_keep_idx' : cols_keep}
         else:
-            self.stats_ = {'cols_keep' : self.features}
+            self.stats_ = {'cols_keep' : self.features, 'cols_keep_idx' : np.arange(self._nb_features)}
 
         return self
 
     def _transform_pandas(self, df: pd.DataFrame) -> pd.DataFrame:
         # _validate_df(df, TENSOR_COLUMN_NAME, self._nb_features)
-        cols_keep = self.stats_['cols_keep']
+        cols_keep = self.stats_['cols_keep_idx']
 
         if len(cols_keep) < self._nb_features:
             tensor_col = df[TENSOR_COLUMN_NAME]
             tensor_col = _unwrap_ndarray_object_type_if_needed(tensor_col)
-            tensor_col = pd.DataFrame(tensor_col, columns = self.features)
-
-            tensor_col = tensor_col[cols_keep].to_numpy()
+            tensor_col = np.take(tensor_col, cols_keep, axis = 1)
 
             df[TENSOR_COLUMN_NAME] = pd.Series(list(tensor_col))        
 
@@ -0,0 +1,31 @@
+import numpy as np
+
+from warnings import warn
+from os.path import isfile
+from utils import save_Xy_data, load_Xy_data
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['load_components', 'save_components']
+
+"""
+Components files of the fitted decompositions.
+The components are saved with the fingerprint of the K-mers vocabulary and the parameters they were fitted with,
+they are only reused by a decomposition fitted on the same vocabulary with the same parameters.
+"""
+
+def load_components(file: str, fingerprint: str, params: dict):
+    """
+    Load the components from file only if they were fitted on the same K-mers vocabulary with the same parameters
+    Returns None if they must be fitted
+    """
+    if file and isfile(file):
+        saved = load_Xy_data(file)
+        if isinstance(saved, dict) and saved.get('fingerprint') == fingerprint and saved.get('params') == params:
+            return np.array(saved['components'])
+        warn(f'Components file {file} was fitted on a different K-mers vocabulary or with other parameters, it will be refitted and overwritten')
+    return None
+
+def save_components(components, file: str, fingerprint: str, params: dict):
+    if file:
+        save_Xy_data({'components' : components, 'fingerprint' : fingerprint, 'params' : params}, file)
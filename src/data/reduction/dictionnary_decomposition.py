@@ -4,13 +4,14 @@ import pandas as pd
 
 from typing import List
 from warnings import warn
-from os.path import isfile
 from ray.data import Dataset
-from utils import save_Xy_data, load_Xy_data
+from utils import kmers_fingerprint
 
-from sklearn.decomposition import DictionaryLearning, MiniBatchDictionaryLearning
+from sklearn.decomposition import MiniBatchDictionaryLearning
+from data.reduction.streaming_decomposition import streaming_partial_fit, checkpoint_file
 
 from ray.data.preprocessor import Preprocessor
+from data.reduction.components_file import load_components, save_components
 from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
 
 TENSOR_COLUMN_NAME = '__value__'
@@ -18,52 +19,61 @@ TENSOR_COLUMN_NAME = '__value__'
 class TensorDictionnaryDecomposition(Preprocessor):
     """
     Custom class for using Mini-Batch Dictionnary Learning as a Ray preprocessor.
-    This is inspired by sklearn.decomposition.DictionaryLearning and is fitted on batches before keeping the consensus components matrix.
-    Consensus components matrix is attained following the logic from sklearn.decomposition.MiniBatchDictionnaryLearning.
-    https://scikit-learn.org/stable/modules/decomposition.html#nmf
-    https://scikit-learn.org/stable/modules/generated/sklearn.decomposition.NMF.html
-    https://scikit-learn.org/stable/modules/generated/sklearn.decomposition.MiniBatchNMF.html
+    This is inspired by sklearn.decomposition.DictionaryLearning and a single sklearn.decomposition.MiniBatchDictionaryLearning is fitted by streaming batches of the dataset through its partial_fit method over a number of epochs.
+    The estimator state is checkpointed during fitting so long fits can be resumed.
+    https://scikit-learn.org/stable/modules/decomposition.html#dictionary-learning
+    https://scikit-learn.org/stable/modules/generated/sklearn.decomposition.DictionaryLearning.html
+    https://scikit-learn.org/stable/modules/generated/sklearn.decomposition.MiniBatchDictionaryLearning.html
     """
-    def __init__(self, features: List[str], nb_components: int = 10000, file: str = ''):
+    def __init__(
+        self,
+        features: List[str],
+        nb_components: int = 10000,
+        file: str = '',
+        nb_epochs: int = 10,
+        batch_size: int = 1024
+    ):
         # Parameters
         self.features = features
         self._nb_features = len(features)
         self._nb_components = nb_components
+        self._nb_epochs = nb_epochs
+        self._batch_size = batch_size
         self._file = file       
 
     def _fit(self, ds: Dataset) -> Preprocessor:
-        def batch_dict(batch):
-            batch = batch[TENSOR_COLUMN_NAME]
-            batch = _unwrap_ndarray_object_type_if_needed(batch)
-            dict = MiniBatchDictionaryLearning(
-                n_components = self._nb_components,
-                max_iter = 10,
-                fit_algorithm = 'cd',
-                transform_algorithm = 'lars',
-                positive_code = True,
-                positive_dict = True,
-                batch_size = 10
-            )
-            dict.fit(batch)
-            return {'components' : [dict.components_]}
-        
         components = []
         if self._nb_features > self._nb_components:
-            if isfile(self._file):
-                components = np.array(load_Xy_data(self._file))
-            else:
-                dct = ds.map_batches(batch_dict, batch_format = 'numpy')
-                
-                for row in dct.iter_rows():
-                    components.append(row['components'])
-                components = np.mean(components, axis = 0)
-                
-                save_Xy_data(components, self._file)
+            # Components are only reused if fitted on the same vocabulary with the same parameters
+            fingerprint = kmers_fingerprint(self.features)
+            params = {'nb_components' : self._nb_components, 'nb_epochs' : self._nb_epochs, 'batch_size' : self._batch_size}
+            components = load_components(self._file, fingerprint, params)
+            if components is None:
+                model = MiniBatchDictionaryLearning(
+                    n_components = self._nb_components,
+                    fit_algorithm = 'cd',
+                    transform_algorithm = 'lars',
+                    positive_code = True,
+                    positive_dict = True,
+                    batch_size = self._batch_size
+                )
+                model = streaming_partial_fit(
+                    model,
+                    ds,
+                    nb_epochs = self._nb_epochs,
+                    batch_size = self._batch_size,
+                    checkpoint_file = checkpoint_file(self._file, model)
+                )
+                components = model.components_
+
+                save_components(components, self._file, fingerprint, params)
 
             self.stats_ = {'components' : components}
         else:
             warn('No features reduction to do because the number of features is already lower than the required number of components')
             self.stats_ = {'components' : False}
+
+        return self
     
     def _transform_pandas(self, df: pd.DataFrame) -> pd.DataFrame:
         # _validate_df(df, TENSOR_COLUMN_NAME, self._nb_features)
@@ -78,7 +88,7 @@ class TensorDictionnaryDecomposition(Preprocessor):
         return df
 
     def __repr__(self):
-        return (f"{self.__class__.__name__}(features={self._nb_features!r}, file={self._file!r})")
+        return (f"{self.__class__.__name__}(features={self._nb_features!r}, nb_epochs={self._nb_epochs!r}, file={self._file!r})")
 
 def _validate_df(df: pd.DataFrame, column: str, nb_features: int) -> None:
     if len(df.loc[0, column]) != nb_features:
@@ -29,25 +29,22 @@ class TensorOccurenceExclusion(Preprocessor):
             occurences += np.count_nonzero(batch, axis = 0)
 
         # Include / Exclude by sorted position
-        cols_keep = pd.Series(occurences, index = self.features)
-        cols_keep = cols_keep.sort_values(ascending = True) # Long operation
-        cols_keep = cols_keep.iloc[0 : self._num_features]
-        cols_keep = list(cols_keep.index)
+        # Partial sort of the positions, then back to original features order
+        cols_keep = np.argpartition(occurences, self._num_features - 1)[0 : self._num_features]
+        cols_keep = np.sort(cols_keep)
 
-        # self.stats_ = {'cols_keep' : cols_keep, 'cols_drop' : cols_drop}
-        self.stats_ = {'cols_keep' : cols_keep}
+        # Features names are resolved once from the kept positions
+        self.stats_ = {'cols_keep' : [self.features[i] for i in cols_keep], 'cols_keep_idx' : cols_keep}
 
         return self
 
     def _transform_pandas(self, df: pd.DataFrame) -> pd.DataFrame:
         # _validate_df(df, TENSOR_COLUMN_NAME, self._nb_features)
-        cols_keep = self.stats_['cols_keep']
+        cols_keep = self.stats_['cols_keep_idx']
         
         tensor_col = df[TENSOR_COLUMN_NAME]
         tensor_col = _unwrap_ndarray_object_type_if_needed(tensor_col)
-        tensor_col = pd.DataFrame(tensor_col, columns = self.features)
-
-        tensor_col = tensor_col[cols_keep].to_numpy()
+        tensor_col = np.take(tensor_col, cols_keep, axis = 1)
         
         df[TENSOR_COLUMN_NAME] = pd.Series(list(tensor_col))
 
@@ -83,25 +80,25 @@ class TensorPercentOccurenceExclusion(Preprocessor):
         for row in occur.iter_rows():
             occurences += row['occurences']
 
-        # Construct list of features to keep by position
-        cols_keep = [self.features[i] for i, occurence in enumerate(occurences) if occurence < high_treshold]
+        # Construct array of features positions to keep
+        cols_keep = np.flatnonzero(occurences < high_treshold)
         
+        # Features names are resolved once from the kept positions
         if 0 < len(cols_keep) :
-            self.stats_ = {'cols_keep' : cols_keep}
+            self.stats_ = {'cols_keep' : [self.features[i] for i in cols_keep], 'cols_keep_idx' : cols_keep}
         else:
-            self.stats_ = {'cols_keep' : self.features}
+            self.stats_ = {'cols_keep' : self.features, 'cols_keep_idx' : np.arange(self._nb_features)}
 
         return self
 
     def _transform_pandas(self, df: pd.DataFrame) -> pd.DataFrame:
         # _validate_df(df, TENSOR_COLUMN_NAME, self._nb_features)
-        cols_keep = self.stats_['cols_keep']
+        cols_keep = self.stats_['cols_keep_idx']
         
         if len(cols_keep) < self._nb_features:
             tensor_col = df[TENSOR_COLUMN_NAME]
             tensor_col = _unwrap_ndarray_object_type_if_needed(tensor_col)
-            tensor_col = pd.DataFrame(tensor_col, columns = self.features)
-            tensor_col = tensor_col[cols_keep].to_numpy()
+            tensor_col = np.take(tensor_col, cols_keep, axis = 1)
             
             df[TENSOR_COLUMN_NAME] = pd.Series(list(tensor_col))
         
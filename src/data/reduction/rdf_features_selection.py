@@ -35,14 +35,13 @@ class TensorRDFFeaturesSelection(Preprocessor):
             y = encoder.fit_transform(y)
             # Features data
             X = _unwrap_ndarray_object_type_if_needed(arr[TENSOR_COLUMN_NAME])
-            X = pd.DataFrame(X, columns = self.features)
             # XGBoost tree
             tree = XGBRFClassifier()
             tree.fit(X,y)
-            # Used features in the tree
+            # Used features positions in the tree (XGBoost names unnamed features f0, f1, ...)
             tree = tree.get_booster()
             relevant_features = tree.get_fscore()
-            relevant_features = [feat for feat in relevant_features.keys()]
+            relevant_features = [int(feat[1:]) for feat in relevant_features.keys()]
 
             return {'features':[relevant_features]}
         
@@ -51,25 +50,24 @@ class TensorRDFFeaturesSelection(Preprocessor):
         relevant_features = ds.map_batches(xgboost_batch, batch_format = 'numpy')
         for row in relevant_features.iter_rows():
             cols_keep.extend(row['features'])
-        cols_keep = np.unique(cols_keep)
+        cols_keep = np.unique(np.array(cols_keep, dtype = np.int64))
 
+        # Features names are resolved once from the kept positions
         if 0 < len(cols_keep) :
-            self.stats_ = {'cols_keep' : cols_keep}
+            self.stats_ = {'cols_keep' : [self.features[i] for i in cols_keep], 'cols_keep_idx' : cols_keep}
         else:
-            self.stats_ = {'cols_keep' : self.features}
+            self.stats_ = {'cols_keep' : self.features, 'cols_keep_idx' : np.arange(self._nb_features)}
 
         return self
 
     def _transform_pandas(self, df: pd.DataFrame) -> pd.DataFrame:
         # _validate_df(df, TENSOR_COLUMN_NAME, self._nb_features)
-        cols_keep = self.stats_['cols_keep']
+        cols_keep = self.stats_['cols_keep_idx']
 
         if len(cols_keep) < self._nb_features:
             tensor_col = df[TENSOR_COLUMN_NAME]
             tensor_col = _unwrap_ndarray_object_type_if_needed(tensor_col)
-            tensor_col = pd.DataFrame(tensor_col, columns = self.features)
-
-            tensor_col = tensor_col[cols_keep].to_numpy()
+            tensor_col = np.take(tensor_col, cols_keep, axis = 1)
 
             df[TENSOR_COLUMN_NAME] = pd.Series(list(tensor_col))        
 
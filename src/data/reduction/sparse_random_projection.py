@@ -0,0 +1,81 @@
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from typing import List
+from warnings import warn
+from functools import lru_cache
+
+from ray.data.preprocessor import Preprocessor
+from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
+
+TENSOR_COLUMN_NAME = '__value__'
+
+class TensorSparseRandomProjection(Preprocessor):
+    """
+    Custom implementation of very sparse random projection inspired by sklearn.random_projection.SparseRandomProjection to be used as a Ray preprocessor.
+    The projection matrix follows the Achlioptas / Li et al. very sparse Johnson-Lindenstrauss scheme and is drawn from the seed, so no fitting pass over the data is required.
+    Only the seed and the shape are stored, the matrix is regenerated identically on each worker.
+    https://scikit-learn.org/stable/modules/random_projection.html#sparse-random-projection
+    https://scikit-learn.org/stable/modules/generated/sklearn.random_projection.SparseRandomProjection.html
+    https://web.stanford.edu/~hastie/Papers/Ping/KDD06_rp.pdf
+    """
+    _is_fittable = False
+
+    def __init__(
+        self,
+        features: List[str],
+        nb_components: int = 10000,
+        density: float = None,
+        seed: int = 42
+    ):
+        # Parameters
+        self.features = features
+        self._nb_features = len(features)
+        self._nb_components = nb_components
+        self._seed = seed
+        # Very sparse projection by default : 1 / sqrt(nb_features)
+        if density is None:
+            self._density = 1 / np.sqrt(self._nb_features)
+        elif 0 < density <= 1:
+            self._density = density
+        else:
+            raise ValueError(f'Invalid density {density} for sparse random projection, it must be in ]0, 1]')
+
+    def _transform_pandas(self, df: pd.DataFrame) -> pd.DataFrame:
+        if self._nb_features > self._nb_components:
+            components = _sparse_random_matrix(self._nb_components, self._nb_features, self._density, self._seed)
+
+            tensor_col = df[TENSOR_COLUMN_NAME]
+            tensor_col = _unwrap_ndarray_object_type_if_needed(tensor_col)
+            # Tensor columns are dense, the sparse @ dense product is computed on the sparse side
+            tensor_col = (components @ np.asarray(tensor_col, dtype = np.float32).T).T
+            df[TENSOR_COLUMN_NAME] = pd.Series(list(tensor_col))
+        else:
+            warn('No features reduction to do because the number of features is already lower than the required number of components')
+
+        return df
+
+    def __repr__(self):
+        return (f"{self.__class__.__name__}(features={self._nb_features!r}, nb_components={self._nb_components!r}, density={self._density!r}, seed={self._seed!r})")
+
+@lru_cache(maxsize = 4)
+def _sparse_random_matrix(nb_components: int, nb_features: int, density: float, seed: int) -> sp.csr_matrix:
+    """
+    Generate the (nb_components x nb_features) projection matrix in CSR format
+    Each entry is +/- sqrt(1 / density) / sqrt(nb_components) with probability density / 2 and 0 otherwise
+    The matrix is cached per process so it is only generated once per worker
+    """
+    rng = np.random.default_rng(seed)
+    indptr = [0]
+    indices = []
+    for _ in range(nb_components):
+        nnz = rng.binomial(nb_features, density)
+        indices.append(np.sort(rng.choice(nb_features, size = nnz, replace = False)))
+        indptr.append(indptr[-1] + nnz)
+    indices = np.concatenate(indices)
+    scale = np.sqrt(1 / density) / np.sqrt(nb_components)
+    data = rng.choice([-scale, scale], size = len(indices)).astype(np.float32)
+
+    return sp.csr_matrix((data, indices, np.array(indptr)), shape = (nb_components, nb_features))
@@ -0,0 +1,92 @@
+import os
+import hashlib
+
+import numpy as np
+import ray.cloudpickle as cpickle
+
+from os.path import splitext
+from ray.data import Dataset, DataContext
+from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['streaming_partial_fit', 'checkpoint_file']
+
+TENSOR_COLUMN_NAME = '__value__'
+
+"""
+Streaming of dataset blocks through a single estimator's partial_fit method.
+Used by the decomposition preprocessors to learn one factorization across the whole dataset instead of one per batch.
+The estimator state is checkpointed regularly so long fits can be resumed from the last checkpoint.
+Checkpoints are named after the estimator parameters and batches are streamed in a preserved order so a resumed fit skips exactly the batches already seen.
+"""
+
+def checkpoint_file(file: str, estimator):
+    """
+    Checkpoint file of the fit of an estimator saved to file, a fit with other parameters never resumes from it
+    """
+    if not file:
+        return None
+    params = repr(sorted(estimator.get_params().items()))
+    key = hashlib.blake2b(params.encode(), digest_size = 8).hexdigest()
+    return f'{splitext(file)[0]}_checkpoint_{key}.pkl'
+
+def streaming_partial_fit(
+    estimator,
+    ds: Dataset,
+    nb_epochs: int = 10,
+    batch_size: int = 1024,
+    checkpoint_file: str = None,
+    checkpoint_interval: int = 100,
+):
+    """
+    Fit the estimator by streaming batches of the dataset through estimator.partial_fit over a number of epochs
+
+    If a checkpoint file exists, the estimator and the position reached are loaded from it and the fit is resumed
+    The checkpoint is updated every `checkpoint_interval` batches and at the end of each epoch, then removed once the fit is complete
+    """
+    start_epoch = 0
+    start_batch = 0
+    if checkpoint_file is not None and os.path.isfile(checkpoint_file):
+        estimator, start_epoch, start_batch = _load_checkpoint(checkpoint_file)
+
+    # Batches are skipped by position when resuming, their order must be the same in every pass
+    context = DataContext.get_current()
+    preserve_order = context.execution_options.preserve_order
+    context.execution_options.preserve_order = True
+    try:
+        for epoch in range(start_epoch, nb_epochs):
+            for i, batch in enumerate(ds.iter_batches(batch_size = batch_size, batch_format = 'numpy')):
+                # Skip batches already seen before resuming
+                if epoch == start_epoch and i < start_batch:
+                    continue
+                batch = batch[TENSOR_COLUMN_NAME]
+                batch = _unwrap_ndarray_object_type_if_needed(batch)
+                estimator.partial_fit(batch)
+                if checkpoint_file is not None and (i + 1) % checkpoint_interval == 0:
+                    _save_checkpoint(checkpoint_file, estimator, epoch, i + 1)
+            if checkpoint_file is not None:
+                _save_checkpoint(checkpoint_file, estimator, epoch + 1, 0)
+    finally:
+        context.execution_options.preserve_order = preserve_order
+
+    if checkpoint_file is not None and os.path.isfile(checkpoint_file):
+        os.remove(checkpoint_file)
+
+    return estimator
+
+def _save_checkpoint(file, estimator, epoch, batch):
+    # Write to a temporary file first so an interrupted write never corrupts the last checkpoint
+    tmp_file = f'{file}.tmp'
+    with open(tmp_file, 'wb') as handle:
+        cpickle.dump({
+            'estimator' : estimator,
+            'epoch' : epoch,
+            'batch' : batch
+        }, handle)
+    os.replace(tmp_file, file)
+
+def _load_checkpoint(file):
+    with open(file, 'rb') as handle:
+        ckpt = cpickle.load(handle)
+    return ckpt['estimator'], ckpt['epoch'], ckpt['batch']
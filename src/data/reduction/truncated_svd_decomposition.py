@@ -1,138 +1,85 @@
 
+import ray
 import numpy as np
 import pandas as pd
 
-from tqdm import tqdm
 from typing import List
 from warnings import warn
-from os.path import isfile
 from ray.data import Dataset
-from utils import save_Xy_data, load_Xy_data
-
-from sklearn.utils.extmath import randomized_svd
-from sklearn.decomposition import DictionaryLearning
+from utils import kmers_fingerprint
 
+from ray.data.block import BlockAccessor
+from ray.data.aggregate import AggregateFn
 from ray.data.preprocessor import Preprocessor
+from data.reduction.components_file import load_components, save_components
 from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
 
 TENSOR_COLUMN_NAME = '__value__'
 
 class TensorTruncatedSVDDecomposition(Preprocessor):
     """
-    Custom class for using a mix of TruncatedSVD inspired by sklearn.decomposition.TruncatedSVD and applying a batched strategy inspired by sklearn.decomposition.IncrementalPCA to process batches sequentially.
-    This makes it possible to use the class as a Ray preprocessor in a features reduction strategy.
+    Custom class for using a distributed randomized TruncatedSVD inspired by sklearn.decomposition.TruncatedSVD and sklearn.utils.extmath.randomized_svd as a Ray preprocessor.
+    The range finder is computed over the whole dataset in a few passes : each block is projected on a random sketch, the local QR factorizations are reduced by tall-skinny QR (TSQR) and power iterations refine the basis.
+    Memory usage is bounded by the sketch size (nb_components + nb_oversamples) rather than the number of samples.
     TruncatedSVD performs linear dimensionality reduction by means of truncated singular value decomposition (SVD).
     When it is applied following the TF-IDF normalisation, it becomes a latent semantic analysis (LSA).
     https://scikit-learn.org/stable/modules/decomposition.html#truncated-singular-value-decomposition-and-latent-semantic-analysis
     https://scikit-learn.org/stable/modules/generated/sklearn.decomposition.TruncatedSVD.html#sklearn.decomposition.TruncatedSVD
-    https://scikit-learn.org/stable/modules/generated/sklearn.decomposition.IncrementalPCA.html#sklearn.decomposition.IncrementalPCA
+    https://arxiv.org/abs/0909.4061 (Halko, Martinsson & Tropp, 2011)
+    https://arxiv.org/abs/0808.2664 (Demmel et al., 2008 - TSQR)
     """
-    def __init__(self, features: List[str], nb_components: int = 10000, file: str = ''):
+    def __init__(
+        self,
+        features: List[str],
+        nb_components: int = 10000,
+        file: str = '',
+        nb_iter: int = 2,
+        nb_oversamples: int = 10,
+        seed: int = 42
+    ):
         # Parameters
         self.features = features
         self._nb_features = len(features)
         self._nb_components = nb_components
+        self._nb_iter = nb_iter
+        self._nb_oversamples = nb_oversamples
+        self._seed = seed
         self._file = file
         
     def _fit(self, ds: Dataset) -> Preprocessor:
         """
-        TODO: adapt by using the metho from PySpark SVD
-        https://spark.apache.org/docs/latest/api/python/reference/api/pyspark.mllib.linalg.distributed.SingularValueDecomposition.html?highlight=svd
-
-        Possibilities for parallel TruncatedSVD
-        * sklearn minibatch PCA -> PCA / SVD mostly equivalent
-        * implement parallel based on other library
-        * dask-ml has a truncated svd
-        * tf has a svd function
-        """
-        """
-        Option to implement parallel computation for SVD
-        1- Sparse Dictionnary Learning -> encode data to sparse representation by sample
-        2- Sparse PCA (sparse SVD?) -> construct a PCA from sparsely encoded data
-        It is possible to parallelize batches computation by applying the logic from MiniBatchDictionaryLearning and MiniBatchSparsePCA
+        Randomized range finder with TSQR reduction across blocks
+        1. Y = A * Omega is factorized per block as Y_i = Q_i * R_i and each block keeps R_i along with C_i = Q_i.T * A_i
+        2. Partial results are merged by QR of the stacked R factors [R_1; R_2] = Q' * R (TSQR) and C = Q'_1.T * C_1 + Q'_2.T * C_2
+        3. The merged C is B = Q.T * A for the orthonormal Q of Y = Q * R, Q is never materialized nor R inverted
+        4. Power iterations replace Omega by an orthonormal basis of B.T and repeat 1-3
+        5. The right singular vectors of the small B matrix are the components
         """
-        # Parallel
-        
-        def batch_svd(batch):
-            batch = batch[TENSOR_COLUMN_NAME]
-            batch = _unwrap_ndarray_object_type_if_needed(batch)
-            U, S, V = randomized_svd(
-                batch,
-                n_components = self._nb_components,
-                n_iter = 2,
-                power_iteration_normalizer = 'LU',
-            )
-            return {'V' : V}
-
         components = []
         if self._nb_features > self._nb_components:
-            if isfile(self._file):
-                components = np.array(load_Xy_data(self._file))
-            else:
-                # sampl = ds.random_sample(0.1)
-                # svd = sampl.map_batches(batch_svd, batch_format = 'numpy')
-                svd = ds.map_batches(batch_svd, batch_format = 'numpy')
-                components = svd.limit(self._nb_components).to_pandas()['V']
-                components = _unwrap_ndarray_object_type_if_needed(components)
+            # Components are only reused if fitted on the same vocabulary with the same parameters
+            fingerprint = kmers_fingerprint(self.features)
+            params = {'nb_components' : self._nb_components, 'nb_iter' : self._nb_iter, 'nb_oversamples' : self._nb_oversamples, 'seed' : self._seed}
+            components = load_components(self._file, fingerprint, params)
+            if components is None:
+                sketch_size = min(self._nb_components + self._nb_oversamples, self._nb_features)
+                rng = np.random.default_rng(self._seed)
+                omega = rng.standard_normal((self._nb_features, sketch_size))
 
-                save_Xy_data(components, self._file)
+                for _ in range(self._nb_iter):
+                    B = _sketch_projection(ds, omega)
+                    omega, _ = np.linalg.qr(B.T)
+
+                B = _sketch_projection(ds, omega)
+                U, S, VT = np.linalg.svd(B, full_matrices = False)
+                components = VT[:self._nb_components]
+
+                save_components(components, self._file, fingerprint, params)
 
             self.stats_ = {'components' : components}
         else:
             warn('No features reduction to do because the number of features is already lower than the required number of components')
             self.stats_ = {'components' : False}
-        """
-        # Parallel multiple MiniBatchDictionaryLearning
-        def batch_svd(batch):
-            batch = batch[TENSOR_COLUMN_NAME]
-            batch = _unwrap_ndarray_object_type_if_needed(batch)
-            dict = DictionaryLearning(
-                n_components = self._nb_components,
-                max_iter = 10,
-                transform_algorithm = 'lasso_lars',
-            )
-            dict.fit(batch)
-            return {'dictonnary' : [dict.components_]}
-        components = []
-        if self._nb_features > self._nb_components:
-            if isfile(self._file):
-                components = np.array(load_Xy_data(self._file))
-            else:
-                svd = ds.map_batches(batch_svd, batch_format = 'numpy')
-                print(svd.to_pandas())
-                for row in svd.iter_rows():
-                    components.append(row['dictonnary'])
-                components = np.mean(components, axis = 0)
-                print(components.shape)
-                save_Xy_data(components, self._file)
-        """
-        # Incremental
-        # components = None
-        # singular_values = None
-        # if self._nb_features > self._nb_components:
-        #     for batch in tqdm(ds.iter_batches(batch_format = 'numpy')):
-        #         batch = batch[TENSOR_COLUMN_NAME]
-        #         batch = _unwrap_ndarray_object_type_if_needed(batch)
-        #         if components is not None:
-        #             # Build matrix of previous computations
-        #             batch = np.vstack(
-        #                 (
-        #                     singular_values.reshape((-1, 1)) * components,
-        #                     batch,
-        #                 )
-        #             )
-        #         # U : (1000, 100), S : (100,), V : (100, 1024)
-        #         # S.reshape : (100, 1), S.reshape * components : (100, 1024)
-        #         # batch : (1000, 1024), vstack : (1100, 1024)
-        #         U, Sigma, VT = randomized_svd(
-        #             batch,
-        #             n_components = self._nb_components,
-        #             n_iter = 1,
-        #             power_iteration_normalizer = 'LU',
-        #         )
-        #         components = VT
-        #         singular_values = Sigma
-                
 
         return self
 
@@ -149,7 +96,47 @@ class TensorTruncatedSVDDecomposition(Preprocessor):
         return df
 
     def __repr__(self):
-        return (f"{self.__class__.__name__}(features={self._nb_features!r}, file={self._file!r})")
+        return (f"{self.__class__.__name__}(features={self._nb_features!r}, nb_components={self._nb_components!r}, nb_iter={self._nb_iter!r}, file={self._file!r})")
+
+def _sketch_projection(ds: Dataset, omega: np.ndarray) -> np.ndarray:
+    """
+    One pass over the dataset to compute B = Q.T * A where Y = A * Omega = Q * R
+    Each block is reduced to its R factor and Q.T * A, both of size bounded by the sketch, before the partial results are merged
+    """
+    # Sent once to the object store instead of with every task
+    omega_ref = ray.put(omega)
+
+    def accumulate_block(acc, block):
+        A = BlockAccessor.for_block(block).to_numpy(TENSOR_COLUMN_NAME)
+        A = np.asarray(_unwrap_ndarray_object_type_if_needed(A), dtype = np.float64)
+        if len(A) == 0:
+            return acc
+        Q, R = np.linalg.qr(np.dot(A, ray.get(omega_ref)))
+        return _tsqr_merge(acc, (R, np.dot(Q.T, A)))
+
+    sketch = AggregateFn(
+        init = lambda k: None,
+        accumulate_block = accumulate_block,
+        merge = _tsqr_merge,
+        name = 'sketch'
+    )
+    R, B = ds.aggregate(sketch)['sketch']
+
+    return B
+
+def _tsqr_merge(acc1, acc2):
+    """
+    Merge two partial factorizations (R, Q.T * A) of the sketch by QR of their stacked R factors
+    """
+    if acc1 is None:
+        return acc2
+    if acc2 is None:
+        return acc1
+    R1, C1 = acc1
+    R2, C2 = acc2
+    Q, R = np.linalg.qr(np.vstack((R1, R2)))
+    C = np.dot(Q[:len(R1)].T, C1) + np.dot(Q[len(R1):].T, C2)
+    return (R, C)
 
 def _validate_df(df: pd.DataFrame, column: str, nb_features: int) -> None:
     if len(df.loc[0, column]) != nb_features:
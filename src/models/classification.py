@@ -7,10 +7,17 @@ import pandas as pd
 
 from warnings import warn
 from typing import Dict, List
+from ray.data import ActorPoolStrategy, DataContext
+from ray.util.scheduling_strategies import NodeAffinitySchedulingStrategy
+from models.predictions_sink import PredictionsSink
 from models.sklearn.binary_models import SklearnBinaryModels
 from models.kerasTF.binary_models import KerasTFBinaryModels
 from models.sklearn.multiclass_models import SklearnMulticlassModels
 from models.kerasTF.multiclass_models import KerasTFMulticlassModels
+from models.sklearn.hierarchical_models import SklearnHierarchicalModels
+from models.two_tier_models import TwoTierModels
+from models.preprocessors.tfidf_transformer import TensorTfIdfTransformer
+from data.deduplication import deduplicate, MEMBERS_COLUMN_NAME, MULTIPLICITY_COLUMN_NAME
 
 # CV metrics
 from sklearn.metrics import precision_recall_fscore_support
@@ -23,11 +30,38 @@ TRAINING_DATASET_NAME = 'train'
 VALIDATION_DATASET_NAME = 'validation'
 TEST_DATASET_NAME = 'test'
 TENSOR_COLUMN_NAME = '__value__'
+TIERS = ['linear', 'neural', 'rejected']
 
 class ClassificationMethods():
     """
     Class for classifying sequences from metagenomes in a recursive manner
 
+    ----------
+    Attributes
+    ----------
+
+    hierarchical : boolean
+        If True, the Scikit-learn multiclass taxas whose previous taxa is also classified are trained as one local classifier per label of the previous taxa
+
+    predict_pool_size : int
+        Number of actors keeping the models loaded for predictions, autoscaled if None
+
+    top_k : int
+        Number of most probable labels and their probabilities saved with each prediction, none if 0
+
+    shard_size : int
+        Number of sequences predicted and committed together, a rerun with the same configuration skips the committed shards
+
+    clf_linear : string
+        Linear model (sgd / mnb) scoring all sequences before the neural network multiclass model, only used with neural networks
+        Only the sequences for which its best probability is in the uncertainty band are classified by the neural network
+
+    uncertainty_band : tuple of floats
+        Lower and upper bounds of the linear model best probability for which sequences are forwarded to the neural network
+
+    deduplicate : boolean
+        If True, identical K-mers profiles are predicted once and their prediction is saved with the ids of all the reads they represent
+
     ----------
     Methods
     ----------
@@ -38,6 +72,8 @@ class ClassificationMethods():
 
     fit_predict : wrapper function for calling fit and predict
 
+    load_predictor : function to load the trained models of all taxas in a predictor kept in memory
+
     cross_validation : function to call the cross-validation process
     
     """
@@ -51,7 +87,14 @@ class ClassificationMethods():
         taxa: [str, List] = None,
         batch_size: int = 32,
         training_epochs: int = 100,
-        scaling = False
+        scaling = False,
+        hierarchical: bool = False,
+        predict_pool_size: int = None,
+        top_k: int = 3,
+        shard_size: int = 1000000,
+        clf_linear: str = None,
+        uncertainty_band: tuple = (0.3, 0.9),
+        deduplicate: bool = False
     ):
         # Parameters
         self._taxas = taxa
@@ -63,6 +106,13 @@ class ClassificationMethods():
         self._classifier_multiclass = clf_multiclass
         self._batch_size = batch_size
         self._training_epochs = training_epochs
+        self._hierarchical = hierarchical
+        self._predict_pool_size = predict_pool_size
+        self._top_k = top_k
+        self._shard_size = shard_size
+        self._classifier_linear = clf_linear
+        self._uncertainty_band = uncertainty_band
+        self._deduplicate = deduplicate
         # Init False
         self.is_fitted = False
 
@@ -103,6 +153,17 @@ class ClassificationMethods():
     
         return predictions
 
+    def load_predictor(self):
+        """
+        Public function to load the trained models of all taxas once after validation of parameters
+        Returns a predictor classifying numpy batches of K-mers profiles in the top-down order without a Ray cluster
+        """
+        self._valid_assign_taxas()
+        self._valid_classifier()
+        model_mapping = self._verify_load_model()
+
+        return _CascadePredictor(model_mapping, top_k = self._top_k)
+
     def cross_validation(self, datasets):
         """
         Public function to call the cross-validation method after validation of parameters
@@ -133,36 +194,123 @@ class ClassificationMethods():
     def _fit(self, datasets, tax_map):
         """
         Fit the given model to the training dataset
+        The datasets are scaled once for all taxas and the models of the different taxas are trained concurrently
         """
+        if len(tax_map) == 0:
+            self.is_fitted = True
+            return
+
+        # Features scaling shared by all taxas
+        scaler = TensorTfIdfTransformer(
+            features = self._database_data['kmers'],
+            file = os.path.join(self._outdirs['models_dir'], 'TF-IDF_diag.npz')
+        )
+        scaler.fit(datasets[TRAINING_DATASET_NAME])
+        datasets = {name : scaler.transform(ds).materialize() for name, ds in datasets.items()}
 
-        for taxa, file in tax_map.items():
+        # Labels encoding / class weights per taxa
+        models = {}
+        for taxa in tax_map.keys():
             if taxa in ['domain','bacteria','host']:
-                self._binary_training(datasets, taxa, file)
+                model = self._binary_model(taxa)
             else:
-                self._multiclass_training(datasets, taxa, file)
+                model = self._multiclass_model(taxa)
+            model.preprocess(
+                datasets[TRAINING_DATASET_NAME],
+                self._scaling,
+                scaler = scaler
+            )
+            models[taxa] = model
+
+        if len(models) == 1:
+            for taxa, model in models.items():
+                model.fit(datasets, scaled = True)
+                self._save_model(model, tax_map[taxa])
+        else:
+            # Each task only orchestrates, the trainers it launches reserve their own resources
+            # Tasks run on the driver node so the files exported by the models during training are on its filesystem
+            driver_node = NodeAffinitySchedulingStrategy(ray.get_runtime_context().get_node_id(), soft = False)
+            training = {
+                taxa : _train_taxa.options(scheduling_strategy = driver_node).remote(model, datasets.copy())
+                for taxa, model in models.items()
+            }
+            # Fitted models come back to the driver which saves them on its own filesystem
+            for taxa, model in zip(training.keys(), ray.get(list(training.values()))):
+                self._save_model(model, tax_map[taxa])
         self.is_fitted = True
 
     def _predict(self, ds, model_map):
         """
         Predict the given data using the trained model in a recursive manner over taxas using a top-down approach
-        Returns a mapping of the predictions made by the models for the targeted taxas
+        Each batch flows through the models of all taxas, sequences classified as unknown are masked from the following taxas
+        The prediction actors write the classifications of each batch directly to the sink partitioned by taxa
+        The dataset is predicted in shards of consecutive rows, each shard is committed once all its batches are written
+        The rows order is preserved so the shards are the same between runs, their bounds are saved with the run configuration
+        Deduplicated sequences are predicted once and keep the ids (members) and number (multiplicity) of the reads they represent
+        Returns the PredictionsSink handle to the predictions of the targeted taxas
         """
-        mapping = {}
         if self.is_fitted:
+            sink = self._predictions_sink()
+            cols2drop = [col for col in ds.schema().names if col not in ['id', TENSOR_COLUMN_NAME, MEMBERS_COLUMN_NAME, MULTIPLICITY_COLUMN_NAME]]
+            ds = ds.drop_columns(cols2drop)
+            # Shards are deterministic only if the rows keep the order of the input files
+            context = DataContext.get_current()
+            preserve_order = context.execution_options.preserve_order
+            context.execution_options.preserve_order = True
             try:
-                for taxa, model in model_map.items():
-                    predictions = model.predict_proba(ds) # np.array
-                    ds, predictions, ids = self._remove_unknown(ds, predictions)
-                    file = self._save_dataset(ds, taxa)
-                    mapping[taxa] = {
-                        'classification' : predictions,
-                        'ids' : ids,
-                        'dataset' : file
+                if self._deduplicate:
+                    ds = deduplicate(ds, TENSOR_COLUMN_NAME, f'{sink.path}_deduplication')
+                # Executed once, the shards are split from the materialized blocks
+                ds = ds.materialize()
+                nb_seqs = ds.count()
+                shards = ds.split_at_indices(list(range(self._shard_size, nb_seqs, self._shard_size)))
+                bounds = [_shard_bounds(shard_ds) for shard_ds in shards]
+            finally:
+                context.execution_options.preserve_order = preserve_order
+            nb_committed = sink.start_run({
+                'classifiers' : [clf for clf in [self._classifier_binary, self._classifier_multiclass] if clf is not None],
+                'taxas' : list(model_map.keys()),
+                # Retrained models invalidate the previous predictions
+                'models' : {taxa : os.path.getmtime(self._model_file(taxa)) for taxa in model_map.keys()},
+                'top_k' : self._top_k,
+                'shard_size' : self._shard_size,
+                'deduplicate' : self._deduplicate,
+                'nb_sequences' : nb_seqs,
+                # Committed shards are only kept if the same reads fall in the same shards
+                'shards' : bounds
+            })
+            if nb_committed > 0:
+                print(f'Resuming classification, {nb_committed} shards were already predicted')
+            nb_predicted = dict.fromkeys(model_map.keys(), 0)
+            nb_tiers = {taxa : dict.fromkeys(TIERS, 0) for taxa in model_map.keys()}
+            for shard, shard_ds in enumerate(shards):
+                if sink.is_committed(shard):
+                    continue
+                print(f'Predicting shard {shard + 1} / {len(shards)}')
+                staging = sink.stage_shard(shard)
+                counts = shard_ds.map_batches(
+                    _CascadePredictor,
+                    batch_format = 'numpy',
+                    compute = self._predict_compute(),
+                    fn_constructor_kwargs = {
+                        'models' : model_map,
+                        'sink_path' : staging.path,
+                        'top_k' : self._top_k
                     }
-                return mapping
-            except ValueError:
-                print('Stopping classification prematurelly because there are no more sequences to classify')
-                return mapping
+                )
+                # Only the number of rows written per batch and taxa reach the driver
+                for batch in counts.iter_batches(batch_format = 'pandas'):
+                    batch = batch.groupby('taxa').sum()
+                    for taxa, row in batch.iterrows():
+                        nb_predicted[taxa] += int(row['nb_rows'])
+                        for tier in TIERS:
+                            nb_tiers[taxa][tier] += int(row[f'nb_{tier}'])
+                sink.commit_shard(shard)
+            for taxa, nb_rows in nb_predicted.items():
+                print(f'{nb_rows} reads predicted at the {taxa} level in this run')
+                if self._is_two_tier(taxa):
+                    print(f"{taxa} tiers : {nb_tiers[taxa]['linear']} by {self._classifier_linear}, {nb_tiers[taxa]['neural']} by {self._classifier_multiclass}, {nb_tiers[taxa]['rejected']} rejected")
+            return sink
         else:
             raise ValueError('The model was not fitted yet! Please call either the `fit` or the `fit_predict` method before making predictions')
 
@@ -180,9 +328,9 @@ class ClassificationMethods():
     # Private training secondary functions
     #########################################################################################################
 
-    def _binary_training(self, datasets, taxa, file):
-        print('_binary_training')
-        if self._classifier_binary == 'onesvm':
+    def _binary_model(self, taxa):
+        print('_binary_model')
+        if self._classifier_binary in ['onesvm', 'linearsvm']:
             model = SklearnBinaryModels(
                 self._classifier_binary,
                 self._outdirs['models_dir'],
@@ -190,40 +338,58 @@ class ClassificationMethods():
                 self._training_epochs,
                 taxa,
                 self._database_data['kmers'],
-                self._database_data['csv']
+                self._database_data['csv'],
+                self._database_data.get('labels_catalog')
             )
-        elif self._classifier_binary == 'linearsvm':
-            model = SklearnBinaryModels(
+        else:
+            model = KerasTFBinaryModels(
                 self._classifier_binary,
                 self._outdirs['models_dir'],
                 self._batch_size,
                 self._training_epochs,
                 taxa,
                 self._database_data['kmers'],
-                self._database_data['csv']
+                self._database_data['csv'],
+                self._database_data.get('labels_catalog')
             )
-        else:
-            model = KerasTFBinaryModels(
-                self._classifier_binary,
+        return model
+
+    def _multiclass_model(self, taxa):
+        print('_multiclass_model')
+        if self._is_two_tier(taxa):
+            linear = SklearnMulticlassModels(
+                self._classifier_linear,
                 self._outdirs['models_dir'],
                 self._batch_size,
                 self._training_epochs,
                 taxa,
                 self._database_data['kmers'],
-                self._database_data['csv']
+                self._database_data['csv'],
+                self._database_data.get('labels_catalog')
             )
-        model.preprocess(
-            datasets[TRAINING_DATASET_NAME],
-            self._scaling,
-            os.path.join(self._outdirs['models_dir'], 'TF-IDF_diag.npz')
-        )
-        model.fit(datasets)
-
-        self._save_model(model, file)
-
-    def _multiclass_training(self, datasets, taxa, file):
-        print('_multiclass_training')
-        if self._classifier_multiclass in ['sgd','mnb']:
+            neural = KerasTFMulticlassModels(
+                self._classifier_multiclass,
+                self._outdirs['models_dir'],
+                self._batch_size,
+                self._training_epochs,
+                taxa,
+                self._database_data['kmers'],
+                self._database_data['csv'],
+                self._database_data.get('labels_catalog')
+            )
+            model = TwoTierModels(linear, neural, self._uncertainty_band)
+        elif self._is_hierarchical(taxa):
+            model = SklearnHierarchicalModels(
+                self._classifier_multiclass,
+                self._outdirs['models_dir'],
+                self._batch_size,
+                self._training_epochs,
+                taxa,
+                self._database_data['kmers'],
+                self._database_data['csv'],
+                self._database_data.get('labels_catalog')
+            )
+        elif self._classifier_multiclass in ['sgd','mnb']:
             model = SklearnMulticlassModels(
                 self._classifier_multiclass,
                 self._outdirs['models_dir'],
@@ -231,7 +397,8 @@ class ClassificationMethods():
                 self._training_epochs,
                 taxa,
                 self._database_data['kmers'],
-                self._database_data['csv']
+                self._database_data['csv'],
+                self._database_data.get('labels_catalog')
             )
         else:
             model = KerasTFMulticlassModels(
@@ -241,39 +408,21 @@ class ClassificationMethods():
                 self._training_epochs,
                 taxa,
                 self._database_data['kmers'],
-                self._database_data['csv']
+                self._database_data['csv'],
+                self._database_data.get('labels_catalog')
             )
-        model.preprocess(
-            datasets[TRAINING_DATASET_NAME],
-            self._scaling,
-            os.path.join(self._outdirs['models_dir'], 'TF-IDF_diag.npz')
-        )
-        model.fit(datasets)
-
-        self._save_model(model, file)
+        return model
 
     # Private predicting secondary functions
     #########################################################################################################
 
-    def _remove_unknown(self, ds, predict):
-        ids = []
-        for row in ds.iter_rows():
-            ids.append(row['id'])
-        mapping = pd.DataFrame({
-            'ids' : ids,
-            'predictions' : predict
-        })
-        mapping = mapping[mapping['predictions'] != 'Unknown']
-        ids = mapping['ids']
-        predict = mapping['predictions']
-
-        def remove_unknown(df):
-            df = df[df['id'].isin(ids)]
-            return df
-        
-        ds = ds.map_batches(remove_unknown, batch_format = 'pandas')
-        
-        return ds, predict, ids
+    def _predict_compute(self):
+        """
+        Pool of actors keeping the models of all taxas loaded for the cascade
+        """
+        if self._predict_pool_size is None:
+            return ActorPoolStrategy(min_size = 1)
+        return ActorPoolStrategy(size = self._predict_pool_size)
 
     # Private cross-validation secondary methods
     #########################################################################################################
@@ -367,21 +516,61 @@ class ClassificationMethods():
 
     def _valid_classifier(self):
         if self._classifier_binary is not None:
-            if self._classifier_binary not in ['onesvm','linearsvm','attention','lstm','deeplstm']:
+            if self._classifier_binary not in ['onesvm','linearsvm','attention','lstm','deeplstm','embed_attention']:
                 raise ValueError("""
                                  Invalid classifier option for bacteria extraction!
                                  Models implemented at this moment are :
                                  Classic algorithm : One-class SVM (onesvm) and Linear SVM (linearsvm)
-                                 Neural networks : Attention (attention), LSTM (lstm) and Deep LSTM (deeplstm)
+                                 Neural networks : Attention (attention), LSTM (lstm), Deep LSTM (deeplstm) and Attention on K-mers embeddings (embed_attention)
                                  """)
         if self._classifier_multiclass is not None:
-            if self._classifier_multiclass not in ['sgd','mnb','lstm_attention','cnn','widecnn']:
+            if self._classifier_multiclass not in ['sgd','mnb','lstm_attention','cnn','widecnn','embed_lstm_attention']:
                 raise ValueError("""
                                  Invalid classifier option for bacteria classification!
                                  Models implemented at this moment are :
                                  Classic algorithm : Stochastic Gradient Descent (sgd) and Multinomial Naïve Bayes (mnb)
-                                 Neural networks : Deep hybrid between LSTM and Attention (lstm_attention), CNN (cnn) and Wide CNN (widecnn)
+                                 Neural networks : Deep hybrid between LSTM and Attention (lstm_attention), CNN (cnn), Wide CNN (widecnn) and LSTM with Attention on K-mers embeddings (embed_lstm_attention)
                                  """)
+        if self._classifier_linear is not None:
+            if self._classifier_linear not in ['sgd','mnb']:
+                raise ValueError("""
+                                 Invalid linear classifier option for the two-tier classification!
+                                 Models implemented at this moment are : Stochastic Gradient Descent (sgd) and Multinomial Naïve Bayes (mnb)
+                                 """)
+            lower, upper = self._uncertainty_band
+            if not 0 <= lower <= upper <= 1:
+                raise ValueError(f'Invalid uncertainty band {self._uncertainty_band}, the bounds must be probabilities with lower <= upper')
+
+    def _is_hierarchical(self, taxa):
+        """
+        Hierarchical local classifiers are used for Scikit-learn multiclass models when the previous taxa is classified before
+        """
+        if not self._hierarchical or taxa in ['domain','bacteria','host'] or self._classifier_multiclass not in ['sgd','mnb']:
+            return False
+        taxas = self._database_data['taxas']
+        return taxa in taxas and taxas.index(taxa) + 1 < len(taxas) and taxas[taxas.index(taxa) + 1] in self._taxas
+
+    def _is_two_tier(self, taxa):
+        """
+        Two-tier cascades are used for neural networks multiclass models when a linear classifier is given
+        """
+        if self._classifier_linear is None or taxa in ['domain','bacteria','host']:
+            return False
+        return self._classifier_multiclass in ['lstm_attention','cnn','widecnn','embed_lstm_attention']
+
+    def _model_file(self, taxa):
+        """
+        File of the model trained for a taxa
+        """
+        if taxa in ['domain','bacteria','host']:
+            clf = self._classifier_binary
+        elif self._is_two_tier(taxa):
+            clf = f'{self._classifier_linear}_{self._classifier_multiclass}'
+        elif self._is_hierarchical(taxa):
+            clf = f'{self._classifier_multiclass}_hierarchical'
+        else:
+            clf = self._classifier_multiclass
+        return os.path.join(self._outdirs['models_dir'], f'{clf}_{taxa}.pkl')
 
     def _verify_model_trained(self):
         """
@@ -391,11 +580,7 @@ class ClassificationMethods():
         """
         mapping = {}
         for taxa in self._taxas:
-            if taxa in ['domain','bacteria','host']:
-                clf = self._classifier_binary
-            else:
-                clf = self._classifier_multiclass
-            file = os.path.join(self._outdirs['models_dir'], f'{clf}_{taxa}.pkl')
+            file = self._model_file(taxa)
             if not os.path.isfile(file):
                 mapping[taxa] = file
         
@@ -409,15 +594,14 @@ class ClassificationMethods():
         """
         mapping = {}
         for taxa in self._taxas:
-            if taxa in ['domain','bacteria','host']:
-                clf = self._classifier_binary
-            else:
-                clf = self._classifier_multiclass
-            file = os.path.join(self._outdirs['models_dir'], f'{clf}_{taxa}.pkl')
+            file = self._model_file(taxa)
             if not os.path.isfile(file):
                 raise ValueError(f'No model found for {taxa}')
             else:
                 mapping[taxa] = self._load_model(file, taxa)
+                mapping[taxa].predict_pool_size = self._predict_pool_size
+                if self._is_two_tier(taxa):
+                    mapping[taxa].band = self._uncertainty_band
         return mapping
     
     def _load_model(self, file, taxa):
@@ -436,16 +620,97 @@ class ClassificationMethods():
         with open(file, 'wb') as handle:
             cloudpickle.dump(model, handle)
     
-    def _save_dataset(self, ds, taxa):
+    def _predictions_sink(self):
         """
-        Save a dataset to disk and return the filename
+        Sink of the classifications of all taxas, previous predictions with the same classifiers are resumed or overwritten
         """
-        if taxa in ['domain','bacteria','host']:
-            model = self._classifier_binary
-        else:
-            model = self._classifier_multiclass
-        file = os.path.join(self._outdirs['results_dir'], f'data_classified_{model}_{taxa}')
+        models = [clf for clf in [self._classifier_binary, self._classifier_multiclass] if clf is not None]
+        path = os.path.join(self._outdirs['results_dir'], f"data_classified_{'_'.join(models)}")
+
+        return PredictionsSink(path)
 
-        ds.write_parquet(file)
-        return file
-    
\ No newline at end of file
+def _shard_bounds(shard_ds):
+    """
+    First id, last id and number of rows of a shard, identifying the reads it holds in the run configuration
+    """
+    first, last, nb_rows = None, None, 0
+    # Only the ids reach the driver
+    for batch in shard_ds.select_columns(['id']).iter_batches(batch_format = 'numpy', batch_size = None):
+        ids = batch['id']
+        if len(ids) == 0:
+            continue
+        if first is None:
+            first = str(ids[0])
+        last = str(ids[-1])
+        nb_rows += len(ids)
+    return [first, last, nb_rows]
+
+@ray.remote(num_cpus = 0)
+def _train_taxa(model, datasets):
+    """
+    Train the model of one taxa on the already scaled datasets
+    Returns the fitted model
+    """
+    model.fit(datasets, scaled = True)
+    return model
+
+class _CascadePredictor():
+    """
+    Callable class classifying each batch through the models of all taxas in the top-down order
+    Rows classified as unknown at one taxa are not given to the models of the following taxas
+    The predictions of each taxa are written to the sink and only the number of rows written is returned
+    """
+    def __init__(self, models, sink_path = None, top_k = 0):
+        self._models = models
+        self._top_k = top_k
+        self._sink = PredictionsSink(sink_path) if sink_path is not None else None
+        self._predictors = {taxa : model.batch_predictor(top_k = top_k) for taxa, model in models.items()}
+
+    @property
+    def taxas(self):
+        return list(self._predictors.keys())
+
+    def cascade(self, batch):
+        """
+        Yields the taxa, the indices of the rows given to its model and the decision of the model for each taxa in the top-down order
+        """
+        nb_rows = len(batch['id'])
+        known = np.ones(nb_rows, dtype = bool)
+        classified = {}
+        for taxa, predictor in self._predictors.items():
+            labels = np.full(nb_rows, None, dtype = object)
+            indices = np.flatnonzero(known)
+            decision = {}
+            if len(indices) > 0:
+                rows = {col : values[known] for col, values in batch.items()}
+                # Hierarchical models route the rows by the label of the previous taxa
+                parent_taxa = getattr(self._models[taxa], 'parent_taxa', None)
+                if parent_taxa in classified:
+                    rows[parent_taxa] = classified[parent_taxa][known]
+                decision = predictor(rows)
+                labels[known] = decision['label']
+            classified[taxa] = labels
+            known &= (labels != None) & (labels != 'Unknown')
+            yield taxa, indices, decision
+
+    def __call__(self, batch):
+        written = {'taxa' : [], 'nb_rows' : []}
+        written.update({f'nb_{tier}' : [] for tier in TIERS})
+        for taxa, indices, decision in self.cascade(batch):
+            nb_written = 0
+            if len(indices) > 0:
+                nb_written = self._sink.write_batch(
+                    taxa,
+                    batch['id'][indices],
+                    decision['label'],
+                    decision.get('top_labels'),
+                    decision.get('top_probabilities'),
+                    batch[MULTIPLICITY_COLUMN_NAME][indices] if MULTIPLICITY_COLUMN_NAME in batch else None,
+                    batch[MEMBERS_COLUMN_NAME][indices] if MEMBERS_COLUMN_NAME in batch else None
+                )
+            written['taxa'].append(taxa)
+            written['nb_rows'].append(nb_written)
+            # Number of unique sequences decided by each tier of two-tier models
+            for tier in TIERS:
+                written[f'nb_{tier}'].append(decision.get('tiers', {}).get(tier, 0))
+        return {col : np.array(values) for col, values in written.items()}
@@ -0,0 +1,253 @@
+import io
+import os
+import json
+import queue
+import threading
+import socketserver
+
+import numpy as np
+import pandas as pd
+
+from time import time
+from Bio import SeqIO
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# K-mers extraction
+from data.extraction.given_kmers_vectorizer import GivenKmersVectorizer
+
+TENSOR_COLUMN_NAME = '__value__'
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['ClassificationService', 'serve']
+
+"""
+Long-lived local classification service keeping the K-mers vocabulary, scalers and models of all taxas loaded.
+Requests are served over localhost HTTP or a Unix socket :
+    GET /health : taxas classified by the service
+    POST /classify : FASTA sequences (text body) or pre-extracted profiles (JSON body {"id" : [...], "profile" : [[...]]})
+        Returns the classification of each read as JSON {"predictions" : [{"id" : ..., taxa : label, ...}]}
+Concurrent requests are grouped in micro-batches before going through the models.
+"""
+
+class ClassificationService():
+    """
+    ----------
+    Attributes
+    ----------
+
+    kmers : list of strings
+        K-mers vocabulary of the profiles given to the models
+
+    taxas : list of strings
+        Taxas classified in the top-down order
+
+    max_batch_size : int
+        Maximum number of reads grouped in one micro-batch
+
+    max_wait : float
+        Maximum time in seconds a request waits for other requests to fill its micro-batch
+
+    ----------
+    Methods
+    ----------
+
+    classify_fasta : classify the reads of a FASTA formatted string
+
+    classify_profiles : classify pre-extracted K-mers profiles
+
+    close : stop the micro-batching worker
+    """
+    def __init__(
+        self,
+        classifier,
+        kmers,
+        max_batch_size = 4096,
+        max_wait = 0.01
+    ):
+        self.kmers = kmers
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        # Models are loaded once and stay resident
+        self._predictor = classifier.load_predictor()
+        self.taxas = self._predictor.taxas
+        self._vectorizer = GivenKmersVectorizer(
+            k = len(kmers[0]),
+            column = 'sequence',
+            tokens = kmers
+        )
+        # Micro-batching worker
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target = self._batching_loop, daemon = True)
+        self._worker.start()
+
+    def classify_fasta(self, fasta):
+        """
+        Extract the K-mers profiles of the reads in a FASTA string before classifying them
+        """
+        data = {'id' : [], 'sequence' : []}
+        for record in SeqIO.parse(io.StringIO(fasta), 'fasta'):
+            data['id'].append(record.id)
+            data['sequence'].append(str(record.seq).upper())
+        if len(data['id']) == 0:
+            return []
+        df = self._vectorizer.transform_batch(pd.DataFrame(data))
+        return self.classify_profiles(df['id'].to_numpy(), np.stack(df[TENSOR_COLUMN_NAME].to_numpy()))
+
+    def classify_profiles(self, ids, profiles):
+        """
+        Classify K-mers profiles extracted with the same vocabulary as the models
+        """
+        ids = np.asarray(ids, dtype = object)
+        try:
+            profiles = np.asarray(profiles, dtype = np.float64)
+        except (TypeError, ValueError):
+            raise ValueError('Profiles must be rows of numerical K-mers counts')
+        if profiles.ndim != 2 or profiles.shape[1] != len(self.kmers):
+            raise ValueError(f'Profiles must have {len(self.kmers)} K-mers columns, got shape {profiles.shape}')
+        # Checked before grouping so a malformed request cannot fail the others of its micro-batch
+        if not np.all(np.isfinite(profiles)) or np.any(profiles < 0):
+            raise ValueError('Profiles must hold finite non-negative K-mers counts')
+        if len(ids) != len(profiles):
+            raise ValueError(f'Got {len(ids)} ids for {len(profiles)} profiles')
+        if len(ids) == 0:
+            return []
+        future = Future()
+        self._queue.put((ids, profiles, future))
+        return future.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
+
+    def _batching_loop(self):
+        """
+        Group the requests waiting in the queue until the micro-batch is full or the first request waited max_wait
+        """
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            requests = [request]
+            nb_rows = len(request[0])
+            deadline = time() + self.max_wait
+            while nb_rows < self.max_batch_size:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._queue.get(timeout = remaining)
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._predict_requests(requests)
+                    return
+                requests.append(request)
+                nb_rows += len(request[0])
+            self._predict_requests(requests)
+
+    def _predict_requests(self, requests):
+        try:
+            ids = np.concatenate([ids for ids, _, _ in requests])
+            profiles = np.concatenate([profiles for _, profiles, _ in requests])
+            predictions = self._classify(ids, profiles)
+        except Exception as error:
+            if len(requests) == 1:
+                requests[0][2].set_exception(error)
+            else:
+                # Requests are predicted again one by one so only the failing ones get the error
+                for request in requests:
+                    self._predict_requests([request])
+            return
+        start = 0
+        for ids, _, future in requests:
+            future.set_result(predictions[start:start + len(ids)])
+            start += len(ids)
+
+    def _classify(self, ids, profiles):
+        predictions = [{'id' : str(id)} for id in ids]
+        batch = {'id' : ids, TENSOR_COLUMN_NAME : profiles}
+        for taxa, indices, decision in self._predictor.cascade(batch):
+            for pos, row in enumerate(indices):
+                predictions[row][taxa] = _to_json(decision['label'][pos])
+                if 'top_labels' in decision:
+                    predictions[row][f'{taxa}_top'] = [
+                        {'label' : _to_json(label), 'probability' : _to_json(proba)}
+                        for label, proba in zip(decision['top_labels'][pos], decision['top_probabilities'][pos])
+                        if label is not None
+                    ]
+        return predictions
+
+def _to_json(value):
+    if isinstance(value, (np.floating, float)):
+        return None if np.isnan(value) else float(value)
+    if value is None:
+        return None
+    return str(value)
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    """
+    HTTP requests handler of the classification service, each request is handled in its own thread
+    """
+    def do_GET(self):
+        if self.path.rstrip('/') == '/health':
+            self._reply(200, {'status' : 'ok', 'taxas' : self.server.service.taxas})
+        else:
+            self._reply(404, {'error' : f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/classify':
+            self._reply(404, {'error' : f'Unknown path {self.path}'})
+            return
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode()
+        try:
+            if 'json' in self.headers.get('Content-Type', ''):
+                data = json.loads(body)
+                predictions = self.server.service.classify_profiles(data['id'], data['profile'])
+            else:
+                predictions = self.server.service.classify_fasta(body)
+        except (ValueError, KeyError) as error:
+            self._reply(400, {'error' : str(error)})
+            return
+        except Exception as error:
+            self._reply(500, {'error' : str(error)})
+            return
+        self._reply(200, {'predictions' : predictions})
+
+    def _reply(self, status, content):
+        content = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def address_string(self):
+        # Unix sockets have no client address
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def serve(service, host = '127.0.0.1', port = 8765, socket_file = None):
+    """
+    Serve the classification service until interrupted, on a Unix socket if socket_file is given or on localhost HTTP otherwise
+    """
+    if socket_file is not None:
+        server = _UnixHTTPServer(str(socket_file), _ServiceHandler)
+        address = socket_file
+    else:
+        server = ThreadingHTTPServer((host, port), _ServiceHandler)
+        address = f'http://{host}:{port}'
+    server.service = service
+    print(f'Classification service of {service.taxas} listening on {address}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        if socket_file is not None and os.path.exists(socket_file):
+            os.remove(socket_file)
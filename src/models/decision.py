@@ -0,0 +1,73 @@
+import numpy as np
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['argmax_decision', 'threshold_decision', 'band_decision', 'top_k_decision', 'labels_decoder', 'decode_labels']
+
+"""
+Vectorized decisions applied on whole batches of predictions inside the prediction map_batches.
+Decisions return the encoded labels, -1 for sequences classified as unknown.
+Decoding is a single np.take on an array of labels indexed by their code.
+"""
+
+def argmax_decision(probabilities):
+    """
+    Code of the class with the highest probability
+    """
+    return np.argmax(np.asarray(probabilities), axis = 1).astype(np.int32)
+
+def threshold_decision(probabilities, threshold):
+    """
+    Code of the class with the highest probability, -1 if this probability is under the threshold
+    """
+    probabilities = np.asarray(probabilities)
+    best = np.argmax(probabilities, axis = 1)
+    best_proba = np.take_along_axis(probabilities, best[:, None], axis = 1)[:, 0]
+    return np.where(best_proba < threshold, -1, best).astype(np.int32)
+
+def band_decision(probabilities, threshold):
+    """
+    Binary decision of a single probability output
+    1 over the upper band, 0 under the lower band and -1 in between
+    """
+    probabilities = np.ravel(probabilities)
+    lower_threshold = 0.5 - (threshold * 0.5)
+    upper_threshold = 0.5 + (threshold * 0.5)
+    predictions = np.full(len(probabilities), -1, dtype = np.int32)
+    predictions[probabilities >= upper_threshold] = 1
+    predictions[probabilities <= lower_threshold] = 0
+    return predictions
+
+def top_k_decision(probabilities, k):
+    """
+    Codes and probabilities of the k most probable classes in decreasing order
+    Padded with the code -1 and nan probabilities if there are less than k classes
+    """
+    probabilities = np.asarray(probabilities)
+    nb_rows, nb_classes = probabilities.shape
+    top_codes = np.full((nb_rows, k), -1, dtype = np.int32)
+    top_proba = np.full((nb_rows, k), np.nan, dtype = np.float64)
+    nb_top = min(k, nb_classes)
+    if nb_top > 0 and nb_rows > 0:
+        top = np.argpartition(-probabilities, nb_top - 1, axis = 1)[:, :nb_top]
+        proba = np.take_along_axis(probabilities, top, axis = 1)
+        order = np.argsort(-proba, axis = 1)
+        top_codes[:, :nb_top] = np.take_along_axis(top, order, axis = 1)
+        top_proba[:, :nb_top] = np.take_along_axis(proba, order, axis = 1)
+    return top_codes, top_proba
+
+def labels_decoder(labels_map):
+    """
+    Array of the labels indexed by their code, the code -1 is the last element
+    """
+    codes = np.array(list(labels_map.values()), dtype = np.int64)
+    decoder = np.full(max(int(codes.max()), 0) + 2, None, dtype = object)
+    for label, code in labels_map.items():
+        decoder[code] = label
+    return decoder
+
+def decode_labels(predictions, decoder):
+    """
+    Decoded labels of an array of codes
+    """
+    return np.take(decoder, np.asarray(predictions, dtype = np.int64))
@@ -16,20 +16,35 @@ LABELS_COLUMN_NAME = 'labels'
 class ModelLabelEncoder(Preprocessor):
     """
     Custom implementation of Ray's LabelEncoder to set column name as it encodes labels.
+    Labels are encoded as int32 codes to be used directly with sparse categorical losses.
+    If a labels catalog is given for the taxa, the labels codes are taken from it instead of scanning the dataset.
     """
-    def __init__(self, label_column: str):
+    def __init__(self, label_column: str, catalog: Optional[Dict] = None):
         self.label_column = label_column
+        self._catalog = catalog
 
     def _fit(self, dataset: Dataset) -> Preprocessor:
-        self.stats_ = _get_unique_value_indices(dataset, [self.label_column])
+        if self._catalog is not None:
+            self.stats_ = OrderedDict()
+            self.stats_[f"unique_values({self.label_column})"] = dict(self._catalog['codes'])
+        else:
+            self.stats_ = _get_unique_value_indices(dataset, [self.label_column])
+        # Labels ordered by their code so the position of a label is its code, built once for all batches
+        values = self.stats_[f"unique_values({self.label_column})"]
+        self.stats_[f"categories({self.label_column})"] = pd.Index(sorted(values.keys(), key = values.get))
         return self
 
     def _transform_pandas(self, df: pd.DataFrame):
-        def column_label_encoder(s: pd.Series):
-            s_values = self.stats_[f"unique_values({s.name})"]
-            return s.map(s_values)
-
-        df[self.label_column] = df[self.label_column].transform(column_label_encoder)
+        categories = self.stats_.get(f"categories({self.label_column})")
+        # Encoders saved before the categories were kept at fit
+        if categories is None:
+            values = self.stats_[f"unique_values({self.label_column})"]
+            categories = pd.Index(sorted(values.keys(), key = values.get))
+            self.stats_[f"categories({self.label_column})"] = categories
+
+        # Single vectorized lookup, labels absent from the mapping are encoded as -1
+        codes = categories.get_indexer(df[self.label_column])
+        df[self.label_column] = codes.astype(np.int32)
         df = df.rename(columns = {self.label_column : LABELS_COLUMN_NAME})
 
         return df
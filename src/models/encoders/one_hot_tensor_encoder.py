@@ -32,15 +32,13 @@ class OneHotTensorEncoder(Preprocessor):
         values = self.stats_[f"unique_values({self.column})"]
         nb_unique = len(values.keys())
 
-        def tensor_col_encoding(label, nb_unique):
-            tensor = np.zeros(nb_unique, dtype = np.int32)
-            
-            if label >= 0:
-                tensor[label] = 1
-            
-            return tensor
+        # Vectorized one-hot encoding, negative labels (unknown) are left as zeros
+        labels = df[self.column].to_numpy(dtype = np.int64)
+        known = labels >= 0
+        tensor = np.zeros((len(labels), nb_unique), dtype = np.int32)
+        tensor[np.flatnonzero(known), labels[known]] = 1
 
-        df = df.assign(labels = lambda x: TensorArray([tensor_col_encoding(x.loc[ind,self.column], nb_unique) for ind in df.index]))
+        df = df.assign(labels = TensorArray(tensor))
 
         return df
 
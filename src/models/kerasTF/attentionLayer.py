@@ -95,8 +95,9 @@ class AttentionWeightedAverage(Layer):
         ai = K.exp(logits - K.max(logits, axis=-1, keepdims=True))
 
         # masked timesteps have zero weight
+        # cast to the compute dtype, half precision under mixed precision policies
         if mask is not None:
-            mask = K.cast(mask, K.floatx())
+            mask = K.cast(mask, ai.dtype)
             ai = ai * mask
         att_weights = ai / (K.sum(ai, axis=1, keepdims=True) + K.epsilon())
         weighted_input = x * K.expand_dims(att_weights)
@@ -8,7 +8,6 @@ import pandas as pd
 from ray.data.preprocessors import LabelEncoder, Chain
 from models.encoders.model_label_encoder import ModelLabelEncoder
 from models.preprocessors.min_max_scaler import TensorMinMaxScaler
-from models.encoders.one_hot_tensor_encoder import OneHotTensorEncoder
 from models.preprocessors.tfidf_transformer import TensorTfIdfTransformer
 
 # Parent class / models
@@ -30,6 +29,7 @@ from ray.air.config import RunConfig
 # Predicting
 from ray.train.tensorflow import TensorflowPredictor
 from ray.train.batch_predictor import BatchPredictor
+from models.decision import band_decision
 
 __author__ = 'Nicolas de Montigny'
 
@@ -82,7 +82,8 @@ class KerasTFBinaryModels(KerasTFModels):
         training_epochs,
         taxa,
         kmers_list,
-        csv
+        csv,
+        catalog = None
     ):
         super().__init__(
             classifier,
@@ -91,7 +92,8 @@ class KerasTFBinaryModels(KerasTFModels):
             training_epochs,
             taxa,
             kmers_list,
-            csv
+            csv,
+            catalog
         )
         self._nb_classes = 2
 
@@ -101,33 +103,11 @@ class KerasTFBinaryModels(KerasTFModels):
             print('Training bacterial / host classifier based on Shallow LSTM Neural Network')
         elif self.classifier == 'deeplstm':
             print('Training bacterial / host classifier based on Deep LSTM Neural Network')
+        elif self.classifier == 'embed_attention':
+            print('Training bacterial / host classifier based on Attention Weighted Neural Network on K-mers embeddings')
         
     # Model predicting
     #########################################################################################################
     
-    def _get_abs_pred(self, predictions):
-        print('_get_abs_pred')
-        return np.round(np.ravel(predictions))
-        # predict = pd.DataFrame({
-        #     'proba': np.ravel(predictions),
-        #     'predicted_label' : np.full(len(predictions), -1)
-        # })
-        # predict.loc[predict['proba'] > 0.5, 'predicted_label'] = 1
-        # predict.loc[predict['proba'] < 0.5, 'predicted_label'] = 0
-
-        # return predict
-
     def _get_threshold_pred(self, predictions, threshold):
-        print('_get_threshold_pred')
-        lower_threshold = 0.5 - (threshold * 0.5)
-        upper_threshold = 0.5 + (threshold * 0.5)
-        
-        predict = pd.DataFrame({
-            'proba': np.ravel(predictions),
-            'label' : np.full(len(predictions), -1)
-        })
-
-        predict.loc[predict['proba'] >= upper_threshold, 'label'] = 1
-        predict.loc[predict['proba'] <= lower_threshold, 'label'] = 0
-        
-        return predict['label'].to_numpy(dtype = np.int32)
\ No newline at end of file
+        return band_decision(predictions, threshold)
@@ -7,6 +7,7 @@ from keras.layers import Dense, Input, LSTM, Embedding, Dropout, Conv1D, Conv2D,
 
 from tensorflow.keras import mixed_precision
 from models.kerasTF.attentionLayer import AttentionWeightedAverage
+from models.kerasTF.kmersEmbeddingLayer import KmersEmbedding
 
 if len(tf.config.list_physical_devices('GPU')) > 0:
     mixed_precision.set_global_policy('mixed_float16')
@@ -15,7 +16,10 @@ else:
 
 __author__ = "Nicolas de Montigny"
 
-__all__ = ['build_attention','build_LSTM','build_deepLSTM','build_LSTM_attention','build_CNN','build_wideCNN']
+__all__ = ['build_attention','build_LSTM','build_deepLSTM','build_LSTM_attention','build_CNN','build_wideCNN','build_embed_attention','build_embed_LSTM_attention']
+
+# Maximum number of K-mers ids given to the embedding models for each sequence
+MAX_TOKENS = 512
 
 # Self-aware binary classifier
 def build_attention(nb_features):
@@ -187,3 +191,50 @@ def build_wideCNN(nb_features, nb_classes):
     model.compile(loss='sparse_categorical_crossentropy', optimizer='adam', metrics=['accuracy'], jit_compile = True)
 
     return model
+
+# Self-aware binary classifier on K-mers embeddings
+def build_embed_attention(nb_features, max_tokens = MAX_TOKENS):
+    """
+    Function adapted from build_attention to embed the ids of the K-mers present in each profile
+    instead of reading the whole profile as a sequence of nb_features scalars
+    """
+    inputs = Input(shape = (nb_features,))
+    x = KmersEmbedding(nb_features, 128, max_tokens, mask_zero = True)(inputs)
+
+    x = LSTM(128, return_sequences = True, dropout = 0.1)(x)
+    x = LSTM(128, return_sequences = True, dropout = 0.1)(x)
+    x = AttentionWeightedAverage()(x)
+
+    x = Dense(128, activation = "relu")(x)
+    x = Dropout(0.1)(x)
+    x = Dense(1)(x)
+    x = Activation(activation = "sigmoid", dtype = 'float32')(x)
+
+    model = Model(inputs = inputs, outputs = x)
+    model.compile(loss = 'binary_crossentropy', optimizer = 'adam', metrics = ['accuracy'], jit_compile = True)
+
+    return model
+
+# Recurrent self-aware multiclass classifier on K-mers embeddings
+def build_embed_LSTM_attention(nb_features, nb_classes, max_tokens = MAX_TOKENS):
+    """
+    Function adapted in keras from module DeepMicrobes/models/embed_lstm_attention.py and
+    default values for layers in script DeepMicrobes/models/define_flags.py of
+    DeepMicrobes package [Liang et al. 2020]
+    https://github.com/MicrobeLab/DeepMicrobes/blob/master/models/embed_lstm_attention.py
+    The ids of the K-mers present in each profile are embedded as in the original model
+    """
+
+    inputs = Input(shape = (nb_features,))
+    net = KmersEmbedding(nb_features, 100, max_tokens, mask_zero = True)(inputs)
+    net = Bidirectional(LSTM(300, return_sequences=True))(net)
+    net = AttentionWeightedAverage()(net)
+    # MLP
+    net = Dense(3000, activation = 'relu')(net)
+    net = Dropout(0.2)(net)
+    net = Dense(nb_classes)(net)
+    outputs = Activation('softmax', dtype = 'float32')(net)
+    model = Model(inputs = inputs, outputs = outputs)
+    model.compile(loss='sparse_categorical_crossentropy', optimizer='adam', metrics=['accuracy'], jit_compile = True)
+
+    return model
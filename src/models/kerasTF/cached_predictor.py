@@ -0,0 +1,67 @@
+import numpy as np
+import tensorflow as tf
+
+from models.kerasTF.attentionLayer import AttentionWeightedAverage
+from models.kerasTF.kmersEmbeddingLayer import KmersEmbedding
+from ray.train.tensorflow import TensorflowPredictor, TensorflowCheckpoint
+from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
+
+TENSOR_COLUMN_NAME = '__value__'
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['KerasCachedPredictor']
+
+class KerasCachedPredictor():
+    """
+    Callable class to predict probabilities with ray.data.Dataset.map_batches using an ActorPoolStrategy
+    The exported model is loaded once when the actor starts and stays resident for all the batches it predicts
+
+    ----------
+    Attributes
+    ----------
+
+    checkpoints : string or list of string
+        Path to the exported Keras SavedModel, predicted with one forward pass per batch
+        Models trained before the export hold a list of Tensorflow checkpoints directories, their predictions are averaged
+
+    model_definition : callable
+        Function building the Keras model to load the weights into
+
+    nb_features : int
+        Number of features used for the warm-up prediction
+
+    warmup : boolean
+        Predict one empty row when the actor starts so graph tracing is done before the first batch
+    """
+    def __init__(self, checkpoints, model_definition, nb_features, warmup = True):
+        self._model = None
+        self._predictors = []
+        if isinstance(checkpoints, str):
+            self._model = tf.keras.models.load_model(
+                checkpoints,
+                custom_objects = {
+                    'AttentionWeightedAverage' : AttentionWeightedAverage,
+                    'KmersEmbedding' : KmersEmbedding
+                },
+                compile = False
+            )
+            checkpoints = []
+        for ckpt in checkpoints:
+            ckpt = TensorflowCheckpoint.from_directory(ckpt)
+            self._predictors.append(TensorflowPredictor.from_checkpoint(ckpt, model_definition = model_definition))
+        if warmup:
+            self._predict(np.zeros((1, nb_features), dtype = np.float32))
+
+    def __call__(self, batch):
+        X = _unwrap_ndarray_object_type_if_needed(batch[TENSOR_COLUMN_NAME])
+        return {'predictions' : self._predict(X)}
+
+    def _predict(self, X):
+        if self._model is not None:
+            return np.asarray(self._model.predict_on_batch(X), dtype = np.float64)
+        pred = None
+        for predictor in self._predictors:
+            proba = np.asarray(predictor.predict(X)['predictions'], dtype = np.float64)
+            pred = proba if pred is None else pred + proba
+        return pred / len(self._predictors)
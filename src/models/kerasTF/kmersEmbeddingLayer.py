@@ -0,0 +1,86 @@
+import tensorflow as tf
+
+from tensorflow.keras.layers import Layer
+
+__author__ = "Nicolas de Montigny"
+
+__all__ = ['KmersEmbedding']
+
+class KmersEmbedding(Layer):
+    """
+    Embedding of the K-mers present in a profile instead of the whole profile as a sequence of scalars
+
+    The ids of the K-mers with a non-null value are extracted from the (batch, nb_features) profiles
+    in the order of the vocabulary and padded to max_tokens with the id 0.
+    Each id is embedded and scaled by its value in the profile to keep the TF-IDF information.
+    Following layers process at most max_tokens timesteps, bounded by the length of the reads rather than the size of the vocabulary.
+
+    ----------
+    Attributes
+    ----------
+
+    nb_features : int
+        Size of the K-mers vocabulary
+
+    output_dim : int
+        Dimension of the embedding of each K-mer
+
+    max_tokens : int
+        Maximum number of K-mers kept per profile, the first ones in the vocabulary order are kept when there are more
+
+    mask_zero : bool
+        Whether padding timesteps are masked for the following layers supporting masking
+    """
+
+    def __init__(self, nb_features, output_dim, max_tokens = 512, mask_zero = False, **kwargs):
+        # Vocabulary positions are not exactly representable in half precision
+        kwargs.setdefault('dtype', 'float32')
+        super(KmersEmbedding, self).__init__(**kwargs)
+        self.nb_features = nb_features
+        self.output_dim = output_dim
+        self.max_tokens = min(max_tokens, nb_features)
+        self.mask_zero = mask_zero
+        self.supports_masking = mask_zero
+
+    def get_config(self):
+        config = super(KmersEmbedding, self).get_config()
+        config.update({
+            'nb_features': self.nb_features,
+            'output_dim': self.output_dim,
+            'max_tokens': self.max_tokens,
+            'mask_zero': self.mask_zero
+        })
+        return config
+
+    def build(self, input_shape):
+        # Id 0 is the padding
+        self.embeddings = self.add_weight(
+            shape = (self.nb_features + 1, self.output_dim),
+            name = 'embeddings',
+            initializer = 'uniform'
+        )
+        super(KmersEmbedding, self).build(input_shape)
+
+    def call(self, inputs):
+        inputs = tf.reshape(tf.cast(inputs, tf.float32), (-1, self.nb_features))
+        # Highest scores for the first present K-mers of the vocabulary
+        positions = tf.range(self.nb_features, 0, -1, dtype = tf.float32)
+        scores = tf.where(inputs > 0, positions, tf.zeros_like(inputs))
+        scores, indices = tf.math.top_k(scores, k = self.max_tokens, sorted = True)
+        present = scores > 0
+
+        tokens = tf.where(present, indices + 1, tf.zeros_like(indices))
+        values = tf.where(present, tf.gather(inputs, indices, batch_dims = 1), tf.zeros_like(scores))
+
+        return tf.gather(self.embeddings, tokens) * tf.expand_dims(values, -1)
+
+    def compute_mask(self, inputs, mask = None):
+        if not self.mask_zero:
+            return None
+        # Present K-mers are packed before the padding
+        inputs = tf.reshape(inputs, (-1, self.nb_features))
+        nb_tokens = tf.math.count_nonzero(inputs > 0, axis = 1, dtype = tf.int32)
+        return tf.range(self.max_tokens)[None, :] < nb_tokens[:, None]
+
+    def compute_output_shape(self, input_shape):
+        return (input_shape[0], self.max_tokens, self.output_dim)
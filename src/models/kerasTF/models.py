@@ -12,7 +12,6 @@ from abc import ABC, abstractmethod
 # Preprocessing
 from ray.data.preprocessors import LabelEncoder, Chain
 from models.encoders.model_label_encoder import ModelLabelEncoder
-from models.encoders.one_hot_tensor_encoder import OneHotTensorEncoder
 from models.preprocessors.tfidf_transformer import TensorTfIdfTransformer
 
 # Parent class / models
@@ -28,12 +27,13 @@ from keras.callbacks import CSVLogger, ModelCheckpoint, EarlyStopping
 from ray.train.tensorflow import TensorflowTrainer, TensorflowCheckpoint
 
 # Tuning
-from ray.air.config import RunConfig
+from ray.air.config import RunConfig, CheckpointConfig
 
 # Predicting
 from tensorflow.keras.models import load_model
 from ray.train.tensorflow import TensorflowPredictor
 from ray.train.batch_predictor import BatchPredictor
+from models.kerasTF.cached_predictor import KerasCachedPredictor
 
 # Data
 from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
@@ -64,6 +64,15 @@ class KerasTFModels(ModelsUtils, ABC):
     nb_classes : int
         Number of classes for learning
 
+    checkpoints_average : int
+        Number of best checkpoints by validation loss kept during training and averaged into the exported model, defaults to the best one only
+
+    shuffle_buffer : int
+        Number of rows shuffled together by each training worker at every epoch, defaults to no shuffling
+
+    cache_data : bool
+        Whether each training worker caches its input pipeline on disk in the model directory after the first epoch, defaults to False
+
     ----------
     Methods
     ----------
@@ -90,7 +99,8 @@ class KerasTFModels(ModelsUtils, ABC):
         training_epochs,
         taxa,
         kmers_list,
-        csv
+        csv,
+        catalog = None
     ):
         super().__init__(
             classifier,
@@ -99,13 +109,17 @@ class KerasTFModels(ModelsUtils, ABC):
             training_epochs,
             taxa,
             kmers_list,
-            csv
+            csv,
+            catalog
         )
         # Parameters
         # Initialize hidden
         self._nb_CPU_data = int(os.cpu_count() * 0.2) # 9
         self._nb_CPU_training = int(os.cpu_count() - self._nb_CPU_data) # 39
         self._nb_GPU = len(tf.config.list_physical_devices('GPU')) # 4
+        self.checkpoints_average = 1
+        self.shuffle_buffer = 0
+        self.cache_data = False
         # Initialize empty
         self._nb_CPU_per_worker = 0
         self._nb_GPU_per_worker = 0
@@ -123,10 +137,10 @@ class KerasTFModels(ModelsUtils, ABC):
     # Data preprocessing
     #########################################################################################################
 
-    def preprocess(self, ds, scaling = False, scaler_file = None):
+    def preprocess(self, ds, scaling = False, scaler_file = None, scaler = None):
         print('preprocess')
         # Labels encoding
-        self._encoder = ModelLabelEncoder(self.taxa)
+        self._encoder = ModelLabelEncoder(self.taxa, self._catalog)
         self._encoder.fit(ds)
 
         # Labels mapping
@@ -139,9 +153,12 @@ class KerasTFModels(ModelsUtils, ABC):
         for (label, encoded) in zip(labels, self._encoded):
             self._labels_map[label] = encoded
         
-        # Features scaling
-        self._scaler = TensorTfIdfTransformer(features = self.kmers, file = scaler_file)
-        self._scaler.fit(ds)
+        # Features scaling, reuse the scaler shared between taxas if given
+        if scaler is not None:
+            self._scaler = scaler
+        else:
+            self._scaler = TensorTfIdfTransformer(features = self.kmers, file = scaler_file)
+            self._scaler.fit(ds)
 
         # Class weights
         self._weights = self._compute_weights()
@@ -149,13 +166,14 @@ class KerasTFModels(ModelsUtils, ABC):
     # Models training
     #########################################################################################################
 
-    def fit(self, datasets):
+    def fit(self, datasets, scaled = False):
         print('fit')
         # Preprocessing loop
         for name, ds in datasets.items():
             # ds = ds.drop_columns(['id'])
             ds = self._encoder.transform(ds)
-            ds = self._scaler.transform(ds)
+            if not scaled:
+                ds = self._scaler.transform(ds)
             ds = ds.materialize()
             datasets[name] = ds
 
@@ -166,7 +184,9 @@ class KerasTFModels(ModelsUtils, ABC):
             'size': self._nb_kmers,
             'nb_cls': self._nb_classes,
             'model': self.classifier,
-            'weights': self._weights
+            'weights': self._weights,
+            'shuffle_buffer': self.shuffle_buffer,
+            'cache_dir': os.path.join(self._workdir, f'{self.classifier}_{self.taxa}_cache') if self.cache_data else None
         }
 
         if self._nb_GPU > 0:
@@ -190,69 +210,74 @@ class KerasTFModels(ModelsUtils, ABC):
             run_config=RunConfig(
                 name=self.classifier,
                 local_dir=self._workdir,
+                checkpoint_config=CheckpointConfig(
+                    num_to_keep=max(self.checkpoints_average, 1),
+                    checkpoint_score_attribute='val_loss',
+                    checkpoint_score_order='min'
+                )
             ),
             datasets=datasets,
         )
 
         training_result = self._trainer.fit()
-        # self._model_ckpt = training_result.best_checkpoints[0][0]
-        self._model_ckpt = glob(
-            os.path.join(
-                os.path.dirname(training_result.best_checkpoints[0][0].path),'checkpoint_*'
+        self._model_ckpt = self._export_model(training_result.best_checkpoints)
+
+    def _export_model(self, checkpoints):
+        """
+        Export the checkpoint with the lowest validation loss as a single Keras SavedModel
+        The weights of the checkpoints_average best checkpoints are averaged if more than one is kept
+        Returns the path to the exported model
+        """
+        checkpoints = sorted(checkpoints, key = lambda ckpt: ckpt[1]['val_loss'])
+        checkpoints = checkpoints[:max(self.checkpoints_average, 1)]
+        print(f"Exporting {self.classifier} model with validation loss {checkpoints[0][1]['val_loss']}")
+
+        classifier, nb_classes, nb_kmers = self.classifier, self._nb_classes, self._nb_kmers
+        weights = []
+        for ckpt, _ in checkpoints:
+            model = TensorflowCheckpoint.from_directory(ckpt.path).get_model(
+                lambda: build_model(classifier, nb_classes, nb_kmers)
             )
-        )
+            weights.append(model.get_weights())
+        model.set_weights([np.mean(layer, axis = 0) for layer in zip(*weights)])
+
+        export_dir = os.path.join(self._workdir, f'{self.classifier}_{self.taxa}_model')
+        model.save(export_dir)
+
+        return export_dir
                 
     # Models predicting
     #########################################################################################################
 
     def predict(self, ds):
         print('predict')
-        # Predict with model
-        probabilities = self._predict_proba(ds)
-        # Convert predictions to labels
-        predictions = self._get_abs_pred(probabilities)
-        # Return decoded labels
-        return self._label_decode(predictions)
+        # Most probable labels, decided and decoded in the prediction actors
+        return self._predict_labels(ds, 0)
     
     def predict_proba(self, ds, threshold = 0.8):
         print('predict_proba')
-        # Predict with model
-        probabilities = self._predict_proba(ds)
-        # Convert predictions to labels with threshold
-        predictions = self._get_threshold_pred(probabilities, threshold)
-        # Return decoded labels
-        return self._label_decode(predictions)
-
-    def _predict_proba(self, ds):
-        print('_predict_proba')
-        if ds.count() > 0:
-
-            ds = self._scaler.transform(ds)
-            ds = ds.materialize()
+        # Labels with threshold, decided and decoded in the prediction actors
+        return self._predict_labels(ds, threshold)
+
+    def batch_predictor(self, threshold = 0.8, top_k = 0):
+        classifier, nb_classes, nb_kmers = self.classifier, self._nb_classes, self._nb_kmers
+        predictor = KerasCachedPredictor(
+            self._model_ckpt,
+            lambda: build_model(classifier, nb_classes, nb_kmers),
+            nb_kmers,
+            getattr(self, 'predict_warmup', True)
+        )
 
-            def predict_func(data):
-                X = _unwrap_ndarray_object_type_if_needed(data[TENSOR_COLUMN_NAME])
-                pred = np.zeros((len(X), len(self._labels_map)-1))
-                for ckpt in self._model_ckpt:
-                    ckpt = TensorflowCheckpoint.from_directory(ckpt)
-                    predictor = TensorflowPredictor().from_checkpoint(ckpt, model_definition = lambda: build_model('cnn', self._nb_classes, self._nb_kmers))
-                    proba = predictor.predict(X)
-                    pred += proba['predictions']
-                pred = pred / len(self._model_ckpt)
-                return {'predictions' : pred}
-            
-            probabilities = ds.map_batches(predict_func, batch_format = 'numpy')
-            probabilities = _unwrap_ndarray_object_type_if_needed(probabilities.to_pandas()['predictions'])
-            
-            return probabilities
-        else:
-            raise ValueError('No data to predict')
+        def predict_batch(batch):
+            probabilities = predictor({TENSOR_COLUMN_NAME : self._scale_batch(batch)})['predictions']
+            predictions = self._get_threshold_pred(probabilities, threshold)
+            # Single sigmoid output is the probability of the class 1
+            if probabilities.shape[1] == 1:
+                probabilities = np.hstack((1 - probabilities, probabilities))
+            return self._decide_batch(predictions, probabilities, top_k)
+
+        return predict_batch
 
-    @abstractmethod
-    def _get_abs_pred(self):
-        """
-        """
-    
     @abstractmethod
     def _get_threshold_pred(self):
         """
@@ -275,6 +300,8 @@ def train_func_CPU(config):
     nb_cls = config.get('nb_cls')
     model = config.get('model')
     weights = config.get('weights')
+    shuffle_buffer = config.get('shuffle_buffer', 0)
+    cache_dir = config.get('cache_dir')
 
     # Model construction
     model = build_model(model, nb_cls, size)
@@ -283,41 +310,19 @@ def train_func_CPU(config):
     train_data = session.get_dataset_shard('train')
     val_data = session.get_dataset_shard('validation')
 
-    for _ in range(epochs):
-        batch_train = train_data.to_tf(
-            feature_columns = TENSOR_COLUMN_NAME,
-            label_columns = LABELS_COLUMN_NAME,
-            batch_size = batch_size,
-            # local_shuffle_buffer_size = batch_size,
-            # local_shuffle_seed = int(np.random.randint(1,10000, size = 1))
-        )
-        batch_val = val_data.to_tf(
-            feature_columns = TENSOR_COLUMN_NAME,
-            label_columns = LABELS_COLUMN_NAME,
-            batch_size = batch_size,
-            # local_shuffle_buffer_size = batch_size,
-            # local_shuffle_seed = int(np.random.randint(1,10000, size = 1))
-        )
-        # Training
-        # TODO: Move epochs to model.fit instead of in loop?
-        history = model.fit(
-            x = batch_train,
-            validation_data = batch_val,
-            callbacks = [ReportCheckpointCallback()],
-            class_weight = weights,
-            verbose = 0
-        )
-        # Checkpointing
-        session.report({
-            'accuracy': history.history['accuracy'][0],
-            'loss': history.history['loss'][0],
-            'val_accuracy': history.history['val_accuracy'][0],
-            'val_loss': history.history['val_loss'][0],
-        },
-            checkpoint=TensorflowCheckpoint.from_model(model)
-        )
-        gc.collect()
-        tf.keras.backend.clear_session()
+    # Input pipelines built once and iterated again at every epoch
+    batch_train = _build_tf_dataset(train_data, batch_size, shuffle_buffer, cache_dir, 'train')
+    batch_val = _build_tf_dataset(val_data, batch_size, 0, cache_dir, 'validation')
+
+    # Training, metrics and checkpoint reported to Ray at the end of each epoch
+    model.fit(
+        x = batch_train,
+        validation_data = batch_val,
+        epochs = epochs,
+        callbacks = [ReportCheckpointCallback(checkpoint_on = 'epoch_end', report_metrics_on = 'epoch_end')],
+        class_weight = weights,
+        verbose = 0
+    )
     del model
     gc.collect()
     tf.keras.backend.clear_session()
@@ -331,6 +336,8 @@ def train_func_GPU(config):
     nb_cls = config.get('nb_cls')
     model = config.get('model')
     weights = config.get('weights')
+    shuffle_buffer = config.get('shuffle_buffer', 0)
+    cache_dir = config.get('cache_dir')
 
     # Model construction
     strategy = tf.distribute.MirroredStrategy()
@@ -341,45 +348,49 @@ def train_func_GPU(config):
     train_data = session.get_dataset_shard('train')
     val_data = session.get_dataset_shard('validation')
 
-    for _ in range(epochs):
-        batch_train = train_data.to_tf(
-            feature_columns = TENSOR_COLUMN_NAME,
-            label_columns = LABELS_COLUMN_NAME,
-            batch_size = batch_size,
-            # local_shuffle_buffer_size = batch_size,
-            # local_shuffle_seed = int(np.random.randint(1,10000, size = 1))
-        )
-        batch_val = val_data.to_tf(
-            feature_columns = TENSOR_COLUMN_NAME,
-            label_columns = LABELS_COLUMN_NAME,
-            batch_size = batch_size,
-            # local_shuffle_buffer_size = batch_size,
-            # local_shuffle_seed = int(np.random.randint(1,10000, size = 1))
-        )
-        # Training
-        # TODO: Move epochs to model.fit instead of in loop?
-        history = model.fit(
-            x = batch_train,
-            validation_data = batch_val,
-            callbacks = [ReportCheckpointCallback()],
-            class_weight = weights,
-            verbose = 0
-        )
-        # Checkpointing
-        session.report({
-            'accuracy': history.history['accuracy'][0],
-            'loss': history.history['loss'][0],
-            'val_accuracy': history.history['val_accuracy'][0],
-            'val_loss': history.history['val_loss'][0],
-        },
-            checkpoint=TensorflowCheckpoint.from_model(model)
-        )
-        gc.collect()
-        tf.keras.backend.clear_session()
+    # Input pipelines built once and iterated again at every epoch
+    batch_train = _build_tf_dataset(train_data, batch_size, shuffle_buffer, cache_dir, 'train')
+    batch_val = _build_tf_dataset(val_data, batch_size, 0, cache_dir, 'validation')
+
+    # Training, metrics and checkpoint reported to Ray at the end of each epoch
+    model.fit(
+        x = batch_train,
+        validation_data = batch_val,
+        epochs = epochs,
+        callbacks = [ReportCheckpointCallback(checkpoint_on = 'epoch_end', report_metrics_on = 'epoch_end')],
+        class_weight = weights,
+        verbose = 0
+    )
     # del model
     # gc.collect()
     # tf.keras.backend.clear_session()
 
+def _build_tf_dataset(shard, batch_size, shuffle_buffer = 0, cache_dir = None, name = 'train'):
+    """
+    Input pipeline of a dataset shard on a training worker, built once for all epochs
+    Rows are shuffled by Ray at every epoch unless the pipeline is cached, batches of the cache are shuffled instead
+    """
+    cache_file = None
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok = True)
+        cache_file = os.path.join(cache_dir, f'{name}_{session.get_world_rank()}')
+        # Stale cache of a previous training would be reused as is
+        for file in glob(f'{cache_file}*'):
+            os.remove(file)
+
+    ds = shard.to_tf(
+        feature_columns = TENSOR_COLUMN_NAME,
+        label_columns = LABELS_COLUMN_NAME,
+        batch_size = batch_size,
+        local_shuffle_buffer_size = shuffle_buffer if shuffle_buffer > 0 and cache_file is None else None
+    )
+    if cache_file is not None:
+        ds = ds.cache(cache_file)
+        if shuffle_buffer > 0:
+            ds = ds.shuffle(max(shuffle_buffer // batch_size, 1), reshuffle_each_iteration = True)
+
+    return ds.prefetch(tf.data.AUTOTUNE)
+
 def build_model(classifier, nb_cls, nb_kmers):
     if classifier == 'attention':
         model = build_attention(nb_kmers)
@@ -393,5 +404,9 @@ def build_model(classifier, nb_cls, nb_kmers):
         model = build_CNN(nb_kmers, nb_cls)
     elif classifier == 'widecnn':
         model = build_wideCNN(nb_kmers, nb_cls)
+    elif classifier == 'embed_attention':
+        model = build_embed_attention(nb_kmers)
+    elif classifier == 'embed_lstm_attention':
+        model = build_embed_LSTM_attention(nb_kmers, nb_cls)
     return model
 
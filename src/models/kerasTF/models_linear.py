@@ -10,7 +10,6 @@ from abc import ABC, abstractmethod
 # Preprocessing
 from ray.data.preprocessors import LabelEncoder, Chain
 from models.encoders.model_label_encoder import ModelLabelEncoder
-from models.encoders.one_hot_tensor_encoder import OneHotTensorEncoder
 from models.preprocessors.tfidf_transformer import TensorTfIdfTransformer
 
 # Parent class / models
@@ -87,7 +86,8 @@ class KerasTFModels(ModelsUtils, ABC):
         training_epochs,
         taxa,
         kmers_list,
-        csv
+        csv,
+        catalog = None
     ):
         super().__init__(
             classifier,
@@ -96,7 +96,8 @@ class KerasTFModels(ModelsUtils, ABC):
             training_epochs,
             taxa,
             kmers_list,
-            csv
+            csv,
+            catalog
         )
         # Parameters
         # Initialize hidden
@@ -123,7 +124,7 @@ class KerasTFModels(ModelsUtils, ABC):
     def preprocess(self, ds, scaling = False, scaler_file = None):
         print('preprocess')
         # Labels encoding
-        self._encoder = ModelLabelEncoder(self.taxa)
+        self._encoder = ModelLabelEncoder(self.taxa, self._catalog)
         self._encoder.fit(ds)
 
         # Labels mapping
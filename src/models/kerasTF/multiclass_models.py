@@ -8,7 +8,6 @@ import pandas as pd
 from ray.data.preprocessors import LabelEncoder, Chain
 from models.encoders.model_label_encoder import ModelLabelEncoder
 from models.preprocessors.min_max_scaler import TensorMinMaxScaler
-from models.encoders.one_hot_tensor_encoder import OneHotTensorEncoder
 from models.preprocessors.tfidf_transformer import TensorTfIdfTransformer
 
 # Parent class / models
@@ -30,6 +29,7 @@ from ray.air.config import RunConfig
 # Predicting
 from tensorflow.keras.models import load_model
 from ray.train.tensorflow import TensorflowPredictor
+from models.decision import threshold_decision
 from ray.train.batch_predictor import BatchPredictor
 
 # Data
@@ -86,7 +86,8 @@ class KerasTFMulticlassModels(KerasTFModels, MulticlassUtils):
         training_epochs,
         taxa,
         kmers_list,
-        csv
+        csv,
+        catalog = None
     ):
         super().__init__(
             classifier,
@@ -95,24 +96,13 @@ class KerasTFMulticlassModels(KerasTFModels, MulticlassUtils):
             training_epochs,
             taxa,
             kmers_list,
-            csv
+            csv,
+            catalog
         )
         self._nb_classes = None
 
     # Models predicting
     #########################################################################################################
 
-    def _get_abs_pred(self, predictions):
-        print('_get_abs_pred')
-        return np.argmax(predictions, axis = 1)
-
     def _get_threshold_pred(self, predictions, threshold):
-        print('_get_threshold_pred')
-        pred = pd.DataFrame({
-            'proba': [np.max(arr) for arr in predictions],
-            'label' : [np.argmax(arr) for arr in predictions]
-        })
-        pred.loc[pred['proba'] < threshold, 'label'] = -1
-
-        return pred['label'].to_numpy(dtype = np.int32)
-
+        return threshold_decision(predictions, threshold)
@@ -6,13 +6,23 @@ import pandas as pd
 # Class construction
 from abc import ABC, abstractmethod
 
+# Predicting
+from ray.data import ActorPoolStrategy
+from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
+
+# Decisions
+from models.decision import top_k_decision, labels_decoder, decode_labels
+
 # Class weights
+from data.labels_catalog import load_labels_catalog
 from sklearn.utils.class_weight import compute_class_weight
 
 __author__ = 'Nicolas de Montigny'
 
 __all__ = ['ModelsUtils']
 
+TENSOR_COLUMN_NAME = '__value__'
+
 # Ignore warnings to have a more comprehensible output on stdout
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 warnings.filterwarnings('ignore')
@@ -40,6 +50,9 @@ class ModelsUtils(ABC):
     taxa : string
         The taxa for which the model is trained in classifying
 
+    catalog : string
+        Path to the labels catalog of the database, used to encode labels and compute class weights without reading the data
+
     ----------
     Methods
     ----------
@@ -61,7 +74,8 @@ class ModelsUtils(ABC):
         training_epochs,
         taxa,
         kmers_list,
-        csv
+        csv,
+        catalog = None
     ):
         # Parameters
         self.classifier = classifier
@@ -87,6 +101,10 @@ class ModelsUtils(ABC):
         self._train_params = {}
         self._preprocessor = None
         self._workdir = outdir_model
+        self._catalog = load_labels_catalog(catalog, taxa)
+        # Prediction actors
+        self.predict_pool_size = None
+        self.predict_warmup = True
 
 
 
@@ -110,11 +128,41 @@ class ModelsUtils(ABC):
         """
         """
 
+    @abstractmethod
+    def batch_predictor(self, threshold = 0.8, top_k = 0):
+        """
+        Returns a function classifying one numpy batch into a dictionnary of decoded labels (see _decide_batch)
+        Models are loaded when it is built and kept resident, it is meant to be built once per actor
+        """
+
+    def _scale_batch(self, batch):
+        """
+        Scale the features of one numpy batch with the fitted scaler
+        """
+        scaled = self._scaler.transform_batch({TENSOR_COLUMN_NAME : batch[TENSOR_COLUMN_NAME]})
+        return _unwrap_ndarray_object_type_if_needed(scaled[TENSOR_COLUMN_NAME])
+
+    def _predict_compute(self):
+        """
+        Pool of actors keeping the models loaded for batch predictions
+        Autoscales from one actor if no pool size is given
+        """
+        pool_size = getattr(self, 'predict_pool_size', None)
+        if pool_size is None:
+            return ActorPoolStrategy(min_size = 1)
+        return ActorPoolStrategy(size = pool_size)
+
     def _compute_weights(self):
         """
         Set class weights depending on their abundance in data-associated classes csv
+        Weights are taken from the labels catalog if available
         """
         weights = {}
+        if self._catalog is not None:
+            for lab, encoded in self._labels_map.items():
+                if lab.lower() != 'unknown' and lab in self._catalog['weights']:
+                    weights[int(encoded)] = self._catalog['weights'][lab]
+            return weights
         if isinstance(self._csv, tuple):
             cls = pd.concat([pd.read_csv(self._csv[0]),pd.read_csv(self._csv[1])], axis = 0, join = 'inner', ignore_index = True)
         else:
@@ -135,10 +183,52 @@ class ModelsUtils(ABC):
         return weights
     
     def _label_decode(self, predict):
-        print('_label_decode')
+        return decode_labels(predict, labels_decoder(self._labels_map))
 
-        decoded = pd.Series(np.empty(len(predict), dtype=object))
-        for label, encoded in self._labels_map.items():
-            decoded[predict == encoded] = label
+    def _decide_batch(self, predictions, probabilities = None, top_k = 0):
+        """
+        Decoded labels of a batch and, if top_k > 0, the labels and probabilities of its k most probable classes
+        Probabilities columns are the codes of the classes, rows without probabilities get their label with a nan probability
+        """
+        decoder = labels_decoder(self._labels_map)
+        decision = {'label' : decode_labels(predictions, decoder)}
+        if top_k > 0:
+            if probabilities is None:
+                top_codes = np.full((len(predictions), top_k), -1, dtype = np.int32)
+                top_codes[:, 0] = predictions
+                top_proba = np.full((len(predictions), top_k), np.nan, dtype = np.float64)
+                padding = np.arange(top_k) > 0
+            else:
+                top_codes, top_proba = top_k_decision(probabilities, top_k)
+                padding = top_codes < 0
+            top_labels = decode_labels(top_codes, decoder)
+            # Padding when there are less than k classes
+            top_labels[np.broadcast_to(padding, top_labels.shape)] = None
+            decision['top_labels'] = top_labels
+            decision['top_probabilities'] = top_proba
+        return decision
+
+    def _predict_labels(self, ds, threshold):
+        """
+        Decoded labels of a dataset
+        Decisions and decoding are made in the prediction actors so only the labels come back to the driver
+        """
+        if ds.count() == 0:
+            raise ValueError('No data to predict')
+        predictions = ds.map_batches(
+            _LabelsPredictor,
+            batch_format = 'numpy',
+            compute = self._predict_compute(),
+            fn_constructor_kwargs = {'model' : self, 'threshold' : threshold}
+        )
+        return predictions.to_pandas()['predictions'].to_numpy()
+
+class _LabelsPredictor():
+    """
+    Callable class keeping the batch predictor of a model resident in an actor
+    """
+    def __init__(self, model, threshold):
+        self._predictor = model.batch_predictor(threshold)
 
-        return np.array(decoded)
\ No newline at end of file
+    def __call__(self, batch):
+        return {'predictions' : self._predictor(batch)['label']}
\ No newline at end of file
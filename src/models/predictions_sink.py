@@ -0,0 +1,220 @@
+import os
+import ray
+import json
+import uuid
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from glob import glob
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['PredictionsSink']
+
+"""
+Streaming sink of the per-read predictions partitioned by taxonomic rank.
+Each prediction actor writes its batches directly in the partition of the rank so the driver never holds the predictions.
+The predictions are saved in the following arborescence :
+    path/rank={taxa}/part-{uuid}.parquet
+        id : id of the sequence
+        label : label predicted for the rank
+        multiplicity : number of reads represented by the sequence
+        members : ids of the reads represented by the sequence if the dataset was deduplicated
+        top_labels : labels of the k most probable classes
+        top_probabilities : probabilities of the k most probable classes
+Runs processed in shards write each shard in a staging folder which is moved in the partitions when the shard is committed :
+    path/rank={taxa}/shard={shard}/part-{uuid}.parquet
+    path/_markers/shard={shard}.done
+Folders prefixed by an underscore are ignored by the parquet readers.
+"""
+
+STAGING_DIR = '_staging'
+MARKERS_DIR = '_markers'
+CONFIG_FILE = '_config.json'
+
+
+class PredictionsSink():
+    """
+    ----------
+    Attributes
+    ----------
+
+    path : string
+        Path to the folder of the partitioned parquet predictions
+
+    ----------
+    Methods
+    ----------
+
+    write_batch : write the predictions of a batch for one rank as a new part of its partition
+
+    start_run : keep the committed shards of a previous run with the same configuration, clear the sink otherwise
+
+    stage_shard : sink of the staging folder in which the predictions of a shard are written
+
+    commit_shard : move a staged shard in the partitions and write its completion marker
+
+    is_committed : whether a shard was already committed
+
+    taxas : list of the ranks that have predictions
+
+    read : ray.data.Dataset of the predictions for one or all ranks
+
+    classification : pandas.DataFrame of the reads classified (not unknown) at one rank
+
+    abundances : number of reads classified per label at one rank
+
+    nb_reads : number of reads predicted at one rank, classified or unknown
+    """
+    def __init__(self, path, overwrite = False):
+        self.path = path
+        if overwrite and os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path, exist_ok = True)
+
+    def write_batch(self, taxa, ids, labels, top_labels = None, top_probabilities = None, multiplicity = None, members = None):
+        """
+        Write the predictions of one batch for a rank, rows without label are not written
+        Returns the number of reads written
+        """
+        labels = np.asarray(labels, dtype = object)
+        rows = np.flatnonzero(pd.notna(labels))
+        if len(rows) == 0:
+            return 0
+        if multiplicity is None:
+            multiplicity = np.ones(len(labels), dtype = np.int64)
+        multiplicity = np.asarray(multiplicity, dtype = np.int64)[rows]
+        columns = {
+            'id' : pa.array(np.asarray(ids, dtype = object)[rows], type = pa.string()),
+            'label' : pa.array(labels[rows], type = pa.string()),
+            'multiplicity' : pa.array(multiplicity, type = pa.int64()),
+        }
+        if members is not None:
+            columns['members'] = pa.array([list(members[row]) for row in rows], type = pa.list_(pa.string()))
+        if top_labels is not None:
+            columns['top_labels'] = pa.array(np.asarray(top_labels, dtype = object)[rows].tolist(), type = pa.list_(pa.string()))
+            columns['top_probabilities'] = pa.array(np.asarray(top_probabilities, dtype = np.float64)[rows].tolist(), type = pa.list_(pa.float64()))
+
+        partition = os.path.join(self.path, f'rank={taxa}')
+        os.makedirs(partition, exist_ok = True)
+        # Parts are written under a temporary name so readers never see incomplete files
+        file = os.path.join(partition, f'part-{uuid.uuid4().hex}.parquet')
+        pq.write_table(pa.table(columns), f'{file}.tmp')
+        os.replace(f'{file}.tmp', file)
+
+        return int(multiplicity.sum())
+
+    def start_run(self, config):
+        """
+        Resume a previous run only if it was made with the same configuration
+        Returns the number of shards already committed
+        """
+        file = os.path.join(self.path, CONFIG_FILE)
+        previous = None
+        if os.path.isfile(file):
+            with open(file, 'r') as handle:
+                previous = json.load(handle)
+        if previous != config:
+            for entry in os.listdir(self.path):
+                entry = os.path.join(self.path, entry)
+                if os.path.isdir(entry):
+                    shutil.rmtree(entry)
+                else:
+                    os.remove(entry)
+            with open(f'{file}.tmp', 'w') as handle:
+                json.dump(config, handle)
+            os.replace(f'{file}.tmp', file)
+        # Incomplete shards of an interrupted run are predicted again
+        shutil.rmtree(os.path.join(self.path, STAGING_DIR), ignore_errors = True)
+        markers = os.path.join(self.path, MARKERS_DIR)
+        return len(glob(os.path.join(markers, 'shard=*.done')))
+
+    def stage_shard(self, shard):
+        """
+        Empty sink in which the prediction actors write the predictions of a shard
+        """
+        return PredictionsSink(os.path.join(self.path, STAGING_DIR, f'shard={shard}'), overwrite = True)
+
+    def commit_shard(self, shard):
+        """
+        Move the staged predictions of a shard in the rank partitions then mark the shard as completed
+        The marker is written last so a shard interrupted while committing is predicted again
+        """
+        staging = os.path.join(self.path, STAGING_DIR, f'shard={shard}')
+        for partition in glob(os.path.join(staging, 'rank=*')):
+            target = os.path.join(self.path, os.path.basename(partition), f'shard={shard}')
+            os.makedirs(os.path.dirname(target), exist_ok = True)
+            # Leftovers of an interrupted commit
+            shutil.rmtree(target, ignore_errors = True)
+            os.replace(partition, target)
+        shutil.rmtree(staging, ignore_errors = True)
+
+        markers = os.path.join(self.path, MARKERS_DIR)
+        os.makedirs(markers, exist_ok = True)
+        marker = os.path.join(markers, f'shard={shard}.done')
+        with open(f'{marker}.tmp', 'w') as handle:
+            handle.write(str(shard))
+        os.replace(f'{marker}.tmp', marker)
+
+    def is_committed(self, shard):
+        return os.path.isfile(os.path.join(self.path, MARKERS_DIR, f'shard={shard}.done'))
+
+    def taxas(self):
+        return [os.path.basename(partition).split('=', 1)[1] for partition in sorted(glob(os.path.join(self.path, 'rank=*')))]
+
+    def read(self, taxa = None):
+        """
+        Lazy dataset of the predictions of one rank or of all ranks with the rank column
+        """
+        if taxa is None:
+            return ray.data.read_parquet(self.path)
+        return ray.data.read_parquet(os.path.join(self.path, f'rank={taxa}'))
+
+    def classification(self, taxa):
+        """
+        Ids and labels of the reads classified at one rank, meant for reports on small outputs
+        Predictions of deduplicated sequences are fanned back out to the ids of all the reads they represent
+        """
+        df = self._read_partition(taxa)
+        if df is None:
+            return pd.DataFrame(columns = ['id', 'label'])
+        df = df[df['label'] != 'Unknown']
+        if 'members' in df.columns:
+            df = df.assign(id = df['members']).explode('id')
+        return df[['id', 'label']].reset_index(drop = True)
+
+    def abundances(self, taxa):
+        """
+        Number of reads classified per label at one rank, deduplicated sequences count for their multiplicity
+        """
+        df = self._read_partition(taxa)
+        if df is None:
+            return pd.Series(dtype = np.int64, name = 'multiplicity')
+        df = df[df['label'] != 'Unknown']
+        return df.groupby('label')['multiplicity'].sum().sort_values(ascending = False)
+
+    def nb_reads(self, taxa):
+        """
+        Number of reads predicted at one rank including the unknown, deduplicated sequences count for their multiplicity
+        """
+        df = self._read_partition(taxa)
+        if df is None:
+            return 0
+        return int(df['multiplicity'].sum())
+
+    def _read_partition(self, taxa):
+        partition = os.path.join(self.path, f'rank={taxa}')
+        files = glob(os.path.join(partition, '**', '*.parquet'), recursive = True)
+        if len(files) == 0:
+            return None
+        # Members are only saved for deduplicated datasets
+        names = pq.read_schema(files[0]).names
+        columns = [col for col in ['id', 'label', 'multiplicity', 'members'] if col in names]
+        return pq.read_table(partition, columns = columns).to_pandas()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(path={self.path!r})"
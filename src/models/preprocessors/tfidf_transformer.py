@@ -4,10 +4,11 @@ import pandas as pd
 import scipy.sparse as sp
 
 
+from warnings import warn
 from os.path import isfile
 from ray.data.dataset import Dataset
 from sklearn.preprocessing import normalize
-from utils import save_Xy_data, load_Xy_data
+from utils import save_Xy_data, load_Xy_data, kmers_fingerprint
 from ray.data.preprocessor import Preprocessor
 from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
 
@@ -27,9 +28,9 @@ class TensorTfIdfTransformer(Preprocessor):
         self._file = file
 
     def _fit(self, ds: Dataset) -> Preprocessor:
-        if isfile(self._file):
-            idf_diag = load_Xy_data(self._file)
-        else:
+        fingerprint = kmers_fingerprint(self._features)
+        idf_diag = self._load_idf(fingerprint)
+        if idf_diag is None:
             nb_samples = ds.count()
 
             # Nb of occurences
@@ -49,11 +50,23 @@ class TensorTfIdfTransformer(Preprocessor):
                 dtype=np.float64,
             )
 
-            save_Xy_data(idf_diag, self._file)
-            
+            if self._file:
+                save_Xy_data({'idf_diag' : idf_diag, 'fingerprint' : fingerprint}, self._file)
+
         self.stats_ = {'idf_diag' : idf_diag}
 
         return self
+
+    def _load_idf(self, fingerprint):
+        """
+        Load the IDF diagonal from file only if it was fitted on the same K-mers vocabulary
+        """
+        if isfile(self._file):
+            saved = load_Xy_data(self._file)
+            if isinstance(saved, dict) and saved.get('fingerprint') == fingerprint:
+                return saved['idf_diag']
+            warn(f'TF-IDF file {self._file} was fitted on a different K-mers vocabulary, it will be refitted and overwritten')
+        return None
     
     def _transform_pandas(self, batch: pd.DataFrame) -> pd.DataFrame:
         # _validate_df(batch, TENSOR_COLUMN_NAME, self._nb_features)
@@ -24,6 +24,9 @@ from ray.air.config import RunConfig
 from ray.train.batch_predictor import BatchPredictor
 from models.sklearn.tensor_predictor import SklearnTensorPredictor
 from models.sklearn.probability_predictor import SklearnTensorProbaPredictor
+from models.sklearn.linear_engine import LinearEngine, export_linear_model
+from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
+from models.decision import threshold_decision
 
 # Parent class
 from models.sklearn.models import SklearnModels
@@ -75,7 +78,8 @@ class SklearnBinaryModels(SklearnModels):
         training_epochs,
         taxa,
         kmers_list,
-        csv
+        csv,
+        catalog = None
     ):
         super().__init__(
             classifier,
@@ -84,13 +88,14 @@ class SklearnBinaryModels(SklearnModels):
             training_epochs,
             taxa,
             kmers_list,
-            csv
+            csv,
+            catalog
         )
 
     # Data preprocessing
     #########################################################################################################
 
-    def preprocess(self, ds, scaling = False, scaler_file = None):
+    def preprocess(self, ds, scaling = False, scaler_file = None, scaler = None):
         print('preprocess')
         # Labels encoding + mapping
         if self.classifier == 'onesvm':
@@ -99,7 +104,7 @@ class SklearnBinaryModels(SklearnModels):
             labels = np.array(['Bacteria', 'Unknown'], dtype = object)
             self._encoder.fit(ds)
         else:
-            self._encoder = ModelLabelEncoder(self.taxa)
+            self._encoder = ModelLabelEncoder(self.taxa, self._catalog)
             self._encoder.fit(ds)
             labels = list(self._encoder.stats_[f'unique_values({self.taxa})'].keys())
             self._encoded = np.arange(len(labels))
@@ -112,21 +117,25 @@ class SklearnBinaryModels(SklearnModels):
         for (label, encoded) in zip(labels, self._encoded):
             self._labels_map[label] = encoded
 
-        # Features scaling
-        self._scaler = TensorTfIdfTransformer(features = self.kmers,file = scaler_file)
-        self._scaler.fit(ds)
+        # Features scaling, reuse the scaler shared between taxas if given
+        if scaler is not None:
+            self._scaler = scaler
+        else:
+            self._scaler = TensorTfIdfTransformer(features = self.kmers,file = scaler_file)
+            self._scaler.fit(ds)
 
     # Model training
     #########################################################################################################
 
-    def fit(self, datasets):
+    def fit(self, datasets, scaled = False):
         print('_fit_model')
         # Define model
         self._build()
         for name, ds in datasets.items():
             # ds = ds.drop_columns(['id'])
             ds = self._encoder.transform(ds)
-            ds = self._scaler.transform(ds)
+            if not scaled:
+                ds = self._scaler.transform(ds)
             datasets[name] = ray.put(ds)
         
         try:
@@ -144,6 +153,8 @@ class SklearnBinaryModels(SklearnModels):
             datasets=datasets,
             batch_size=self.batch_size,
             training_epochs=self._training_epochs,
+            prefetch_batches=2,
+            shuffle_buffer_size=self.batch_size * 10,
             set_estimator_cpus=True,
             scaling_config=ScalingConfig(
                 trainer_resources={
@@ -159,6 +170,13 @@ class SklearnBinaryModels(SklearnModels):
         # Training execution
         training_result = self._trainer.fit()
         self._model_ckpt = training_result.checkpoint
+
+        # Plain arrays for the NumPy inference engine
+        self._engine_file = export_linear_model(
+            SklearnTensorPredictor.from_checkpoint(self._model_ckpt).estimator,
+            self._scaler.stats_['idf_diag'].diagonal(),
+            os.path.join(self._workdir, f'{self.classifier}_{self.taxa}.npz')
+        )
     
     def _build(self):
         print('_build')
@@ -183,36 +201,34 @@ class SklearnBinaryModels(SklearnModels):
 
     def predict(self, ds):
         print('predict')
-        if ds.count() > 0:
-            ds = self._scaler.transform(ds)
-            ds = ds.materialize()
-            predict_kwargs = {'features':self.kmers, 'num_estimator_cpus':-1}
-            self._predictor = BatchPredictor.from_checkpoint(self._model_ckpt, SklearnTensorPredictor)
-            predictions = self._predictor.predict(ds, batch_size = self.batch_size, feature_columns = [TENSOR_COLUMN_NAME], **predict_kwargs)
-            predictions = np.array(predictions.to_pandas()).reshape(-1)
-            return self._label_decode(predictions)
-        else:
-            raise ValueError('No data to predict')
+        return self._predict_labels(ds, 0)
     
     def predict_proba(self, ds, threshold = 0.8):
         print('predict_proba')
         # No predict_proba methods implemented for these models
         return self.predict(ds)
 
-    def _get_threshold_pred(self, predict, nb_cls, threshold):
-        print('_get_threshold_pred')
-        def map_predicted_label(ds : pd.DataFrame):
-            predict = pd.DataFrame({
-                'best_proba': [max(ds.iloc[i].values) for i in range(len(ds))],
-                'predicted_label': [np.argmax(ds.iloc[i].values) for i in range(len(ds))]
-            })
-            predict.loc[predict['best_proba'] < threshold, 'predicted_label'] = -1
-            return pd.DataFrame(predict['predicted_label'])
+    def batch_predictor(self, threshold = 0.8, top_k = 0):
+        # No predict_proba methods implemented for these models
+        engine_file = getattr(self, '_engine_file', None)
+        if engine_file is not None and os.path.isfile(engine_file):
+            engine = LinearEngine(engine_file)
 
-        if nb_cls == 1:
-            predict = np.round(abs(np.concatenate(predict.to_pandas()['predictions'])))
-        else:
-            predict = predict.map_batches(map_predicted_label, batch_format = 'pandas')
-            predict = np.ravel(np.array(predict.to_pandas()))
+            def predict_engine(batch):
+                X = _unwrap_ndarray_object_type_if_needed(batch[TENSOR_COLUMN_NAME])
+                return self._decide_batch(engine.predict(X), top_k = top_k)
+
+            return predict_engine
+
+        # Models trained before the export to plain arrays
+        estimator = SklearnTensorPredictor.from_checkpoint(self._model_ckpt).estimator
+
+        def predict_batch(batch):
+            return self._decide_batch(estimator.predict(self._scale_batch(batch)), top_k = top_k)
 
-        return predict
\ No newline at end of file
+        return predict_batch
+
+    def _get_threshold_pred(self, predict, nb_cls, threshold):
+        if nb_cls == 1:
+            return np.round(np.abs(np.ravel(predict))).astype(np.int32)
+        return threshold_decision(predict, threshold)
@@ -0,0 +1,51 @@
+import numpy as np
+
+import ray.cloudpickle as cpickle
+
+from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
+
+TENSOR_COLUMN_NAME = '__value__'
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['SklearnCachedPredictor']
+
+class SklearnCachedPredictor():
+    """
+    Callable class to predict probabilities with ray.data.Dataset.map_batches using an ActorPoolStrategy
+    Models are unpickled once when the actor starts and stay resident for all the batches it predicts
+
+    ----------
+    Attributes
+    ----------
+
+    model_files : list of string
+        Paths to the pickled models, their probabilities are averaged
+
+    nb_classes : int
+        Number of classes in the predicted probabilities
+
+    nb_features : int
+        Number of features used for the warm-up prediction
+
+    warmup : boolean
+        Predict one empty row when the actor starts so the first batch only costs the predictions
+    """
+    def __init__(self, model_files, nb_classes, nb_features, warmup = True):
+        self._models = []
+        for model_file in model_files:
+            with open(model_file, 'rb') as file:
+                self._models.append(cpickle.load(file))
+        self._nb_classes = nb_classes
+        if warmup:
+            self._predict(np.zeros((1, nb_features), dtype = np.float32))
+
+    def __call__(self, batch):
+        X = _unwrap_ndarray_object_type_if_needed(batch[TENSOR_COLUMN_NAME])
+        return {'predictions' : self._predict(X)}
+
+    def _predict(self, X):
+        pred = np.zeros((len(X), self._nb_classes))
+        for model in self._models:
+            pred[:, model.classes_] += model.predict_proba(X)
+        return pred / len(self._models)
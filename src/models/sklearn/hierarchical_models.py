@@ -0,0 +1,251 @@
+import os
+import warnings
+import numpy as np
+import pandas as pd
+
+from functools import lru_cache
+
+# Preprocessing
+from models.encoders.model_label_encoder import ModelLabelEncoder
+from models.preprocessors.tfidf_transformer import TensorTfIdfTransformer
+
+# Training
+import ray.cloudpickle as cpickle
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.linear_model import SGDClassifier
+
+# Parent classes
+from models.sklearn.models import SklearnModels
+from models.multiclass_utils import MulticlassUtils
+
+# Decisions
+from models.decision import top_k_decision
+
+# Data
+from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
+
+TENSOR_COLUMN_NAME = '__value__'
+LABELS_COLUMN_NAME = 'labels'
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['SklearnHierarchicalModels']
+
+# Ignore warnings to have a more comprehensible output on stdout
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+warnings.filterwarnings('ignore')
+
+class SklearnHierarchicalModels(SklearnModels, MulticlassUtils):
+    """
+    Class used to build, train and predict hierarchical multiclass models using Ray with Scikit-learn backend
+    One local classifier is trained per label of the previous (parent) taxonomic level over its children labels only
+    Sequences are routed to the local classifier of the parent label they were classified into at the previous level
+
+    ----------
+    Attributes
+    ----------
+
+    parent_taxa : string
+        Previous taxonomic level which labels route the sequences to the local classifiers
+
+    ----------
+    Methods
+    ----------
+
+    preprocess : preprocess the data before training and splitting the original dataset in case of cross-validation
+
+    fit : train one local model per parent label in parallel using the given datasets
+
+    predict : predict the classes of a dataset
+        ds : ray.data.Dataset
+            Dataset containing K-mers profiles of sequences to be classified and the parent taxa column
+
+        threshold : float
+            Minimum percentage of probability to effectively classify.
+            Sequences will be classified as 'unknown' if the probability is under this threshold.
+            Defaults to 80%
+    """
+    def __init__(
+        self,
+        classifier,
+        outdir_model,
+        batch_size,
+        training_epochs,
+        taxa,
+        kmers_list,
+        csv,
+        catalog = None
+    ):
+        super().__init__(
+            classifier,
+            outdir_model,
+            batch_size,
+            training_epochs,
+            taxa,
+            kmers_list,
+            csv,
+            catalog
+        )
+        self.parent_taxa, _ = self._get_count_previous_taxa(self.taxa, self._csv)
+        self._encoder = {}
+        self._local_models = {}
+
+    # Data preprocessing
+    #########################################################################################################
+
+    def preprocess(self, ds, scaling = False, scaler_file = None, scaler = None):
+        print('preprocess')
+        # Labels encoding
+        self._encoder = ModelLabelEncoder(self.taxa, self._catalog)
+        self._encoder.fit(ds)
+
+        # Labels mapping
+        labels = list(self._encoder.stats_[f'unique_values({self.taxa})'].keys())
+        encoded = np.arange(len(labels))
+        labels = np.append(labels, 'Unknown')
+        encoded = np.append(encoded, -1)
+
+        for (label, encode) in zip(labels, encoded):
+            self._labels_map[label] = encode
+
+        # Class weights
+        self._weights = self._compute_weights()
+
+        # Features scaling, reuse the scaler shared between taxas if given
+        if scaler is not None:
+            self._scaler = scaler
+        else:
+            self._scaler = TensorTfIdfTransformer(features = self.kmers, file = scaler_file)
+            self._scaler.fit(ds)
+
+    # Models training
+    #########################################################################################################
+
+    def fit(self, datasets, scaled = False):
+        print('fit')
+        train_ds = datasets['train']
+        train_ds = self._encoder.transform(train_ds)
+        if not scaled:
+            train_ds = self._scaler.transform(train_ds)
+
+        # One local model per parent label
+        train_ds = self._prev_taxa_split_dataset(train_ds, self.parent_taxa)
+
+        # Checkpointing directory
+        model_dir = os.path.join(self._workdir, f'{self.classifier}_hierarchical_{self.taxa}')
+        if not os.path.isdir(model_dir):
+            os.mkdir(model_dir)
+
+        def build_fit_local(train_data):
+            parent = train_data[self.parent_taxa][0]
+            if pd.isna(parent):
+                return {'parent' : [], 'file' : [], 'label' : []}
+            # Training data
+            X_train = _unwrap_ndarray_object_type_if_needed(train_data[TENSOR_COLUMN_NAME])
+            y_train = np.array(train_data[LABELS_COLUMN_NAME])
+            classes = np.unique(y_train)
+
+            # Parents with only one child do not need a model
+            if len(classes) == 1:
+                return {'parent' : [parent], 'file' : [''], 'label' : [int(classes[0])]}
+
+            if self.classifier == 'sgd':
+                model = SGDClassifier(
+                    loss = 'modified_huber',
+                    learning_rate = 'optimal',
+                    class_weight = {cls : self._weights[cls] for cls in classes if cls in self._weights},
+                )
+            elif self.classifier == 'mnb':
+                model = MultinomialNB()
+            model.fit(X_train, y_train)
+
+            model_file = os.path.join(model_dir, f"{str(parent).replace(os.sep, '_').replace(' ', '_')}.pkl")
+            with open(model_file, "wb") as file:
+                cpickle.dump(model, file)
+
+            return {'parent' : [parent], 'file' : [model_file], 'label' : [-1]}
+
+        print(f'Training one {self.classifier} classifier per {self.parent_taxa} for {self.taxa}')
+        training_result = train_ds.map_groups(build_fit_local, batch_format = 'numpy')
+
+        training_result = training_result.to_pandas().to_dict('records')
+        for record in training_result:
+            self._local_models[record['parent']] = (record['file'], record['label'])
+
+    # Models predicting
+    #########################################################################################################
+
+    def predict(self, ds):
+        print('predict')
+        return self._predict_labels(ds, 0)
+
+    def predict_proba(self, ds, threshold = 0.8):
+        print('predict_proba')
+        return self._predict_labels(ds, threshold)
+
+    def batch_predictor(self, threshold = 0.8, top_k = 0):
+        def predict_batch(batch):
+            if self.parent_taxa not in batch:
+                raise ValueError(f'The {self.parent_taxa} classification is needed to route sequences to the {self.taxa} classifiers')
+            best_proba, predicted, top_codes, top_proba = _route_batch(
+                self._scale_batch(batch),
+                batch[self.parent_taxa],
+                self._local_models,
+                top_k
+            )
+            decision = self._decide_batch(self._get_threshold_pred(best_proba, predicted, threshold))
+            if top_k > 0:
+                top_labels = self._label_decode(top_codes)
+                top_labels[top_codes < 0] = None
+                decision['top_labels'] = top_labels
+                decision['top_probabilities'] = top_proba
+            return decision
+
+        return predict_batch
+
+    def _get_threshold_pred(self, probabilities, predictions, threshold):
+        return np.where(probabilities < threshold, -1, predictions)
+
+def _route_batch(X, parents, local_models, top_k = 0):
+    """
+    Classify each row of a batch with the local model of its parent label
+    Returns the best probability and the predicted code of each row, rows with an unknown parent stay -1
+    and the codes / probabilities of the top_k most probable children of each row
+    """
+    parents = np.asarray(parents, dtype = object)
+    best_proba = np.zeros(len(X), dtype = np.float64)
+    predicted = np.full(len(X), -1, dtype = np.int64)
+    top_codes = np.full((len(X), top_k), -1, dtype = np.int64)
+    top_proba = np.full((len(X), top_k), np.nan, dtype = np.float64)
+    for parent in pd.unique(parents):
+        # Parents without local model stay unknown
+        if parent not in local_models:
+            continue
+        rows = np.flatnonzero(parents == parent)
+        model_file, label = local_models[parent]
+        if label >= 0:
+            best_proba[rows] = 1.0
+            predicted[rows] = label
+            if top_k > 0:
+                top_codes[rows, 0] = label
+                top_proba[rows, 0] = 1.0
+        else:
+            model = _load_local_model(model_file)
+            proba = model.predict_proba(X[rows])
+            best = np.argmax(proba, axis = 1)
+            best_proba[rows] = proba[np.arange(len(rows)), best]
+            predicted[rows] = model.classes_[best]
+            if top_k > 0:
+                local_codes, local_proba = top_k_decision(proba, top_k)
+                # Local codes index the children classes of the model, -1 padding stays -1
+                top_codes[rows] = np.append(model.classes_, -1)[local_codes]
+                top_proba[rows] = local_proba
+    return best_proba, predicted, top_codes, top_proba
+
+@lru_cache(maxsize = 256)
+def _load_local_model(file):
+    """
+    Load a local model once per worker
+    """
+    with open(file, 'rb') as handle:
+        return cpickle.load(handle)
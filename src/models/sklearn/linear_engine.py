@@ -0,0 +1,150 @@
+import numpy as np
+import scipy.sparse as sp
+
+from ray.air.util.data_batch_conversion import _unwrap_ndarray_object_type_if_needed
+
+TENSOR_COLUMN_NAME = '__value__'
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['export_linear_model', 'LinearEngine']
+
+"""
+Export of trained linear models as plain arrays and NumPy-only inference kernel.
+Exported files (npz) hold :
+    kind : 'sgd' (SGDClassifier), 'onesvm' (SGDOneClassSVM) or 'mnb' (MultinomialNB)
+    loss : loss of the SGD models, defines how decisions are converted to probabilities
+    coef : (n_classes, n_features) hyperplanes or MNB features log-probabilities
+    intercept : (n_classes,) intercepts, MNB classes log-priors or the opposite of the one class SVM offset
+    classes : codes of the classes of each row of coef
+    idf : (n_features,) TF-IDF diagonal the models were trained on
+TF-IDF scaling is a per-feature product followed by a per-row L2 normalization so it is folded in the kernel :
+    normalize(X * idf) @ coef.T == (X @ (coef * idf).T) / ||X * idf||
+The scaled matrix is never built, each batch costs one GEMM and one GEMV, dense or CSR.
+"""
+
+def export_linear_model(model, idf, file, dtype = np.float32):
+    """
+    Write the arrays of a fitted linear model and of the TF-IDF scaler to an npz file
+    Returns the path to the file
+    """
+    kind = type(model).__name__
+    if kind == 'MultinomialNB':
+        kind = 'mnb'
+        loss = ''
+        coef = model.feature_log_prob_
+        intercept = model.class_log_prior_
+    elif hasattr(model, 'offset_'):
+        # SGDOneClassSVM decision is X @ coef - offset
+        kind = 'onesvm'
+        loss = ''
+        coef = np.atleast_2d(model.coef_)
+        intercept = -np.atleast_1d(model.offset_)
+    else:
+        kind = 'sgd'
+        loss = model.loss
+        coef = model.coef_
+        intercept = model.intercept_
+    classes = getattr(model, 'classes_', np.array([1]))
+
+    np.savez(
+        file,
+        kind = kind,
+        loss = loss,
+        coef = np.asarray(coef, dtype = dtype),
+        intercept = np.asarray(intercept, dtype = dtype),
+        classes = np.asarray(classes),
+        idf = np.asarray(idf, dtype = dtype)
+    )
+    if not file.endswith('.npz'):
+        file = f'{file}.npz'
+    return file
+
+class LinearEngine():
+    """
+    Inference kernel of an exported linear model on raw (unscaled) K-mers counts
+    Features weights are pre-multiplied by the IDF diagonal when loading
+
+    ----------
+    Attributes
+    ----------
+
+    kind : string
+        Type of the exported model ('sgd', 'onesvm' or 'mnb')
+
+    classes : numpy.array
+        Codes of the classes of the model
+
+    ----------
+    Methods
+    ----------
+
+    decision_function : scores of each class for a batch of K-mers counts
+
+    predict : codes of the predicted classes
+
+    predict_proba : probabilities of each class, columns in the order of the classes
+    """
+    def __init__(self, file):
+        with np.load(file, allow_pickle = False) as arrays:
+            self.kind = str(arrays['kind'])
+            self.loss = str(arrays['loss'])
+            self.classes = arrays['classes']
+            idf = arrays['idf']
+            coef = arrays['coef']
+            self._intercept = arrays['intercept']
+        self._dtype = coef.dtype
+        # TF-IDF features scaling folded into the weights
+        self._weights = np.ascontiguousarray((coef * idf).T)
+        self._idf_sq = idf.astype(self._dtype) ** 2
+
+    def __call__(self, batch):
+        X = _unwrap_ndarray_object_type_if_needed(batch[TENSOR_COLUMN_NAME])
+        return {'predictions' : self.predict_proba(X)}
+
+    def decision_function(self, X):
+        if sp.issparse(X):
+            X = X.tocsr().astype(self._dtype)
+            scores = np.asarray(X @ self._weights)
+            norms = np.asarray(X.multiply(X) @ self._idf_sq).ravel()
+        else:
+            X = np.asarray(X, dtype = self._dtype)
+            scores = X @ self._weights
+            norms = np.square(X) @ self._idf_sq
+        norms = np.sqrt(norms)
+        # Empty profiles stay null after normalization
+        norms[norms == 0] = 1
+        scores /= norms[:, None]
+        # MNB log-priors are not scaled with the features
+        scores += self._intercept
+        return scores
+
+    def predict(self, X):
+        scores = self.decision_function(X)
+        if self.kind == 'onesvm':
+            return np.where(scores[:, 0] >= 0, 1, -1).astype(np.int32)
+        if scores.shape[1] == 1:
+            return self.classes[(scores[:, 0] > 0).astype(np.int64)]
+        return self.classes[np.argmax(scores, axis = 1)]
+
+    def predict_proba(self, X):
+        scores = self.decision_function(X)
+        if self.kind == 'mnb':
+            scores -= scores.max(axis = 1, keepdims = True)
+            proba = np.exp(scores)
+            return proba / proba.sum(axis = 1, keepdims = True)
+        if self.loss == 'modified_huber':
+            proba = (np.clip(scores, -1, 1) + 1) / 2
+        elif self.loss == 'log_loss':
+            proba = 1 / (1 + np.exp(-scores))
+        else:
+            raise ValueError(f'No probabilities for the {self.kind} model with {self.loss} loss')
+        # Binary models only hold the hyperplane of their positive class
+        if proba.shape[1] == 1:
+            return np.hstack((1 - proba, proba))
+        # One-vs-rest probabilities normalized as in sklearn
+        proba_sum = proba.sum(axis = 1)
+        all_zero = proba_sum == 0
+        proba[all_zero] = 1
+        proba_sum[all_zero] = proba.shape[1]
+        return proba / proba_sum[:, None]
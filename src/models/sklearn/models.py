@@ -57,7 +57,8 @@ class SklearnModels(ModelsUtils, ABC):
         training_epochs,
         taxa,
         kmers_list,
-        csv
+        csv,
+        catalog = None
     ):
         super().__init__(
             classifier,
@@ -66,7 +67,8 @@ class SklearnModels(ModelsUtils, ABC):
             training_epochs,
             taxa,
             kmers_list,
-            csv
+            csv,
+            catalog
         )
         
     @abstractmethod
@@ -91,5 +93,10 @@ class SklearnModels(ModelsUtils, ABC):
 
     @abstractmethod
     def _get_threshold_pred(self):
+        """
+        """
+
+    @abstractmethod
+    def batch_predictor(self, threshold = 0.8, top_k = 0):
         """
         """
\ No newline at end of file
@@ -12,6 +12,7 @@ from models.preprocessors.tfidf_transformer import TensorTfIdfTransformer
 # Training
 import ray.cloudpickle as cpickle
 from ray.air.config import ScalingConfig
+from sklearn.base import clone
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.linear_model import SGDClassifier
 from sklearn.calibration import CalibratedClassifierCV
@@ -24,6 +25,9 @@ from ray.air.config import RunConfig
 # Predicting
 from ray.train.batch_predictor import BatchPredictor
 from models.sklearn.tensor_predictor import SklearnTensorPredictor
+from models.sklearn.cached_predictor import SklearnCachedPredictor
+from models.sklearn.linear_engine import LinearEngine, export_linear_model
+from models.decision import threshold_decision
 from models.sklearn.probability_predictor import SklearnTensorProbaPredictor
 
 # Parent classes
@@ -80,7 +84,8 @@ class SklearnMulticlassModels(SklearnModels, MulticlassUtils):
         training_epochs,
         taxa,
         kmers_list,
-        csv
+        csv,
+        catalog = None
     ):
         super().__init__(
             classifier,
@@ -89,7 +94,8 @@ class SklearnMulticlassModels(SklearnModels, MulticlassUtils):
             training_epochs,
             taxa,
             kmers_list,
-            csv
+            csv,
+            catalog
         )
         self._training_collection = {}
         self._encoder = {}
@@ -100,10 +106,10 @@ class SklearnMulticlassModels(SklearnModels, MulticlassUtils):
     # Data preprocessing
     #########################################################################################################
 
-    def preprocess(self, ds, scaling = False, scaler_file = None):
+    def preprocess(self, ds, scaling = False, scaler_file = None, scaler = None):
         print('preprocess')
         # Labels encoding
-        self._encoder = ModelLabelEncoder(self.taxa)
+        self._encoder = ModelLabelEncoder(self.taxa, self._catalog)
         self._encoder.fit(ds)
 
         # Labels mapping
@@ -118,21 +124,25 @@ class SklearnMulticlassModels(SklearnModels, MulticlassUtils):
         # Class weights
         self._weights = self._compute_weights()
         
-        # Features scaling
-        self._scaler = TensorTfIdfTransformer(features = self.kmers,file = scaler_file)
-        self._scaler.fit(ds)
+        # Features scaling, reuse the scaler shared between taxas if given
+        if scaler is not None:
+            self._scaler = scaler
+        else:
+            self._scaler = TensorTfIdfTransformer(features = self.kmers,file = scaler_file)
+            self._scaler.fit(ds)
 
         
     # Models training
     #########################################################################################################
 
-    def fit(self, datasets):
+    def fit(self, datasets, scaled = False):
         print('fit')
         # for name, ds in datasets.items():
             # ds = ds.drop_columns(['id'])
         train_ds = datasets['train']
         train_ds = self._encoder.transform(train_ds)
-        train_ds = self._scaler.transform(train_ds)
+        if not scaled:
+            train_ds = self._scaler.transform(train_ds)
         # datasets[name] = ds
 
         # One sub-model per artificial cluster of samples
@@ -223,59 +233,150 @@ class SklearnMulticlassModels(SklearnModels, MulticlassUtils):
             # training_result = train_ds.map_groups(lambda ds: build_fit_mnb(ds, val_ds), batch_format = 'numpy')
 
         training_result = training_result.to_pandas().to_dict('records')
-        for record in training_result:
-            self._model_ckpt[record['cluster']] = record['file']
+        models = _load_models([record['file'] for record in training_result])
+
+        # Clusters models merged one at a time into a single linear model
+        if self.classifier == 'sgd':
+            model = _merge_sgd(models, len(self._labels_map) - 1, self._nb_kmers)
+        elif self.classifier == 'mnb':
+            model = _merge_mnb(models, len(self._labels_map) - 1, self._nb_kmers)
+
+        model_file = os.path.join(model_dir, 'merged.pkl')
+        with open(model_file, 'wb') as file:
+            cpickle.dump(model, file)
+        self._model_ckpt = {'merged' : model_file}
+
+        # Plain arrays for the NumPy inference engine
+        self._engine_file = export_linear_model(
+            model,
+            self._scaler.stats_['idf_diag'].diagonal(),
+            os.path.join(model_dir, 'merged.npz')
+        )
         
     # Models predicting
     #########################################################################################################
 
     def predict(self, ds):
         print('predict')
-        probabilities = self._predict_proba(ds)
-        predictions = np.argmax(probabilities, axis = 1)
-        predictions = self._label_decode(predictions)
-        return predictions
+        return self._predict_labels(ds, 0)
     
     def predict_proba(self, ds, threshold = 0.8):
         print('predict_proba')
-        probabilities = self._predict_proba(ds)
-        predictions = self._get_threshold_pred(probabilities, threshold)
-        return self._label_decode(predictions)
-
-    def _predict_proba(self, ds):
-        if ds.count() > 0:
-            ds = self._scaler.transform(ds)
-
-            def predict_func(data):
-                X = _unwrap_ndarray_object_type_if_needed(data[TENSOR_COLUMN_NAME])
-                pred = np.zeros((len(X), len(self._labels_map)-1))
-                for cluster, model_file in self._model_ckpt.items():
-                    with open(model_file, 'rb') as file:
-                        model = cpickle.load(file)
-                    proba = model.predict_proba(X)
-                    for i, cls in enumerate(model.classes_):
-                        pred[:, cls] += proba[:, i]
-                pred = pred / len(self._model_ckpt)
-                return {'predictions' : pred}
-
-            probabilities = ds.map_batches(predict_func, batch_format = 'numpy')
-            probabilities = _unwrap_ndarray_object_type_if_needed(probabilities.to_pandas()['predictions'])
-            
-            return probabilities
-        else:
-            raise ValueError('Empty dataset, cannot execute predictions!')
+        return self._predict_labels(ds, threshold)
+
+    def batch_predictor(self, threshold = 0.8, top_k = 0):
+        engine_file = getattr(self, '_engine_file', None)
+        if engine_file is not None and os.path.isfile(engine_file):
+            return self._engine_predictor(engine_file, threshold, top_k)
+
+        # Models trained before the export to plain arrays
+        predictor = SklearnCachedPredictor(
+            list(self._model_ckpt.values()),
+            len(self._labels_map) - 1,
+            self._nb_kmers,
+            getattr(self, 'predict_warmup', True)
+        )
+
+        def predict_batch(batch):
+            probabilities = predictor({TENSOR_COLUMN_NAME : self._scale_batch(batch)})['predictions']
+            return self._decide_batch(self._get_threshold_pred(probabilities, threshold), probabilities, top_k)
+
+        return predict_batch
+
+    def _engine_predictor(self, engine_file, threshold, top_k):
+        """
+        Predictions on the raw K-mers counts with the TF-IDF scaling fused in the NumPy inference engine
+        """
+        engine = LinearEngine(engine_file)
+        nb_classes = len(self._labels_map) - 1
+
+        def predict_batch(batch):
+            X = _unwrap_ndarray_object_type_if_needed(batch[TENSOR_COLUMN_NAME])
+            probabilities = np.zeros((len(X), nb_classes))
+            probabilities[:, engine.classes] = engine.predict_proba(X)
+            return self._decide_batch(self._get_threshold_pred(probabilities, threshold), probabilities, top_k)
+
+        return predict_batch
 
     def _get_threshold_pred(self, predict, threshold):
-        print('_get_threshold_pred')
-        proba_predict = {
-            'best_proba' : [],
-            'predicted_label' : []
-        }
-        for line in predict:
-            proba_predict['best_proba'].append(line[np.argmax(line)]),
-            proba_predict['predicted_label'].append(np.argmax(line))
-
-        proba_predict = pd.DataFrame(proba_predict)
-        proba_predict.loc[proba_predict['best_proba'] < threshold, 'predicted_label'] = -1
-
-        return proba_predict['predicted_label']
+        return threshold_decision(predict, threshold)
+
+def _load_models(files):
+    """
+    Load the clusters models one at a time, each one can be released once merged
+    """
+    for model_file in files:
+        with open(model_file, 'rb') as file:
+            yield cpickle.load(file)
+
+def _merge_sgd(models, nb_classes, nb_features):
+    """
+    Merge one-vs-rest SGD models trained on clusters into one model
+    The coefficients and intercept of each class are averaged over the models that were trained with this class
+    Running sums are indexed by the encoded labels so only one cluster model is held at a time
+    """
+    coef = np.zeros((nb_classes, nb_features), dtype = np.float64)
+    intercept = np.zeros(nb_classes, dtype = np.float64)
+    nb_models = np.zeros(nb_classes, dtype = np.float64)
+    merged = None
+    for model in models:
+        if merged is None:
+            merged = clone(model)
+        # Binary models only hold the hyperplane of their positive class
+        if len(model.classes_) == 2:
+            model_coef = np.vstack((-model.coef_[0], model.coef_[0]))
+            model_intercept = np.array([-model.intercept_[0], model.intercept_[0]])
+        else:
+            model_coef = model.coef_
+            model_intercept = model.intercept_
+        rows = np.asarray(model.classes_, dtype = np.int64)
+        coef[rows] += model_coef
+        intercept[rows] += model_intercept
+        nb_models[rows] += 1
+        del model, model_coef, model_intercept
+
+    # Only the classes seen by at least one cluster model are kept
+    classes = np.flatnonzero(nb_models)
+    coef = coef[classes] / nb_models[classes, None]
+    intercept = intercept[classes] / nb_models[classes]
+
+    merged.classes_ = classes
+    merged.n_features_in_ = nb_features
+    if len(classes) == 2:
+        merged.coef_ = (coef[1:] - coef[:1]) / 2
+        merged.intercept_ = (intercept[1:] - intercept[:1]) / 2
+    else:
+        merged.coef_ = coef
+        merged.intercept_ = intercept
+
+    return merged
+
+def _merge_mnb(models, nb_classes, nb_features):
+    """
+    Merge Multinomial Naive Bayes models trained on clusters into one model
+    Features and classes counts are pooled which is the same as fitting on all clusters at once
+    Running sums are indexed by the encoded labels so only one cluster model is held at a time
+    """
+    feature_count = np.zeros((nb_classes, nb_features), dtype = np.float64)
+    class_count = np.zeros(nb_classes, dtype = np.float64)
+    seen = np.zeros(nb_classes, dtype = bool)
+    merged = None
+    for model in models:
+        if merged is None:
+            merged = clone(model)
+        rows = np.asarray(model.classes_, dtype = np.int64)
+        feature_count[rows] += model.feature_count_
+        class_count[rows] += model.class_count_
+        seen[rows] = True
+        del model
+
+    # Only the classes seen by at least one cluster model are kept
+    classes = np.flatnonzero(seen)
+    merged.classes_ = classes
+    merged.n_features_in_ = nb_features
+    merged.feature_count_ = feature_count[classes]
+    merged.class_count_ = class_count[classes]
+    merged._update_feature_log_prob(merged._check_alpha())
+    merged._update_class_log_prior()
+
+    return merged
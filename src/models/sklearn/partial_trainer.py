@@ -1,6 +1,7 @@
 import os
 import ray
 from time import time
+from copy import deepcopy
 from traceback import format_exc
 from collections import defaultdict
 from warnings import warn, simplefilter
@@ -13,18 +14,14 @@ from sklearn.metrics import check_scoring
 # we are using a private API here, but it's consistent across versions
 from sklearn.model_selection._validation import _check_multimetric_scoring, _score
 
-from ray import tune
-import ray.cloudpickle as cpickle
-from ray.air._internal.checkpointing import (
-    save_preprocessor_to_dir,
-)
+from ray.air import session
 from ray.util.joblib import register_ray
 from ray.air.config import RunConfig, ScalingConfig
 from sklearn.calibration import CalibratedClassifierCV
-from ray.train.constants import MODEL_KEY, TRAIN_DATASET_KEY
+from ray.train.constants import TRAIN_DATASET_KEY
 from ray.train.sklearn._sklearn_utils import _set_cpu_params
 
-from ray.train.sklearn import SklearnTrainer
+from ray.train.sklearn import SklearnTrainer, SklearnCheckpoint
 
 TENSOR_COLUMN_NAME = '__value__'
 LABELS_COLUMN_NAME = 'labels'
@@ -34,6 +31,10 @@ simplefilter(action='ignore', category=FutureWarning)
 class SklearnPartialTrainer(SklearnTrainer):
     """
     Class adapted from Ray's SklearnTrainer class to allow for partial_fit and usage of tensors as inputs.
+    Each dataset is streamed once per epoch and features / labels are taken from the same batch.
+    Batches are prefetched and shuffled locally in a buffer of `shuffle_buffer_size` rows if given.
+    After each epoch the model is scored on a uniform sample of about `validation_size` rows of the validation dataset.
+    Training stops when the score did not improve by more than `tolerance` for `patience` epochs and the best model is kept.
     """
 
     def __init__(
@@ -54,6 +55,11 @@ class SklearnPartialTrainer(SklearnTrainer):
         run_config = None,
         preprocessor = None,
         batch_size = 32,
+        prefetch_batches = 2,
+        shuffle_buffer_size = None,
+        patience = 3,
+        tolerance = 1e-4,
+        validation_size = 10000,
         **fit_params
     ):
         super().__init__(
@@ -75,6 +81,11 @@ class SklearnPartialTrainer(SklearnTrainer):
         self._batch_size = batch_size
         self._features_list = features_list
         self._training_epochs = training_epochs
+        self._prefetch_batches = prefetch_batches
+        self._shuffle_buffer_size = shuffle_buffer_size
+        self._patience = patience
+        self._tolerance = tolerance
+        self._validation_size = validation_size
 
     def _validate_attributes(self):
         # Run config
@@ -164,15 +175,58 @@ class SklearnPartialTrainer(SklearnTrainer):
     def _get_datasets(self):
         out_datasets = {}
         for key, ray_dataset in self.datasets.items():
-            ray_dataset = ray.get(ray_dataset)
-            cols = ray_dataset.schema().names
-            cols.remove(self.label_column)
-            out_datasets[key] = (
-                ray_dataset.drop_columns([self.label_column]),
-                ray_dataset.drop_columns(cols)
-            )
+            if isinstance(ray_dataset, ray.ObjectRef):
+                ray_dataset = ray.get(ray_dataset)
+            out_datasets[key] = ray_dataset
         return out_datasets
 
+    def _iter_X_y(self, ds, shuffle = False):
+        """
+        Iterate over features and labels of the same batches of a dataset
+        """
+        for batch in ds.iter_batches(
+            batch_size = self._batch_size,
+            batch_format = 'numpy',
+            prefetch_batches = self._prefetch_batches,
+            local_shuffle_buffer_size = self._shuffle_buffer_size if shuffle else None,
+        ):
+            yield batch[TENSOR_COLUMN_NAME], np.ravel(batch[self.label_column])
+
+    def _get_validation_sample(self, ds):
+        """
+        Bounded sample of the validation dataset kept in memory for per-epoch scoring
+        Rows are sampled uniformly because the datasets are ordered by files and classes
+        """
+        if ds is None or self._validation_size is None or self._validation_size <= 0:
+            return None, None
+        nb_rows = ds.count()
+        if nb_rows > self._validation_size:
+            ds = ds.random_sample(self._validation_size / nb_rows, seed = 42)
+        X_val = []
+        y_val = []
+        for batch_X, batch_y in self._iter_X_y(ds):
+            X_val.append(batch_X)
+            y_val.append(batch_y)
+        if len(y_val) == 0:
+            return None, None
+        return np.concatenate(X_val), np.concatenate(y_val)
+
+    def _score_epoch(self, X_val, y_val, scorer):
+        """
+        Score of the estimator on the validation sample, nan if it could not be computed
+        """
+        if X_val is None:
+            return np.nan
+        try:
+            return float(_score(self.estimator, X_val, y_val, scorer))
+        except Exception:
+            warn(
+                f"Scoring on the validation sample failed, early stopping is disabled. Details: \n"
+                f"{format_exc()}",
+                UserWarning,
+            )
+            return np.nan
+
     def training_loop(self):
         register_ray()
 
@@ -181,10 +235,9 @@ class SklearnPartialTrainer(SklearnTrainer):
 
         datasets = self._get_datasets()
 
-        X_train, y_train = datasets.pop(TRAIN_DATASET_KEY)
-        X_train = X_train.repeat(self._training_epochs)
-        y_train = y_train.repeat(self._training_epochs)
-        X_calib, y_calib = datasets.pop('validation')
+        train_ds = datasets.pop(TRAIN_DATASET_KEY)
+        calib_ds = datasets.pop('validation', None)
+        X_val, y_val = self._get_validation_sample(calib_ds)
 
         scaling_config = self._validate_scaling_config(self.scaling_config)
 
@@ -201,41 +254,55 @@ class SklearnPartialTrainer(SklearnTrainer):
 
         _set_cpu_params(self.estimator, num_cpus)
 
-        for epoch_X, epoch_y in zip(X_train.iter_epochs(), y_train.iter_epochs()):
-            with parallel_backend("ray", n_jobs=num_cpus):
-                start_time = time()
-                for batch_X, batch_y in zip(
-                    epoch_X.iter_batches(
-                        batch_size = self._batch_size,
-                        # batch_size = 1,
-                        batch_format = 'numpy'
-                    ),
-                    epoch_y.iter_batches(
-                        batch_size = self._batch_size,
-                        # batch_size = 1,
-                        batch_format = 'numpy'
-                    )
-                ):  
-                    if isinstance(batch_X, dict):
-                        batch_X = batch_X[TENSOR_COLUMN_NAME]
-                    
-                    """    
-                    try:
-                        batch_X = pd.DataFrame(batch_X, columns = self._features_list)
-                    except ValueError:
-                        for i in range(len(batch_X)):
-                            if len(batch_X[i]) != len(self._features_list):
-                                warn("The features list length for some reads are not the same as for other reads.\
-                                    Removing the last {} additionnal values, this may influence training.\
-                                        If this persists over multiple samples, please rerun the K-mers extraction".format(len(batch_X[i]) - len(self._features_list)))
-                                batch_X[i] = batch_X[i][:len(self._features_list)]
-                    """
-                    batch_y = np.ravel(batch_y[self.label_column])
+        scorer = check_scoring(self.estimator, self.scoring if isinstance(self.scoring, str) else None)
+        best_estimator = None
+        best_score = -np.inf
+        nb_no_improve = 0
+
+        start_time = time()
+        with parallel_backend("ray", n_jobs=num_cpus):
+            # Epochs are streamed one after the other from the same dataset
+            for epoch in range(self._training_epochs):
+                epoch_start = time()
+                nb_rows = 0
+                for batch_X, batch_y in self._iter_X_y(train_ds, shuffle = True):
                     try:
                         self.estimator.partial_fit(batch_X, batch_y, classes = self._labels, **self.fit_params)
                     except TypeError:
                         self.estimator.partial_fit(batch_X, batch_y, **self.fit_params)
-                fit_time = time() - start_time
+                    nb_rows += len(batch_y)
+                epoch_time = time() - epoch_start
+
+                # Convergence monitoring on the validation sample
+                val_score = self._score_epoch(X_val, y_val, scorer)
+                if np.isnan(val_score):
+                    best_estimator = None
+                elif val_score > best_score + self._tolerance:
+                    best_score = val_score
+                    best_estimator = deepcopy(self.estimator)
+                    nb_no_improve = 0
+                else:
+                    nb_no_improve += 1
+
+                session.report({
+                    'epoch' : epoch + 1,
+                    'epoch_time' : epoch_time,
+                    'rows_per_second' : nb_rows / epoch_time if epoch_time > 0 else np.nan,
+                    'val_score' : val_score,
+                    'best_val_score' : best_score,
+                    'epochs_without_improvement' : nb_no_improve,
+                })
+
+                if np.isnan(val_score):
+                    X_val = None
+                elif self._patience is not None and nb_no_improve >= self._patience:
+                    print(f'Early stopping after {epoch + 1} epochs, best validation score : {best_score}')
+                    break
+        fit_time = time() - start_time
+
+        # Keep the model with the best validation score
+        if best_estimator is not None:
+            self.estimator = best_estimator
 
         # Calibrated classifier was meant to give the predict_proba method but all used models implement it and learning should be faster without it
         # if len(self._labels) > 2:
@@ -261,13 +328,6 @@ class SklearnPartialTrainer(SklearnTrainer):
         #             y_calib,
         #         )
         
-        with tune.checkpoint_dir(step=1) as checkpoint_dir:
-            with open(os.path.join(checkpoint_dir, MODEL_KEY), "wb") as f:
-                cpickle.dump(self.estimator, f)
-
-            if self.preprocessor:
-                save_preprocessor_to_dir(self.preprocessor, checkpoint_dir)
-
         if self.label_column:
             validation_set_scores = self._score_on_validation_sets(
                 self.estimator, datasets
@@ -284,7 +344,11 @@ class SklearnPartialTrainer(SklearnTrainer):
             **cv_scores,
             "fit_time": fit_time,
         }
-        tune.report(**results)
+        # Final model reported through the same API as the epochs
+        session.report(
+            results,
+            checkpoint = SklearnCheckpoint.from_estimator(self.estimator, preprocessor = self.preprocessor)
+        )
 
     def _score_on_validation_sets(
         self,
@@ -302,46 +366,21 @@ class SklearnPartialTrainer(SklearnTrainer):
         else:
             scorers = _check_multimetric_scoring(estimator, self.scoring)
 
-        for key, X_y_tuple in datasets.items():
-            X_test, y_test = X_y_tuple
-
+        for key, ds in datasets.items():
             test_scores = []
+            test_sizes = []
 
             start_time = time()
-            for batch, labels in zip(X_test.iter_batches(
-                    # batch_size = self._batch_size,
-                    batch_size = 1,
-                    batch_format = 'numpy'
-                ), y_test.iter_batches(
-                    # batch_size = self._batch_size,
-                    batch_size = 1,
-                    batch_format = 'numpy'
-                )
-            ):
-                if isinstance(batch, dict):
-                    batch = batch[TENSOR_COLUMN_NAME]
-
-                """
-                try:
-                    batch = pd.DataFrame(batch, columns = self._features_list)
-                except ValueError:
-                    for i in range(len(batch)):
-                        if len(batch[i]) != len(self._features_list):
-                            warn("The features list length for some reads are not the same as for other reads.\
-                                Removing the last {} additionnal values, this may influence training.\
-                                    If this persists over multiple samples, please rerun the K-mers extraction".format(len(batch[i]) - len(self._features_list)))
-                            batch[i] = batch[i][:len(self._features_list)]
-                """
-                
-                labels = np.ravel(labels[self.label_column])
-
+            for batch, labels in self._iter_X_y(ds):
                 try:
                     test_scores.append(_score(estimator, batch, labels, scorers))
+                    test_sizes.append(len(labels))
                 except Exception:
                     if isinstance(scorers, dict):
                         test_scores = {k: np.nan for k in scorers}
                     else:
                         test_scores.append(np.nan)
+                        test_sizes.append(len(labels))
                     warn(
                         f"Scoring on validation set {key} failed. The score(s) for "
                         f"this set will be set to nan. Details: \n"
@@ -350,5 +389,6 @@ class SklearnPartialTrainer(SklearnTrainer):
                     )
             score_time = time() - start_time
             results[key]["score_time"] = score_time
-            results[key]["test_score"] = np.mean(test_scores)
+            # Mean of the batches scores weighted by their number of rows
+            results[key]["test_score"] = np.average(test_scores, weights = test_sizes) if len(test_sizes) > 0 else np.nan
         return results
@@ -0,0 +1,131 @@
+import os
+import warnings
+import numpy as np
+
+# Parent class
+from models.models_utils import ModelsUtils
+
+__author__ = 'Nicolas de Montigny'
+
+__all__ = ['TwoTierModels']
+
+# Ignore warnings to have a more comprehensible output on stdout
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+warnings.filterwarnings('ignore')
+
+class TwoTierModels(ModelsUtils):
+    """
+    Class used to train and predict a confidence-gated cascade of a linear Scikit-learn model and a Keras neural network
+    The linear model scores all sequences, only the sequences for which its best probability is in the uncertainty band are given to the neural network
+
+    ----------
+    Attributes
+    ----------
+
+    linear : SklearnMulticlassModels
+        Fast linear model (sgd / mnb) scoring all sequences
+
+    neural : KerasTFMulticlassModels
+        Neural network classifying the uncertain sequences only
+
+    band : tuple of floats
+        Lower and upper bounds of the linear model best probability for which sequences are forwarded to the neural network
+        Sequences under the lower bound are classified as unknown, sequences over the upper bound keep the linear model classification
+
+    ----------
+    Methods
+    ----------
+
+    preprocess : preprocess the data of both models using the same scaler
+
+    fit : train both models on the given datasets
+
+    predict : predict the classes of a dataset through both tiers
+        ds : ray.data.Dataset
+            Dataset containing K-mers profiles of sequences to be classified
+    """
+    def __init__(
+        self,
+        linear,
+        neural,
+        band = (0.3, 0.9)
+    ):
+        super().__init__(
+            f'{linear.classifier}_{neural.classifier}',
+            neural._workdir,
+            neural.batch_size,
+            neural._training_epochs,
+            neural.taxa,
+            neural.kmers,
+            neural._csv
+        )
+        self.linear = linear
+        self.neural = neural
+        self.band = band
+
+    # Data preprocessing
+    #########################################################################################################
+
+    def preprocess(self, ds, scaling = False, scaler_file = None, scaler = None):
+        print('preprocess')
+        self.linear.preprocess(ds, scaling, scaler_file, scaler)
+        self.neural.preprocess(ds, scaling, scaler_file, scaler)
+        self._labels_map = self.neural._labels_map
+
+    # Models training
+    #########################################################################################################
+
+    def fit(self, datasets, scaled = False):
+        print('fit')
+        self.linear.fit(datasets.copy(), scaled = scaled)
+        self.neural.fit(datasets.copy(), scaled = scaled)
+
+    # Models predicting
+    #########################################################################################################
+
+    def predict(self, ds):
+        print('predict')
+        return self._predict_labels(ds, 0)
+
+    def predict_proba(self, ds, threshold = 0.8):
+        print('predict_proba')
+        return self._predict_labels(ds, threshold)
+
+    def batch_predictor(self, threshold = 0.8, top_k = 0):
+        # Best probability of the linear model is its first top probability
+        linear_predictor = self.linear.batch_predictor(threshold = 0, top_k = max(top_k, 1))
+        neural_predictor = self.neural.batch_predictor(threshold = threshold, top_k = top_k)
+        lower, upper = self.band
+
+        def predict_batch(batch):
+            decision = linear_predictor(batch)
+            best_proba = decision['top_probabilities'][:, 0]
+            uncertain = (best_proba >= lower) & (best_proba < upper)
+            rejected = best_proba < lower
+
+            labels = self._get_threshold_pred(best_proba, decision['label'], threshold)
+            labels[rejected] = 'Unknown'
+            top_labels = decision['top_labels'][:, :top_k].copy()
+            top_proba = decision['top_probabilities'][:, :top_k].copy()
+            if uncertain.any():
+                neural_decision = neural_predictor({col : values[uncertain] for col, values in batch.items()})
+                labels[uncertain] = neural_decision['label']
+                if top_k > 0:
+                    top_labels[uncertain] = neural_decision['top_labels']
+                    top_proba[uncertain] = neural_decision['top_probabilities']
+
+            decision = {'label' : labels}
+            if top_k > 0:
+                decision['top_labels'] = top_labels
+                decision['top_probabilities'] = top_proba
+            decision['tiers'] = {
+                'linear' : int(np.sum(~uncertain & ~rejected)),
+                'neural' : int(np.sum(uncertain)),
+                'rejected' : int(np.sum(rejected))
+            }
+            return decision
+
+        return predict_batch
+
+    def _get_threshold_pred(self, probabilities, labels, threshold):
+        return np.where(probabilities < threshold, 'Unknown', labels).astype(object)
@@ -32,8 +32,8 @@ class Outputs():
     host : string
         Name of the host if there is one
 
-    classified_data : dictionnary
-        The classes that were predicted by models
+    predictions : PredictionsSink
+        The predictions of the models partitioned by taxa
 
     ----------
     Methods
@@ -57,7 +57,7 @@ class Outputs():
         classifier,
         dataset,
         host,
-        classified_data
+        predictions
     ):
         # Third-party path
         self._krona_path = os.path.join(os.path.dirname(os.path.realpath(__file__)),'KronaTools','scripts','ImportText.pl')
@@ -65,9 +65,9 @@ class Outputs():
         # Variables
         self.host = host
         self.dataset = dataset
-        self.classified_data = classified_data
+        self.predictions = predictions
         self.taxas = database_kmers['taxas']
-        self.order = classified_data['sequence']
+        self.order = [taxa for taxa in self.taxas if taxa in predictions.taxas()]
         self.data_labels = pd.DataFrame(
             database_kmers['classes'],
             columns = database_kmers['taxas']
@@ -94,30 +94,27 @@ class Outputs():
 
 
     def _get_abundances(self):
-        df = self.classified_data['classification']
         for taxa in self.order:
+            counts = self.predictions.abundances(taxa)
             self._abundances[taxa] = {
-                'counts': df.value_counts(subset = [taxa]),
-                'total': df.value_counts(subset = [taxa]).sum()
-            }     
+                'counts': counts,
+                'total': int(counts.sum())
+            }
 
     def _nb_reads_classif(self):
+        # All reads go through the first model of the cascade, the most general taxa
+        self.reads_total = self.predictions.nb_reads(self.order[-1])
         if 'domain' in self.order:
-            self.reads_total = (len(self.classified_data['domain']['classified_ids']) + len(self.classified_data['domain']['unknown_ids']))
-            self.reads_bacteria = len(self.classified_data['domain']['classified_ids'])
+            counts = self._abundances['domain']['counts']
+            self.reads_bacteria = int(counts[counts.index.isin(['Bacteria','bacteria','bact'])].sum())
             if self.host is not None:
-                self.reads_host = len(self.classified_data['domain']['host_ids'])
-                self.reads_classified = self.reads_bacteria + self.reads_host
-            else:
-                self.reads_classified = self.reads_bacteria
-            self.reads_unknown = len(self.classified_data['domain']['unknown_ids'])
+                self.reads_host = int(counts[counts.index.isin([self.host])].sum())
+            self.reads_classified = self.reads_bacteria + self.reads_host
         else:
-            self.reads_bacteria = 0
-            for taxa in self.order:
-                self.reads_bacteria += self._abundances[taxa]['total']
+            # Reads are classified if known at the most general taxa
+            self.reads_bacteria = self._abundances[self.order[-1]]['total']
             self.reads_classified = self.reads_bacteria
-            self.reads_unknown = len(self.classified_data[self.order[-1]]['unknown_ids'])
-            self.reads_total = self.reads_classified + self.reads_unknown
+        self.reads_unknown = self.reads_total - self.reads_classified
 
     # Summary file of operations / counts & proportions of reads at each steps
     def _summary_table(self):
@@ -196,28 +193,21 @@ class Outputs():
         print(f'Classification report saved to {self._report_file}')
 
     def _produce_report(self):
-        lst_ids = []
-        db_labels = self.data_labels.copy(deep = True)
         taxas = self.order.copy()
         if 'domain' in taxas:
             taxas.remove('domain')
             taxas.append('domain')
-        taxas.append('id')
 
-        taxas = [taxa for taxa in reversed(taxas)]
-        
-        df = pd.DataFrame(columns = taxas)
-        for taxa in taxas:
-            tmp_df = self.classified_data[taxa]['classification']
-            lst_ids.extend(self.classified_data[taxa]['classified_ids'])
-            for classif in tmp_df[taxa]:
-                row = db_labels[db_labels[taxa] == classif]
-                df = pd.concat([df, row], axis = 0, ignore_index = True)
-            db_labels = db_labels.drop(taxa, axis = 1)
-            db_labels = db_labels.drop_duplicates()
+        # Classification of each read at each taxa, from the most general taxa
+        df = None
+        for taxa in reversed(taxas):
+            classif = self.predictions.classification(taxa).rename(columns = {'label' : taxa})
+            if df is None:
+                df = classif
+            else:
+                df = df.merge(classif, on = 'id', how = 'outer')
         
-        df['id'] = lst_ids
-        return df
+        return df[['id'] + [taxa for taxa in reversed(taxas)]]
 
     # Bacteria abundance tables / relative abundance vs total bacteria
     def mpa_style(self):
@@ -1,6 +1,7 @@
 import os
 import ray
 import json
+import hashlib
 import logging
 
 import numpy as np
@@ -35,6 +36,7 @@ __all__ = [
     'define_create_outdirs',
     'verify_seqfiles',
     'verify_kmers_list_length',
+    'kmers_fingerprint',
     'verify_load_data',
     'verify_concordance_klength',
     'verify_need_scaling',
@@ -122,7 +124,8 @@ def save_Xy_data(data, Xy_file):
 
 # Read parquet files and handle FileSystem build ImportError
 def read_parquet_files(profile):
-    files_lst = glob(os.path.join(profile, '*.parquet'))
+    # Sorted files for a deterministic order of the rows between runs
+    files_lst = sorted(glob(os.path.join(profile, '*.parquet')))
     try:
         ds = ray.data.read_parquet_bulk(files_lst, parallelism = len(files_lst))
     except ImportError:
@@ -189,13 +192,13 @@ def verify_0_1(val : float, parameter : str):
             'Please refer to the wiki for further details : https://github.com/bioinfoUQAM/Caribou/wiki')
 
 def verify_binary_classifier(clf : str):
-    if clf not in ['onesvm', 'linearsvm', 'attention', 'lstm', 'deeplstm']:
+    if clf not in ['onesvm', 'linearsvm', 'attention', 'lstm', 'deeplstm', 'embed_attention']:
         raise ValueError(
             'Invalid host extraction classifier !\n' +
             'Please refer to the wiki for further details : https://github.com/bioinfoUQAM/Caribou/wiki')
 
 def verify_multiclass_classifier(clf : str):
-    if clf not in ['sgd', 'mnb', 'lstm_attention', 'cnn', 'widecnn']:
+    if clf not in ['sgd', 'mnb', 'lstm_attention', 'cnn', 'widecnn', 'embed_lstm_attention']:
         raise ValueError(
             'Invalid multiclass bacterial classifier !\n' +
             'Please refer to the wiki for further details : https://github.com/bioinfoUQAM/Caribou/wiki')
@@ -250,6 +253,16 @@ def verify_kmers_list_length(klen: int, kmers_file: Path):
         verify_positive_int(klen, 'K-mers length')
         return klen, None
 
+def kmers_fingerprint(kmers : list):
+    """
+    Compute a fingerprint of the K-mers vocabulary (features names in order)
+    Used to make sure fitted preprocessors are only applied to profiles extracted with the same vocabulary
+    """
+    digest = hashlib.sha256()
+    for kmer in kmers:
+        digest.update(f'{kmer}\n'.encode())
+    return digest.hexdigest()
+
 def verify_load_data(data_file: Path):
     verify_file(data_file)
     data = load_Xy_data(data_file)
@@ -387,12 +400,13 @@ def merge_db_host(db_data, host_data):
     """
     Merge the two databases along the rows axis
     """
+    from data.labels_catalog import build_labels_catalog
     merged_db_host = {}
     merged_db_host_file = f"{db_data['profile']}_host_merged.npz"
 
     if os.path.isfile(merged_db_host_file):
         merged_db_host = load_Xy_data(merged_db_host_file)
-        merged_ds = read_parquet_files(merge_db_host['profile'])
+        merged_ds = read_parquet_files(merged_db_host['profile'])
     else:
         merged_db_host['profile'] = f"{db_data['profile']}_host_merged"
         db_ds = read_parquet_files(db_data['profile'])
@@ -413,6 +427,8 @@ def merge_db_host(db_data, host_data):
     merged_db_host['taxas'] = ['domain']  # Known taxas for classification
     merged_db_host['fasta'] = (db_data['fasta'], host_data['fasta'])  # Fasta file needed for reads simulation
     merged_db_host['csv'] = (db_data['csv'], host_data['csv'])  # csv file needed for classes weights
+    if 'labels_catalog' not in merged_db_host.keys():
+        merged_db_host['labels_catalog'] = build_labels_catalog(merged_db_host['csv'], f"{merged_db_host['profile']}_labels_catalog.npz")  # Labels codes, counts & weights
         
     save_Xy_data(merged_db_host, merged_db_host_file)
 
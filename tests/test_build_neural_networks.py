@@ -0,0 +1,41 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from tensorflow.keras import mixed_precision
+from models.kerasTF.build_neural_networks import build_embed_attention, build_embed_LSTM_attention
+
+NB_FEATURES = 64
+MAX_TOKENS = 16
+
+@pytest.fixture(params = ['mixed_float16', 'mixed_bfloat16', 'float32'])
+def policy(request):
+    previous = mixed_precision.global_policy()
+    mixed_precision.set_global_policy(request.param)
+    yield request.param
+    mixed_precision.set_global_policy(previous)
+
+def _profiles():
+    # Sparse profiles, the second one has more K-mers than max_tokens and the last one is empty
+    X = np.zeros((3, NB_FEATURES), dtype = np.float32)
+    X[0, [3, 10, 42]] = [0.5, 0.2, 0.3]
+    X[1, ::2] = 0.1
+    return X
+
+def test_embed_attention_masked_build(policy):
+    model = build_embed_attention(NB_FEATURES, max_tokens = MAX_TOKENS)
+    pred = model.predict_on_batch(_profiles())
+    assert pred.shape == (3, 1)
+    assert np.all(np.isfinite(pred))
+
+def test_embed_LSTM_attention_masked_build(policy):
+    model = build_embed_LSTM_attention(NB_FEATURES, 5, max_tokens = MAX_TOKENS)
+    pred = model.predict_on_batch(_profiles())
+    assert pred.shape == (3, 5)
+    assert np.allclose(pred.sum(axis = 1), 1, atol = 1e-3)